@@ -1,20 +1,44 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Header, Depends, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
 import os
 import logging
 from pathlib import Path
+from collections import OrderedDict, defaultdict
+from contextlib import aclosing, contextmanager
+from contextvars import ContextVar
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple, Literal
 import uuid
-from datetime import datetime
-import subprocess
+from datetime import datetime, timedelta
+import asyncio
 import tempfile
+import shutil
+import functools
 import sys
 import time
-import signal
 import json
+import signal
+import resource
+import heapq
+import hashlib
+import base64
+import hmac
+import io
+import tokenize
+import keyword
+import builtins
+import mmap
+import re
+import math
+import itertools
+import statistics
+import socket
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -24,6 +48,9 @@ mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
+# Maximum number of sandboxed child processes running at once
+EXECUTION_CONCURRENCY = int(os.environ.get('EXECUTION_CONCURRENCY', os.cpu_count() or 1))
+
 # Create the main app without a prefix
 app = FastAPI()
 
@@ -31,6 +58,32 @@ app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
 # Models
+# full: run every test case; first_failure: stop at the first case that does not pass;
+# first_timeout: stop at the first case that runs out of time
+JudgePolicy = Literal["full", "first_failure", "first_timeout"]
+
+ComplexityClass = Literal["O(1)", "O(log n)", "O(n)", "O(n log n)", "O(n^2)", "O(n^3)"]
+
+class ComplexitySpec(BaseModel):
+    # Python source defining generate(n, rng) -> the entry point's argument list for an input of size n
+    generator: str
+    sizes: List[int]  # increasing input sizes, at least three
+    expected: ComplexityClass
+    repeats: int = 1  # runs per size; the fastest counts
+    enforce: bool = False  # fail submissions whose fitted class is worse than expected
+
+class Parameter(BaseModel):
+    name: str
+    type: str = "any"  # int, float, str, bool, any, or list[...] of any of these
+
+class TestCase(BaseModel):
+    input: str = ""
+    expected_output: str = ""
+    # sha256 digests of blobs in the test data store, used instead of the inline strings for large tests
+    input_file: Optional[str] = None
+    expected_file: Optional[str] = None
+    hidden: bool = False  # left out of the public problem and redacted in results
+
 class Problem(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     title: str
@@ -38,31 +91,167 @@ class Problem(BaseModel):
     difficulty: str
     sample_input: str
     sample_output: str
-    test_cases: List[Dict[str, str]]
-    time_limit: int = 5  # seconds
+    test_cases: List[TestCase]
+    time_limit: float = 5  # CPU seconds per test case on the reference host, scaled by each judge host's speed
+    memory_limit: int = 256  # megabytes of address space
+    cpu_limit: Optional[int] = None  # CPU seconds for the whole run, defaults to time_limit per test case
+    process_limit: Optional[int] = None  # RLIMIT_NPROC, counted per user, so only set it when sandboxes run as their own user
+    # Function called with each test case's arguments. Its inputs then hold one JSON value per line and
+    # expected_output a JSON value; without it the legacy calling convention and output comparison apply
+    entry_point: Optional[str] = None
+    parameters: List[Parameter] = Field(default_factory=list)
+    return_type: str = "any"
+    comparator: Literal["exact", "float", "unordered"] = "exact"  # float: within float_tolerance; unordered: list in any order
+    float_tolerance: float = 1e-6
+    judge_policy: Optional[JudgePolicy] = None  # defaults to DEFAULT_JUDGE_POLICY
+    complexity: Optional[ComplexitySpec] = None  # requires entry_point
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class CodeSubmission(BaseModel):
     problem_id: str
     code: str
     language: str = "python"
+    user_id: Optional[str] = None  # Submissions without one are counted in problem stats but not ranked
+    judge_policy: Optional[JudgePolicy] = None  # overrides the problem's policy, e.g. "full" for a complete report
+
+class ComplexitySample(BaseModel):
+    n: int
+    cpu_time: Optional[float] = None  # fastest of the repeats; None when no run at this size finished
+
+class ComplexityReport(BaseModel):
+    expected: str
+    estimated: Optional[str] = None  # None when the runs could not be fitted, see note
+    within_bound: Optional[bool] = None
+    enforced: bool = False
+    samples: List[ComplexitySample] = []
+    note: Optional[str] = None
 
 class ExecutionResult(BaseModel):
     success: bool
     output: Optional[str] = None
     error: Optional[str] = None
     execution_time: float
+    cpu_time: float = 0.0
+    peak_memory_kb: int = 0
     test_results: List[Dict[str, Any]]
     total_passed: int
     total_tests: int
+    complexity: Optional[ComplexityReport] = None
+    host_factor: Optional[float] = None  # speed factor of the host that judged it; its limits were time_limit times this
 
 class SubmissionRecord(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     problem_id: str
     code: str
     language: str
+    user_id: Optional[str] = None
     result: ExecutionResult
     submitted_at: datetime = Field(default_factory=datetime.utcnow)
+    rejudged_at: Optional[datetime] = None  # set when an admin re-judge replaced the result
+
+class ResultSummary(BaseModel):
+    success: bool
+    output: Optional[str] = None
+    execution_time: float
+    cpu_time: float = 0.0
+    peak_memory_kb: int = 0
+    total_passed: int
+    total_tests: int
+
+class SubmissionSummary(BaseModel):
+    id: str
+    problem_id: str
+    language: str
+    user_id: Optional[str] = None
+    result: ResultSummary
+    submitted_at: datetime
+
+class LanguageStats(BaseModel):
+    submissions: int = 0
+    accepted: int = 0
+
+class ProblemStats(BaseModel):
+    problem_id: str
+    submissions: int = 0
+    accepted: int = 0
+    acceptance_rate: float = 0.0
+    languages: Dict[str, LanguageStats] = {}
+    runtime_percentiles: Dict[str, float] = {}  # CPU time of accepted submissions, in seconds
+
+class LeaderboardEntry(BaseModel):
+    rank: int
+    user_id: str
+    best_time: float
+    language: str
+    submission_id: str
+    attempts: int
+    accepted: int
+    best_at: datetime
+
+class UserProblemStats(BaseModel):
+    problem_id: str
+    attempts: int
+    accepted: int
+    best_time: Optional[float] = None
+    first_accepted_at: Optional[datetime] = None
+    last_submitted_at: datetime
+
+class SimilarSubmission(BaseModel):
+    submission_id: str
+    user_id: Optional[str] = None
+    language: str
+    similarity: float  # share of the smaller submission's fingerprints that the two have in common
+    shared_fingerprints: int
+    submitted_at: datetime
+
+class SimilarPair(BaseModel):
+    first: SimilarSubmission  # the earlier of the two
+    second: SimilarSubmission
+    similarity: float
+    shared_fingerprints: int
+
+class RunRequest(BaseModel):
+    problem_id: str
+    code: str
+    language: str = "python"
+    input: Optional[str] = None  # custom input in the problem's input format; the sample when left out
+
+class RunResult(BaseModel):
+    output: str
+    stdout: Optional[str] = None
+    error: Optional[str] = None
+    expected_output: Optional[str] = None
+    passed: Optional[bool] = None  # only judged for the sample, custom input has nothing to compare against
+    execution_time: float
+    cpu_time: float = 0.0
+    memory_kb: int = 0
+    host_factor: Optional[float] = None
+
+class JobStatus(BaseModel):
+    id: str
+    status: str  # queued, running, completed or failed
+    problem_id: str
+    result: Optional[ExecutionResult] = None
+    error: Optional[str] = None
+    submission_id: Optional[str] = None
+    attempts: int = 0
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class RejudgeStatus(BaseModel):
+    id: str
+    problem_id: str
+    status: str  # running, completed, failed or cancelled
+    total: int  # submissions to the problem when the re-judge started
+    processed: int = 0
+    judged: int = 0  # distinct (normalized) codes actually run; duplicates reuse their result
+    changed: int = 0  # submissions whose verdict flipped
+    errors: int = 0
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
 
 # Sample problems
 SAMPLE_PROBLEMS = [
@@ -88,7 +277,11 @@ Write a function called `two_sum(nums, target)` that returns the indices.""",
             {"input": "[3, 3]\n6", "expected_output": "[0, 1]"},
             {"input": "[1, 2, 3, 4, 5]\n8", "expected_output": "[2, 4]"}
         ],
-        "time_limit": 3
+        "time_limit": 3,
+        "entry_point": "two_sum",
+        "parameters": [{"name": "nums", "type": "list[int]"}, {"name": "target", "type": "int"}],
+        "return_type": "list[int]",
+        "comparator": "unordered"
     },
     {
         "id": "palindrome-check",
@@ -99,20 +292,23 @@ For this problem, consider only alphanumeric characters and ignore cases.
 
 Example:
 Input: "A man a plan a canal Panama"
-Output: True
+Output: true
 
 Write a function called `is_palindrome(s)` that returns True if the string is a palindrome, False otherwise.""",
         "difficulty": "Easy",
-        "sample_input": "A man a plan a canal Panama",
-        "sample_output": "True",
+        "sample_input": "\"A man a plan a canal Panama\"",
+        "sample_output": "true",
         "test_cases": [
-            {"input": "A man a plan a canal Panama", "expected_output": "True"},
-            {"input": "race a car", "expected_output": "False"},
-            {"input": "hello", "expected_output": "False"},
-            {"input": "Madam", "expected_output": "True"},
-            {"input": "12321", "expected_output": "True"}
+            {"input": "\"A man a plan a canal Panama\"", "expected_output": "true"},
+            {"input": "\"race a car\"", "expected_output": "false"},
+            {"input": "\"hello\"", "expected_output": "false"},
+            {"input": "\"Madam\"", "expected_output": "true"},
+            {"input": "\"12321\"", "expected_output": "true"}
         ],
-        "time_limit": 2
+        "time_limit": 2,
+        "entry_point": "is_palindrome",
+        "parameters": [{"name": "s", "type": "str"}],
+        "return_type": "bool"
     },
     {
         "id": "fibonacci",
@@ -140,226 +336,3884 @@ Write a function called `fibonacci(n)` that returns the nth Fibonacci number."""
             {"input": "7", "expected_output": "13"},
             {"input": "10", "expected_output": "55"}
         ],
-        "time_limit": 3
+        "time_limit": 3,
+        "entry_point": "fibonacci",
+        "parameters": [{"name": "n", "type": "int"}],
+        "return_type": "int"
     }
 ]
 
-def timeout_handler(signum, frame):
-    raise TimeoutError("Code execution timed out")
+# Metrics: a small Prometheus-compatible registry, rendered in the text exposition format on /metrics
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = (f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for name, value in labels)
+    return "{" + ",".join(escaped) + "}"
+
+class Counter:
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[Tuple[Tuple[str, str], ...], float] = defaultdict(float)
+    
+    def inc(self, amount: float = 1, **labels):
+        self._values[tuple(sorted(labels.items()))] += amount
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_format_labels(labels)} {value}" for labels, value in self._values.items()]
+        return lines
+
+class Gauge:
+    """Gauge whose value is read from a callback at scrape time"""
+    metric_type = "gauge"
+    
+    def __init__(self, name: str, documentation: str, read):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+    
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}", f"{self.name} {self.read()}"]
+
+class CounterReader(Gauge):
+    """Counter whose value is read from a callback at scrape time, for totals another component keeps"""
+    metric_type = "counter"
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, buckets: Tuple[float, ...] = STAGE_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self._series: Dict[Tuple[Tuple[str, str], ...], List[float]] = {}
+    
+    def observe(self, value: float, **labels):
+        # Per series: one cumulative count per bucket, then +Inf count and sum
+        series = self._series.setdefault(tuple(sorted(labels.items())), [0.0] * (len(self.buckets) + 2))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += 1
+        series[-1] += value
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, series in self._series.items():
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', str(bound)),))} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {series[-2]}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {series[-1]}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+    
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+    
+    def render(self) -> str:
+        return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+
+metrics = MetricsRegistry()
+judge_stage_seconds = metrics.register(Histogram(
+    "judge_stage_seconds", "Time spent per judging stage (queue_wait, job_wait, compile, spawn, run, compare, persist)"
+))
+judge_submissions_total = metrics.register(Counter("judge_submissions_total", "Judged submissions by verdict"))
+judge_timeouts_total = metrics.register(Counter("judge_timeouts_total", "Test cases that hit the time limit"))
+judge_runtime_errors_total = metrics.register(Counter("judge_runtime_errors_total", "Test cases that ended in an error other than a timeout"))
+judge_runs_total = metrics.register(Counter("judge_runs_total", "Sample and custom-input runs, which are not saved as submissions"))
+judge_skipped_total = metrics.register(Counter("judge_skipped_total", "Test cases not run because an early-exit policy stopped judging"))
+judge_rejudged_total = metrics.register(Counter("judge_rejudged_total", "Stored submissions re-judged by admin request, by whether the verdict changed"))
+
+# Labels of the submission being judged, read by the stages that run below the API layer
+judge_labels: ContextVar[Dict[str, str]] = ContextVar("judge_labels", default={"problem": "", "language": ""})
 
-def execute_python_code(code: str, input_data: str, time_limit: int = 5) -> Dict[str, Any]:
-    """Execute Python code safely with timeout and input"""
+def observe_stage(stage: str, seconds: float):
+    judge_stage_seconds.observe(seconds, stage=stage, **judge_labels.get())
+
+@contextmanager
+def stage_timer(stage: str):
+    start = time.perf_counter()
     try:
-        # Create a temporary file for the code
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as tmp_file:
-            # Prepare the code with input handling
-            full_code = f"""
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+# Python source of the batch harness: loads the user's code once, then runs every
+# test case in the same interpreter and reports one JSON line per case
+PYTHON_HARNESS = r'''
 import sys
+import os
+import io
 import json
+import time
+import signal
+import traceback
+import contextlib
+import resource
+import select
+import mmap
 
-# User's code
-{code}
+# Keep the real stdout as the result channel; anything the user writes to fd 1 goes to stderr
+_channel = os.fdopen(os.dup(1), "w")
+os.dup2(2, 1)
 
-# Read input and process
-try:
-    input_lines = '''{input_data}'''.strip().split('\\n')
+# Bound before any submitted code runs, which could otherwise patch the json module
+_dumps = json.dumps
+_loads = json.loads
+
+class CaseTimeout(BaseException):
+    pass
+
+# A case has a CPU timer and a wall-clock backstop; only the first to fire while it runs counts
+_case_running = False
+
+def _on_case_timeout(signum, frame):
+    global _case_running
+    if _case_running:
+        _case_running = False
+        raise CaseTimeout()
+
+# A case keeps this much of what it prints; records stay under half the server's HARNESS_RECORD_LIMIT
+_OUTPUT_LIMIT = 4 * 1024 * 1024
+_RECORD_LIMIT = 8 * 1024 * 1024
+
+class _CappedOutput(io.StringIO):
+    """Captured stdout that drops whatever is printed past _OUTPUT_LIMIT characters"""
+    overflowed = False
+    
+    def write(self, text):
+        room = _OUTPUT_LIMIT - self.tell()
+        if len(text) > room:
+            self.overflowed = True
+            super().write(text[:max(room, 0)])
+            return len(text)
+        return super().write(text)
+
+def _jsonable(value):
+    # Return values JSON has no type for: sets become lists, numpy values use tolist(), anything else its repr
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return repr(value)
+
+def _emit(record):
+    line = _dumps(record, default=_jsonable)
+    if len(line) > _RECORD_LIMIT and record["event"] == "case":
+        # Escaping can make a record several times the size of the output it carries
+        record = dict(record, output="", error="Output limit exceeded")
+        if "result" in record:
+            record["result"] = None
+        line = _dumps(record, default=_jsonable)
+    _channel.write(line + "\n")
+    _channel.flush()
+
+def _format_exception(e):
+    # Drop the harness frame so the traceback starts in the user's code
+    return "".join(traceback.format_exception(type(e), e, e.__traceback__.tb_next))
+
+def _parse_input(input_data):
+    input_lines = input_data.strip().split("\n")
     
     # Try to parse input intelligently
     if len(input_lines) == 1:
         try:
             # Try to evaluate as Python literal (list, number, etc.)
-            test_input = eval(input_lines[0])
+            return eval(input_lines[0])
         except:
             # Treat as string
-            test_input = input_lines[0]
-    else:
-        # Multiple lines - treat as separate arguments
-        test_input = []
-        for line in input_lines:
-            try:
-                test_input.append(eval(line))
-            except:
-                test_input.append(line)
+            return input_lines[0]
     
+    # Multiple lines - treat as separate arguments
+    test_input = []
+    for line in input_lines:
+        try:
+            test_input.append(eval(line))
+        except:
+            test_input.append(line)
+    return test_input
+
+def _call_solution(namespace, test_input):
     # Call the appropriate function based on available functions
-    result = None
-    if 'two_sum' in globals() and callable(two_sum):
+    if callable(namespace.get("two_sum")):
         if isinstance(test_input, list) and len(test_input) >= 2:
-            result = two_sum(test_input[0], test_input[1])
+            return namespace["two_sum"](test_input[0], test_input[1])
+        return "Error: two_sum requires array and target"
+    if callable(namespace.get("is_palindrome")):
+        return namespace["is_palindrome"](str(test_input))
+    if callable(namespace.get("fibonacci")):
+        return namespace["fibonacci"](int(test_input))
+    return "No recognized function found. Please implement the required function."
+
+def _apply_limits(limits):
+    if limits.get("memory_bytes"):
+        resource.setrlimit(resource.RLIMIT_AS, (limits["memory_bytes"], limits["memory_bytes"]))
+    if limits.get("cpu_seconds"):
+        # SIGXCPU at the soft limit, SIGKILL a second later if it is ignored
+        resource.setrlimit(resource.RLIMIT_CPU, (limits["cpu_seconds"], limits["cpu_seconds"] + 1))
+    if limits.get("processes") is not None:
+        resource.setrlimit(resource.RLIMIT_NPROC, (limits["processes"], limits["processes"]))
+    if limits.get("output_bytes"):
+        # SIGXFSZ once a program writes more than this to its stdout or stderr file
+        resource.setrlimit(resource.RLIMIT_FSIZE, (limits["output_bytes"], limits["output_bytes"]))
+
+def _peak_memory_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def _read_text(path):
+    with open(path, "rb") as f:
+        return f.read().decode(errors="replace")
+
+class _Unavailable:
+    """Stands in for a generated input the problem's generator failed to produce"""
+    def __init__(self, error):
+        self.error = error
+
+def _emit_unavailable(index, error):
+    _emit({"event": "case", "index": index, "output": "", "error": error, "timed_out": False,
+           "execution_time": 0, "cpu_time": 0, "memory_kb": _peak_memory_kb()})
+
+def _load_input(input_data, entry_point):
+    # Large tests arrive as {"path": ...} references to the test data store instead of inline
+    if not isinstance(input_data, dict):
+        return input_data
+    text = _read_text(input_data["path"])
+    if entry_point:
+        return [json.loads(line) for line in text.strip().split("\n")] if text.strip() else []
+    return text
+
+def _run_case(index, namespace, solution, input_data, load_output, time_limit, wall_limit):
+    global _case_running
+    buffer = _CappedOutput()
+    buffer.write(load_output.getvalue())
+    error = None
+    timed_out = False
+    value = None
+    start_time = time.perf_counter()
+    start_cpu = time.process_time()
+    _case_running = True
+    signal.setitimer(signal.ITIMER_PROF, time_limit)
+    signal.setitimer(signal.ITIMER_REAL, wall_limit)
+    try:
+        with contextlib.redirect_stdout(buffer):
+            if solution is not None:
+                value = solution(*input_data)
+            else:
+                try:
+                    result = _call_solution(namespace, _parse_input(input_data))
+                    print(_dumps(result) if isinstance(result, (list, dict)) else str(result))
+                except MemoryError:
+                    raise
+                except Exception as e:
+                    print(f"Error: {str(e)}")
+    except CaseTimeout:
+        timed_out = True
+    except MemoryError:
+        buffer = _CappedOutput()
+        error = "Memory limit exceeded"
+    except BaseException as e:
+        error = _format_exception(e)
+    finally:
+        _case_running = False
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    if buffer.overflowed and error is None and not timed_out:
+        error = "Output limit exceeded"
+    record = {
+        "event": "case",
+        "index": index,
+        "output": buffer.getvalue(),
+        "error": error,
+        "timed_out": timed_out,
+        "execution_time": time.perf_counter() - start_time,
+        "cpu_time": time.process_time() - start_cpu,
+        "memory_kb": _peak_memory_kb()
+    }
+    if solution is not None:
+        record["result"] = value
+    return record
+
+def run_batch(code, inputs, time_limit, limits, entry_point=None, wall_limit=None, retries=0):
+    """Run every input against the code; with an entry point each input is the argument list to call it with.
+    
+    time_limit is CPU seconds per case and wall_limit a wall-clock backstop for code that sleeps or
+    blocks. A case that runs out of time is run up to `retries` more times on a fresh copy of its
+    input, and the first run that finishes counts.
+    """
+    # Read referenced test files before any submitted code can patch json or open
+    inputs = [_load_input(input_data, entry_point) for input_data in inputs]
+    _apply_limits(limits)
+    namespace = {"__name__": "__main__"}
+    load_output = _CappedOutput()
+    # Marks where the inputs (and any generated ones) are ready, so their CPU time is no case's
+    _emit({"event": "loading"})
+    try:
+        with contextlib.redirect_stdout(load_output):
+            exec(compile(code, "<submission>", "exec"), namespace)
+    except BaseException as e:
+        _emit({"event": "load_error", "error": _format_exception(e)})
+        return
+    solution = namespace.get(entry_point) if entry_point else None
+    if entry_point and not callable(solution):
+        _emit({"event": "load_error", "error": f"Function {entry_point}() is not defined. Please implement the required function."})
+        return
+    
+    signal.signal(signal.SIGALRM, _on_case_timeout)
+    signal.signal(signal.SIGPROF, _on_case_timeout)
+    for index, input_data in enumerate(inputs):
+        if isinstance(input_data, _Unavailable):
+            _emit_unavailable(index, input_data.error)
+            continue
+        # Argument lists can be mutated by the solution, so a retry gets a copy taken beforehand
+        pristine = _dumps(input_data) if retries and solution is not None else None
+        for attempt in range(retries + 1):
+            case_input = _loads(pristine) if attempt and pristine is not None else input_data
+            record = _run_case(index, namespace, solution, case_input, load_output, time_limit, wall_limit or time_limit)
+            if not record["timed_out"]:
+                break
+        try:
+            _emit(record)
+        except (TypeError, ValueError, RecursionError) as e:
+            record["result"] = None
+            record["error"] = f"Return value cannot be serialized: {e}"
+            _emit(record)
+
+def _anonymous_file(name, data=b""):
+    # In-memory file for a program's stdin/stdout/stderr: never blocks the writer like a pipe would
+    fd = os.memfd_create(name)
+    os.write(fd, data)
+    os.lseek(fd, 0, os.SEEK_SET)
+    return fd
+
+def _read_file(fd, limit):
+    size = os.lseek(fd, 0, os.SEEK_END)
+    os.lseek(fd, max(size - limit, 0), os.SEEK_SET)
+    data = b""
+    while len(data) < min(size, limit):
+        chunk = os.read(fd, limit - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data.decode(errors="replace")
+
+_WHITESPACE = b" \t\n\r\x0b\x0c"
+
+def _mapped(fd):
+    size = os.fstat(fd).st_size
+    return mmap.mmap(fd, size, prot=mmap.PROT_READ) if size else b""
+
+def _stripped_bounds(data):
+    start, end = 0, len(data)
+    while start < end and data[start] in _WHITESPACE:
+        start += 1
+    while end > start and data[end - 1] in _WHITESPACE:
+        end -= 1
+    return start, end
+
+def _same_stripped(fd, expected_path, chunk_size=1 << 20):
+    """Compare a program's output with an expected-output file chunk by chunk, ignoring surrounding whitespace"""
+    with open(expected_path, "rb") as expected_file:
+        actual, expected = _mapped(fd), _mapped(expected_file.fileno())
+        actual_start, actual_end = _stripped_bounds(actual)
+        expected_start, expected_end = _stripped_bounds(expected)
+        length = actual_end - actual_start
+        if length != expected_end - expected_start:
+            return False
+        for offset in range(0, length, chunk_size):
+            size = min(chunk_size, length - offset)
+            if actual[actual_start + offset:actual_start + offset + size] != expected[expected_start + offset:expected_start + offset + size]:
+                return False
+        return True
+
+def _wait_for_exit(pid, timeout):
+    """wait4 the child, or return None if it is still running after `timeout` seconds"""
+    pidfd = os.pidfd_open(pid)
+    try:
+        ready, _, _ = select.select([pidfd], [], [], timeout)
+    finally:
+        os.close(pidfd)
+    if not ready:
+        return None
+    return os.wait4(pid, 0)
+
+def _command_error(status, stderr):
+    if os.WIFSIGNALED(status):
+        signum = os.WTERMSIG(status)
+        if signum == signal.SIGXCPU:
+            return "CPU time limit exceeded"
+        if signum == signal.SIGXFSZ:
+            return "Output limit exceeded"
+        if signum == signal.SIGKILL:
+            return "Process was killed (memory or CPU limit exceeded)"
+        return (stderr.strip() + "\n" if stderr.strip() else "") + f"Runtime error ({signal.Signals(signum).name})"
+    if os.WEXITSTATUS(status):
+        return stderr.strip() or f"Runtime error (exit code {os.WEXITSTATUS(status)})"
+    return None
+
+def _stdin_file(input_data):
+    if isinstance(input_data, _Unavailable):
+        return None
+    if isinstance(input_data, dict):
+        # A file from the test data store becomes the program's stdin as is
+        return os.open(input_data["path"], os.O_RDONLY)
+    return _anonymous_file("stdin", input_data.encode())
+
+def _spawn_case(command, stdin_fd, time_limit, wall_limit, cpu_rlimit):
+    """Run the program once on an input; returns (timed_out, status, rusage, wall time, stdout fd, stderr fd)"""
+    os.lseek(stdin_fd, 0, os.SEEK_SET)
+    stdout_fd = _anonymous_file("stdout")
+    stderr_fd = _anonymous_file("stderr")
+    start_time = time.perf_counter()
+    # posix_spawn (vfork + exec) rather than fork, so no page tables are copied per case
+    pid = os.posix_spawn(
+        command[0], command, os.environ,
+        file_actions=[
+            (os.POSIX_SPAWN_DUP2, stdin_fd, 0),
+            (os.POSIX_SPAWN_DUP2, stdout_fd, 1),
+            (os.POSIX_SPAWN_DUP2, stderr_fd, 2)
+        ],
+        # Python ignores these; restore the defaults so the program dies on SIGXFSZ like any other
+        setsigdef=(signal.SIGXFSZ, signal.SIGPIPE)
+    )
+    try:
+        # Stop a spinning program just past its case's CPU limit rather than the whole run's
+        resource.prlimit(pid, resource.RLIMIT_CPU, cpu_rlimit)
+    except OSError:
+        pass
+    waited = _wait_for_exit(pid, wall_limit)
+    timed_out = waited is None
+    if timed_out:
+        os.kill(pid, signal.SIGKILL)
+        waited = os.wait4(pid, 0)
+    _, status, rusage = waited
+    # Killed by its own RLIMIT_CPU, or finished but over the limit
+    timed_out = timed_out or rusage.ru_utime + rusage.ru_stime > time_limit
+    return timed_out, status, rusage, time.perf_counter() - start_time, stdout_fd, stderr_fd
+
+def run_commands(command, inputs, time_limit, limits, expected=None, wall_limit=None, retries=0):
+    """Run a compiled or interpreted program once per input, feeding the input on stdin.
+    
+    Where `expected` names an expected-output file the output is compared here, streaming, and
+    only a preview of it is reported along with whether it matched. Time limits and retries work
+    as in run_batch, with the CPU time read from the program's rusage.
+    """
+    stdin_fds = [_stdin_file(input_data) for input_data in inputs]
+    # Inherited by every spawned program; this process only waits on them
+    _apply_limits(limits)
+    soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    case_seconds = int(time_limit) + 1
+    cpu_rlimit = (
+        case_seconds if soft == resource.RLIM_INFINITY else min(case_seconds, soft),
+        case_seconds + 1 if hard == resource.RLIM_INFINITY else min(case_seconds + 1, hard)
+    )
+    for index, stdin_fd in enumerate(stdin_fds):
+        if stdin_fd is None:
+            _emit_unavailable(index, inputs[index].error)
+            continue
+        for attempt in range(retries + 1):
+            if attempt:
+                os.close(stdout_fd)
+                os.close(stderr_fd)
+            try:
+                timed_out, status, rusage, execution_time, stdout_fd, stderr_fd = _spawn_case(
+                    command, stdin_fd, time_limit, wall_limit or time_limit, cpu_rlimit
+                )
+            except OSError as e:
+                _emit({"event": "load_error", "error": f"Failed to start {os.path.basename(command[0])}: {e}"})
+                return
+            if not timed_out:
+                break
+        stderr = _read_file(stderr_fd, 65536)
+        expected_path = expected[index] if expected else None
+        record = {
+            "event": "case",
+            "index": index,
+            "output": "",
+            "error": None if timed_out else _command_error(status, stderr),
+            "timed_out": timed_out,
+            "execution_time": execution_time,
+            "cpu_time": rusage.ru_utime + rusage.ru_stime,
+            "memory_kb": rusage.ru_maxrss
+        }
+        if expected_path and not timed_out:
+            record["matched"] = _same_stripped(stdout_fd, expected_path)
+            os.lseek(stdout_fd, 0, os.SEEK_SET)
+            record["output"] = os.read(stdout_fd, 4096).decode(errors="replace")
+        elif not timed_out:
+            record["output"] = _read_file(stdout_fd, limits.get("output_bytes") or 1 << 30)
+        _emit(record)
+        for fd in (stdin_fd, stdout_fd, stderr_fd):
+            os.close(fd)
+
+def _ladder_inputs(ladder, as_stdin):
+    """Inputs of growing size from the problem's generate(n, rng), produced before any submitted code runs.
+    
+    Each size is generated once from a generator seeded with n; every repeat gets a fresh copy so a
+    solution that mutates its arguments does not hand the next run easier ones.
+    """
+    import random
+    count = len(ladder["sizes"]) * ladder["repeats"]
+    namespace = {"__name__": "generator"}
+    try:
+        exec(compile(ladder["generator"], "<generator>", "exec"), namespace)
+        generate = namespace["generate"]
+    except BaseException as e:
+        return [_Unavailable(f"Input generator failed: {e!r}")] * count
+    inputs = []
+    for n in ladder["sizes"]:
+        try:
+            blob = json.dumps(list(generate(n, random.Random(n))))
+        except BaseException as e:
+            inputs.extend([_Unavailable(f"Input generator failed for n={n}: {e!r}")] * ladder["repeats"])
+            continue
+        for _ in range(ladder["repeats"]):
+            args = json.loads(blob)
+            inputs.append("\n".join(json.dumps(arg) for arg in args) if as_stdin else args)
+    return inputs
+
+def run_job(job):
+    ladder = job.get("ladder")
+    if ladder:
+        # Complexity runs follow any test inputs in the same batch
+        extra = _ladder_inputs(ladder, as_stdin=bool(job.get("command")))
+        if job.get("command"):
+            job["inputs"] = job["inputs"] + extra
+            if job.get("expected"):
+                job["expected"] = job["expected"] + [None] * len(extra)
         else:
-            result = "Error: two_sum requires array and target"
-    elif 'is_palindrome' in globals() and callable(is_palindrome):
-        result = is_palindrome(str(test_input))
-    elif 'fibonacci' in globals() and callable(fibonacci):
-        result = fibonacci(int(test_input))
+            job["args"] = job["args"] + extra
+    timing = {"wall_limit": job.get("wall_limit"), "retries": job.get("retries", 0)}
+    if job.get("command"):
+        run_commands(job["command"], job["inputs"], job["time_limit"], job["limits"], job.get("expected"), **timing)
+    elif job.get("entry_point"):
+        run_batch(job["code"], job["args"], job["time_limit"], job["limits"], job["entry_point"], **timing)
+    else:
+        run_batch(job["code"], job["inputs"], job["time_limit"], job["limits"], **timing)
+
+def _drain(fd, tail, limit=65536):
+    # Keep only the last `limit` bytes of whatever the child writes to stdout/stderr
+    with os.fdopen(fd, "rb") as stream:
+        for chunk in iter(lambda: stream.read1(65536), b""):
+            tail.append(chunk)
+            while sum(len(c) for c in tail) - len(tail[0]) >= limit:
+                tail.pop(0)
+
+def serve_forever():
+    """Warm worker loop: read one job per line and run it in a freshly forked child"""
+    import threading
+    _emit({"event": "ready"})
+    for line in sys.stdin.buffer:
+        job = json.loads(line)
+        go_r, go_w = os.pipe()
+        out_r, out_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # Own process group, so a deadline kill also takes out anything the submission spawned
+            os.setpgid(0, 0)
+            os.close(go_w)
+            os.close(out_r)
+            os.read(go_r, 1)
+            devnull = os.open(os.devnull, os.O_RDONLY)
+            os.dup2(devnull, 0)
+            os.dup2(out_w, 1)
+            os.dup2(out_w, 2)
+            try:
+                run_job(job)
+            finally:
+                _channel.flush()
+                os._exit(0)
+        os.close(go_r)
+        os.close(out_w)
+        try:
+            os.setpgid(pid, pid)
+        except OSError:
+            pass
+        _emit({"event": "started", "pid": pid})
+        os.write(go_w, b"x")
+        os.close(go_w)
+        
+        tail = []
+        drainer = threading.Thread(target=_drain, args=(out_r, tail))
+        drainer.start()
+        _, status, rusage = os.wait4(pid, 0)
+        drainer.join()
+        _emit({
+            "event": "exit",
+            "returncode": os.waitstatus_to_exitcode(status),
+            "stderr": b"".join(tail).decode(errors="replace"),
+            "cpu_time": rusage.ru_utime + rusage.ru_stime,
+            "memory_kb": rusage.ru_maxrss
+        })
+
+def serve_once():
+    """Cold run: read a single job line from stdin, then leave the submission nothing more to read there"""
+    job = json.loads(sys.stdin.buffer.readline())
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    run_job(job)
+
+if __name__ == "__main__":
+    if "--worker" in sys.argv:
+        serve_forever()
     else:
-        result = "No recognized function found. Please implement the required function."
+        serve_once()
+'''
+
+# Seconds allowed on top of the per-case limits for interpreter startup and loading the code
+HARNESS_STARTUP_GRACE = float(os.environ.get('HARNESS_STARTUP_GRACE', 2))
+
+# Largest single result line accepted from a harness
+HARNESS_RECORD_LIMIT = 16 * 1024 * 1024
+
+# Time limits are CPU seconds on a reference host. Each judge host times a fixed workload at
+# startup and scales every limit by how much slower or faster than the reference it ran.
+CALIBRATION_REFERENCE_SECONDS = float(os.environ.get('CALIBRATION_REFERENCE_SECONDS', 0.05))  # per workload
+CALIBRATION_WARMUP_RUNS = 2
+CALIBRATION_RUNS = 9
+CALIBRATION_WORKLOADS_PER_RUN = 6  # about 300ms a run on the reference host
+HOST_SPEED_BOUNDS = (0.25, 4.0)
+# The factor is kept per host name in this file, so a restart measuring within CALIBRATION_MAX_DRIFT
+# of it leaves every limit as it was, and one measuring further off moves them by at most that much
+HOST_CALIBRATION_FILE = os.environ.get('HOST_CALIBRATION_FILE', str(ROOT_DIR / 'host_calibration.json'))
+CALIBRATION_MAX_DRIFT = float(os.environ.get('CALIBRATION_MAX_DRIFT', 0.15))
+# Set to skip calibration and use a known factor, e.g. 1 on the reference host
+HOST_SPEED_FACTOR = os.environ.get('HOST_SPEED_FACTOR')
+# Extra runs for a case that ran out of time; the first that finishes counts
+TIMEOUT_RETRIES = int(os.environ.get('TIMEOUT_RETRIES', 0))
+# Wall-clock backstop per case, as a multiple of its CPU limit, for code that sleeps or blocks
+WALL_TIME_FACTOR = float(os.environ.get('WALL_TIME_FACTOR', 2))
+
+def calibration_workload() -> int:
+    """Interpreter-bound mix of arithmetic, dict, list and string work, like a typical solution"""
+    total = 0
+    table = {}
+    items = []
+    for i in range(100000):
+        total = (total * 31 + i) % 1000003
+        table[total & 4095] = i
+        items.append(total)
+    items.sort()
+    text = ",".join(str(value) for value in items[:20000])
+    return total + len(table) + len(text.split(","))
+
+class HostCalibration:
+    """This host's speed relative to the reference host, as the factor its time limits are scaled by.
     
-    print(json.dumps(result) if isinstance(result, (list, dict)) else str(result))
+    `measured` is the last measurement and `drift` how far it was from the factor stored for this
+    host, as a fraction.
+    """
     
-except Exception as e:
-    print(f"Error: {{str(e)}}")
-"""
-            tmp_file.write(full_code)
-            tmp_file.flush()
-            
-            # Execute the code with timeout
-            start_time = time.time()
-            
-            try:
-                # Set up timeout signal
-                signal.signal(signal.SIGALRM, timeout_handler)
-                signal.alarm(time_limit)
-                
-                # Execute the code
-                result = subprocess.run(
-                    [sys.executable, tmp_file.name],
-                    capture_output=True,
-                    text=True,
-                    timeout=time_limit
+    def __init__(self, path: str, max_drift: float):
+        self.path = path
+        self.max_drift = max_drift
+        self.factor = 1.0
+        self.measured: Optional[float] = None
+        self.drift: Optional[float] = None
+    
+    def measure(self) -> float:
+        """Time the workload on this thread's CPU clock; the median run is the one least disturbed by load"""
+        for _ in range(CALIBRATION_WARMUP_RUNS):
+            calibration_workload()
+        timings = []
+        for _ in range(CALIBRATION_RUNS):
+            started = time.thread_time()
+            for _ in range(CALIBRATION_WORKLOADS_PER_RUN):
+                calibration_workload()
+            timings.append((time.thread_time() - started) / CALIBRATION_WORKLOADS_PER_RUN)
+        low, high = HOST_SPEED_BOUNDS
+        return min(max(statistics.median(timings) / CALIBRATION_REFERENCE_SECONDS, low), high)
+    
+    def _load(self) -> Dict[str, float]:
+        try:
+            with open(self.path) as f:
+                stored = json.load(f)
+            return stored if isinstance(stored, dict) else {}
+        except (OSError, ValueError):
+            return {}
+    
+    def _save(self, stored: Dict[str, float]):
+        try:
+            temporary = f"{self.path}.{os.getpid()}.tmp"
+            with open(temporary, "w") as f:
+                json.dump(stored, f, indent=2, sort_keys=True)
+            os.replace(temporary, self.path)
+        except OSError as e:
+            logger.warning(f"Could not store the host speed factor in {self.path}: {str(e)}")
+    
+    def calibrate(self) -> float:
+        if HOST_SPEED_FACTOR:
+            self.factor = float(HOST_SPEED_FACTOR)
+            return self.factor
+        measured = self.measured = self.measure()
+        stored = self._load()
+        host = socket.gethostname()
+        previous = stored.get(host)
+        if not isinstance(previous, (int, float)) or previous <= 0:
+            factor = measured
+        else:
+            self.drift = measured / previous - 1
+            if abs(self.drift) <= self.max_drift:
+                factor = previous
+            else:
+                logger.warning(
+                    f"Host speed measured {measured:.3f}, {self.drift:+.0%} off the stored {previous}; "
+                    f"moving by at most {self.max_drift:.0%}"
                 )
+                factor = previous * (1 + math.copysign(self.max_drift, self.drift))
+        self.factor = round(factor, 3)
+        if self.factor != previous:
+            stored[host] = self.factor
+            self._save(stored)
+        return self.factor
+    
+    def scale(self, seconds: float) -> float:
+        return seconds * self.factor
+
+host_calibration = HostCalibration(HOST_CALIBRATION_FILE, CALIBRATION_MAX_DRIFT)
+
+# Fixed errors that say nothing about the input; a submission's own text never counts as one,
+# however it starts, since it could quote a hidden test case
+LIMIT_VERDICTS = (
+    "CPU time limit exceeded", "Memory limit exceeded", "Output limit exceeded",
+    "Process was killed (memory or CPU limit exceeded)"
+)
+
+def _error_result(error: str, execution_time: float = 0, cpu_time: float = 0, memory_kb: int = 0,
+                  verdict: Optional[str] = None) -> Dict[str, Any]:
+    """A failed case. `verdict` is a server-written message that is safe to show on a hidden case in place of `error`."""
+    return {
+        "success": False,
+        "output": None,
+        "error": error,
+        "verdict": verdict or (error if error in LIMIT_VERDICTS else None),
+        "execution_time": execution_time,
+        "cpu_time": cpu_time,
+        "memory_kb": memory_kb
+    }
+
+def _timeout_result(time_limit: float, cpu_time: float = 0, memory_kb: int = 0) -> Dict[str, Any]:
+    message = f"Code execution timed out after {time_limit:g} seconds"
+    return _error_result(message, time_limit, cpu_time, memory_kb, verdict=message)
+
+def ladder_run_count(problem_data: Dict[str, Any]) -> int:
+    complexity = problem_data.get("complexity")
+    return len(complexity["sizes"]) * complexity["repeats"] if complexity else 0
+
+def sandbox_limits(problem_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Resource limits for one run of a problem's test cases, as applied with setrlimit in the child"""
+    time_limit = problem_data.get("time_limit", 5)
+    cpu_limit = problem_data.get("cpu_limit") or math.ceil(time_limit * max(len(problem_data["test_cases"]), 1))
+    return {
+        "memory_bytes": problem_data.get("memory_limit", 256) * 1024 * 1024,
+        "cpu_seconds": cpu_limit,
+        "processes": problem_data.get("process_limit")
+    }
+
+def _exit_error(exit_status: Dict[str, Any]) -> str:
+    """Explain why a harness stopped before reporting every case"""
+    returncode = exit_status["returncode"]
+    if returncode == -signal.SIGXCPU:
+        return "CPU time limit exceeded"
+    if returncode == -signal.SIGKILL:
+        return "Process was killed (memory or CPU limit exceeded)"
+    return exit_status["stderr"].strip() or "Runtime error occurred"
+
+class BatchJob:
+    """One harness run: the code (or a program to run per input), the test inputs and the limits.
+    
+    An input is either inline text or {"path": ...} naming a file in the test data store. With an
+    entry point the inputs are argument lists, passed as `args_blob`: JSON serialized once when the
+    problem was loaded and spliced into the job line verbatim. `expected_paths` lets the harness
+    compare a program's output with expected-output files itself. A `ladder` has the harness
+    generate complexity runs of growing size and run them after any inputs.
+    
+    `time_limit` is the problem's normalized limit; the harness gets it scaled to this host.
+    """
+    
+    def __init__(self, code: str, inputs: List[Any], time_limit: float, limits: Dict[str, Any],
+                 command: Optional[List[str]] = None, entry_point: Optional[str] = None, args_blob: Optional[str] = None,
+                 expected_paths: Optional[List[Optional[str]]] = None, ladder: Optional[Dict[str, Any]] = None):
+        self.code = code
+        self.inputs = inputs
+        self.time_limit = time_limit
+        self.limits = limits
+        self.command = command
+        self.entry_point = entry_point
+        self.args_blob = args_blob
+        self.expected_paths = expected_paths
+        self.ladder = ladder
+    
+    @property
+    def case_count(self) -> int:
+        return len(self.inputs) + (len(self.ladder["sizes"]) * self.ladder["repeats"] if self.ladder else 0)
+    
+    @property
+    def wall_limit(self) -> float:
+        return host_calibration.scale(self.time_limit) * WALL_TIME_FACTOR
+    
+    @property
+    def deadline(self) -> float:
+        """Longest the harness may take if every case, and every retry, runs to its wall-clock limit"""
+        return self.wall_limit * (1 + TIMEOUT_RETRIES) * self.case_count + HARNESS_STARTUP_GRACE
+    
+    def encode(self) -> str:
+        limits = dict(self.limits)
+        if limits.get("cpu_seconds"):
+            # A backstop behind the per-case timers, so it leaves room for loading the code on top of every case
+            cpu_seconds = host_calibration.scale(limits["cpu_seconds"]) * (1 + TIMEOUT_RETRIES)
+            limits["cpu_seconds"] = math.ceil(cpu_seconds + HARNESS_STARTUP_GRACE)
+        job = {
+            "code": self.code,
+            "time_limit": host_calibration.scale(self.time_limit),
+            "wall_limit": self.wall_limit,
+            "retries": TIMEOUT_RETRIES,
+            "limits": limits,
+            "command": self.command
+        }
+        if self.expected_paths:
+            job["expected"] = self.expected_paths
+        if self.ladder:
+            job["ladder"] = self.ladder
+        if self.entry_point:
+            job["entry_point"] = self.entry_point
+            return json.dumps(job)[:-1] + ', "args": ' + self.args_blob + "}"
+        job["inputs"] = self.inputs
+        return json.dumps(job)
+
+class SupervisedChild:
+    """Deadline entry for one sandbox process group"""
+    
+    def __init__(self, pgid: int, deadline: float):
+        self.pgid = pgid
+        self.deadline = deadline
+        self.started_at = time.monotonic()
+        self.expired = False
+        self.cancelled = False
+    
+    @property
+    def wall_time(self) -> float:
+        return time.monotonic() - self.started_at
+    
+    def cancel(self):
+        self.cancelled = True
+
+class DeadlineSupervisor:
+    """Tracks the deadlines of all running sandboxes in one heap and kills expired process groups.
+    
+    A single timer on the event loop is armed for the earliest deadline, so any number of
+    concurrent children are supervised without signals or a thread per child.
+    """
+    
+    def __init__(self):
+        self._heap = []
+        self._sequence = itertools.count()
+        self._timer = None
+        self._timer_deadline = None
+    
+    @property
+    def watched(self) -> int:
+        return sum(1 for _, _, child in self._heap if not child.cancelled and not child.expired)
+    
+    def watch(self, pgid: int, timeout: float) -> SupervisedChild:
+        loop = asyncio.get_running_loop()
+        child = SupervisedChild(pgid, loop.time() + timeout)
+        heapq.heappush(self._heap, (child.deadline, next(self._sequence), child))
+        if self._timer_deadline is None or child.deadline < self._timer_deadline:
+            self._arm(loop)
+        return child
+    
+    def _arm(self, loop):
+        if self._timer is not None:
+            self._timer.cancel()
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+        if self._heap:
+            self._timer_deadline = self._heap[0][0]
+            self._timer = loop.call_at(self._timer_deadline, self._expire)
+        else:
+            self._timer = self._timer_deadline = None
+    
+    def _expire(self):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        while self._heap and self._heap[0][0] <= now:
+            _, _, child = heapq.heappop(self._heap)
+            if child.cancelled:
+                continue
+            child.expired = True
+            kill_process_group(child.pgid)
+        self._arm(loop)
+
+def kill_process_group(pgid: int):
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def process_cpu_time(pid: int) -> Optional[float]:
+    """CPU seconds a running process has used, read from the kernel rather than from anything it reports"""
+    try:
+        # The process-wide CPU clock id that glibc's clock_getcpuclockid() builds
+        return time.clock_gettime((~pid << 3) | 2)
+    except OSError:
+        return None
+
+deadline_supervisor = DeadlineSupervisor()
+
+class ColdHarnessSession:
+    """A harness run in a freshly spawned interpreter.
+    
+    Nothing touches the filesystem: the harness source goes in as the -c argument, the same as
+    for warm workers, and the job follows as one line on stdin.
+    """
+    
+    def __init__(self, process):
+        self.process = process
+        self.pgid = process.pid
+        self._stderr_task = asyncio.ensure_future(process.stderr.read())
+    
+    @classmethod
+    async def start(cls, job: BatchJob) -> "ColdHarnessSession":
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-c", PYTHON_HARNESS,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            limit=HARNESS_RECORD_LIMIT,
+            start_new_session=True
+        )
+        session = cls(process)
+        try:
+            process.stdin.write(job.encode().encode() + b"\n")
+            await process.stdin.drain()
+            process.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            # The interpreter died before reading its job; the missing records report it
+            pass
+        except BaseException:
+            await session.close()
+            raise
+        return session
+    
+    async def wait_started(self):
+        pass
+    
+    async def read_record(self) -> Optional[Dict[str, Any]]:
+        try:
+            line = await self.process.stdout.readline()
+            return json.loads(line) if line else None
+        except ValueError:
+            # An overlong or malformed line leaves nothing after it that can be trusted
+            raise RuntimeError("Sandbox sent an unreadable record")
+    
+    def kill(self):
+        if self.process.returncode is None:
+            kill_process_group(self.pgid)
+    
+    async def finish(self) -> Dict[str, Any]:
+        """Wait for the child to exit and return its exit status and stderr"""
+        await self.process.wait()
+        stderr = await self._stderr_task
+        return {"returncode": self.process.returncode, "stderr": stderr.decode(errors="replace")}
+    
+    async def close(self):
+        self.kill()
+        await self.finish()
+        # Reap anything the submission left running in its group after the harness exited
+        kill_process_group(self.pgid)
+
+async def stream_batch_results(session, job: BatchJob, spawn_started: float) -> AsyncIterator[Dict[str, Any]]:
+    """Translate a harness session's records into per-case execution results"""
+    case_count = job.case_count
+    time_limit = job.time_limit
+    reported = 0
+    reported_cpu_time = 0.0
+    clock = 0.0  # the child's CPU clock when its last record arrived
+    try:
+        await session.wait_started()
+        run_started = time.perf_counter()
+        observe_stage("spawn", run_started - spawn_started)
+        supervised = deadline_supervisor.watch(session.pgid, job.deadline)
+        try:
+            while reported < case_count:
+                record = await session.read_record()
+                if record is None:
+                    break
                 
-                # Clear the alarm
-                signal.alarm(0)
+                if record["event"] == "loading":
+                    clock = process_cpu_time(session.pgid) or clock
+                    continue
                 
-                execution_time = time.time() - start_time
+                if record["event"] == "load_error":
+                    # Every input is already loaded when the code is, so this is as private as any case's error
+                    while reported < case_count:
+                        yield _error_result(record["error"].strip())
+                        reported += 1
+                    break
                 
-                if result.returncode == 0:
-                    return {
+                cpu_time = record["cpu_time"]
+                if not job.command:
+                    # Python runs in the harness's own process and can patch whatever reports its time,
+                    # so a case is charged what the child's CPU clock advanced since the previous record
+                    now = process_cpu_time(session.pgid)
+                    if now is None and reported == case_count - 1:
+                        # Already exited after its last case: the worker's wait4 figure covers the rest
+                        now = (await session.finish()).get("cpu_time")
+                    if now is not None:
+                        cpu_time, clock = max(now - clock, 0.0), now
+                reported_cpu_time += cpu_time
+                if record["timed_out"]:
+                    yield _timeout_result(time_limit, cpu_time, record["memory_kb"])
+                elif record["error"]:
+                    yield _error_result(record["error"].strip(), record["execution_time"], cpu_time, record["memory_kb"])
+                else:
+                    case_result = {
                         "success": True,
-                        "output": result.stdout.strip(),
+                        "output": record["output"].strip(),
                         "error": None,
-                        "execution_time": execution_time
+                        "execution_time": record["execution_time"],
+                        "cpu_time": cpu_time,
+                        "memory_kb": record["memory_kb"]
                     }
+                    if "result" in record:
+                        case_result["result"] = record["result"]
+                    if "matched" in record:
+                        case_result["matched"] = record["matched"]
+                    yield case_result
+                reported += 1
+        finally:
+            supervised.cancel()
+            observe_stage("run", time.perf_counter() - run_started)
+        
+        if reported < case_count:
+            # The harness died or overran its overall deadline: fail the cases it never reached,
+            # charging whatever CPU time the child used beyond the reported cases to the first one
+            session.kill()
+            exit_status = await session.finish()
+            unreported_cpu_time = max(exit_status.get("cpu_time", reported_cpu_time) - reported_cpu_time, 0)
+            memory_kb = exit_status.get("memory_kb", 0)
+            if supervised.expired:
+                # Wall time well past the CPU time means the sandbox was blocked or starved, not spinning
+                logger.warning(
+                    f"Sandbox {session.pgid} overran its deadline and was killed after {supervised.wall_time:.2f}s wall, "
+                    f"{exit_status.get('cpu_time', reported_cpu_time):.2f}s CPU, with {case_count - reported} of {case_count} cases unreported"
+                )
+            while reported < case_count:
+                if supervised.expired:
+                    yield _timeout_result(time_limit, unreported_cpu_time, memory_kb)
                 else:
-                    return {
-                        "success": False,
-                        "output": None,
-                        "error": result.stderr.strip() or "Runtime error occurred",
-                        "execution_time": execution_time
-                    }
-                    
-            except (subprocess.TimeoutExpired, TimeoutError):
-                return {
-                    "success": False,
-                    "output": None,
-                    "error": f"Code execution timed out after {time_limit} seconds",
-                    "execution_time": time_limit
-                }
-            finally:
-                signal.alarm(0)  # Clear any remaining alarm
-                
+                    yield _error_result(_exit_error(exit_status), 0, unreported_cpu_time, memory_kb)
+                unreported_cpu_time = 0
+                reported += 1
+    
     except Exception as e:
-        return {
-            "success": False,
-            "output": None,
-            "error": f"Execution error: {str(e)}",
-            "execution_time": 0
-        }
+        while reported < case_count:
+            yield _error_result(f"Execution error: {str(e)}", verdict="Execution error")
+            reported += 1
+
+async def execute_batch(job: BatchJob) -> AsyncIterator[Dict[str, Any]]:
+    """Run a batch job in one fresh harness, yielding each case's result as it finishes"""
+    spawn_started = time.perf_counter()
+    try:
+        session = await ColdHarnessSession.start(job)
+    except Exception as e:
+        for _ in range(job.case_count):
+            yield _error_result(f"Execution error: {str(e)}", verdict="Execution error")
+        return
+    try:
+        async with aclosing(stream_batch_results(session, job, spawn_started)) as case_results:
+            async for case_result in case_results:
+                yield case_result
     finally:
-        # Clean up temporary file
+        await session.close()
+
+# Warm sandbox pool: pre-started interpreters with the harness already imported,
+# each job runs in a child forked from one of them
+SANDBOX_POOL_SIZE = int(os.environ.get('SANDBOX_POOL_SIZE', EXECUTION_CONCURRENCY))
+SANDBOX_MAX_TASKS_PER_WORKER = int(os.environ.get('SANDBOX_MAX_TASKS_PER_WORKER', 100))
+SANDBOX_IDLE_SECONDS = float(os.environ.get('SANDBOX_IDLE_SECONDS', 300))
+
+class SandboxWorker:
+    """A pre-started interpreter running the harness worker loop"""
+    
+    def __init__(self, process):
+        self.process = process
+        self.tasks = 0
+        self.healthy = True
+        self.last_used = time.monotonic()
+        self._stderr_task = asyncio.ensure_future(self._discard_stderr())
+    
+    @classmethod
+    async def start(cls) -> "SandboxWorker":
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-c", PYTHON_HARNESS, "--worker",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            limit=HARNESS_RECORD_LIMIT
+        )
+        worker = cls(process)
         try:
-            os.unlink(tmp_file.name)
-        except:
+            ready = await asyncio.wait_for(worker.read_record(), timeout=HARNESS_STARTUP_GRACE * 5)
+            if not ready or ready["event"] != "ready":
+                raise RuntimeError("Sandbox worker failed to start")
+        except BaseException:
+            await worker.close()
+            raise
+        return worker
+    
+    async def _discard_stderr(self):
+        # Job output is captured per child; this only keeps the worker's own pipe from filling
+        while await self.process.stderr.read(65536):
             pass
+    
+    async def read_record(self) -> Optional[Dict[str, Any]]:
+        try:
+            line = await self.process.stdout.readline()
+            return json.loads(line) if line else None
+        except ValueError:
+            # Past an overlong or malformed line the stream is out of step with the records
+            self.healthy = False
+            raise RuntimeError("Sandbox worker sent an unreadable record")
+    
+    async def send_job(self, job: BatchJob):
+        self.tasks += 1
+        self.process.stdin.write(job.encode().encode() + b"\n")
+        await self.process.stdin.drain()
+    
+    async def close(self):
+        self.healthy = False
+        if self.process.returncode is None:
+            self.process.kill()
+        await self.process.wait()
+        self._stderr_task.cancel()
 
-@api_router.get("/")
-async def root():
-    return {"message": "Placement Coding Platform API"}
+class WarmHarnessSession:
+    """A harness run in a child forked from a warm sandbox worker"""
+    
+    def __init__(self, worker: SandboxWorker):
+        self.worker = worker
+        self.pgid = None
+        self.exit_status = None
+    
+    async def wait_started(self):
+        """Read up to the worker's "started" record, which names the forked child"""
+        while self.pgid is None:
+            record = await asyncio.wait_for(self.worker.read_record(), timeout=HARNESS_STARTUP_GRACE)
+            if record is None:
+                self.worker.healthy = False
+                raise RuntimeError("Sandbox worker exited unexpectedly")
+            if record["event"] == "started":
+                self.pgid = record["pid"]
+    
+    async def read_record(self) -> Optional[Dict[str, Any]]:
+        while self.exit_status is None:
+            record = await self.worker.read_record()
+            if record is None:
+                self.worker.healthy = False
+                self.exit_status = {"returncode": -9, "stderr": ""}
+            elif record["event"] == "exit":
+                self.exit_status = record
+            else:
+                return record
+        return None
+    
+    def kill(self):
+        if self.pgid is not None and self.exit_status is None:
+            kill_process_group(self.pgid)
+    
+    async def finish(self) -> Dict[str, Any]:
+        """Wait for the forked child to exit and return its exit status, stderr and CPU time"""
+        try:
+            if self.pgid is None:
+                await self.wait_started()
+                self.kill()
+            while self.exit_status is None:
+                await asyncio.wait_for(self.read_record(), timeout=HARNESS_STARTUP_GRACE)
+        except (asyncio.TimeoutError, RuntimeError, ValueError):
+            # The worker itself stopped responding or garbled its output; it is discarded on release
+            self.worker.healthy = False
+            self.exit_status = {"returncode": -9, "stderr": ""}
+        return self.exit_status
+    
+    async def close(self):
+        self.kill()
+        await self.finish()
+        # Reap anything the submission left running in its group after the child exited
+        if self.pgid is not None:
+            kill_process_group(self.pgid)
 
-@api_router.get("/problems", response_model=List[Problem])
-async def get_problems():
-    """Get all available problems"""
-    problems = []
-    for prob_data in SAMPLE_PROBLEMS:
-        problem = Problem(**prob_data)
-        problems.append(problem)
-    return problems
+class SandboxPool:
+    """Keeps up to `size` warm workers, recycling them after `max_tasks` jobs or `idle_seconds` unused"""
+    
+    def __init__(self, size: int, max_tasks: int, idle_seconds: float):
+        self.size = size
+        self.max_tasks = max_tasks
+        self.idle_seconds = idle_seconds
+        self._idle: List[SandboxWorker] = []
+        self._count = 0
+        self._available = asyncio.Condition()
+        self._evictor = None
+    
+    async def start(self):
+        """Pre-start the whole pool and begin evicting idle workers"""
+        workers = await asyncio.gather(*(SandboxWorker.start() for _ in range(self.size)), return_exceptions=True)
+        async with self._available:
+            for worker in workers:
+                if isinstance(worker, SandboxWorker):
+                    self._idle.append(worker)
+                    self._count += 1
+                else:
+                    logger.error(f"Failed to pre-start sandbox worker: {worker}")
+        self._evictor = asyncio.ensure_future(self._evict_idle())
+    
+    async def acquire(self) -> SandboxWorker:
+        dead = []
+        try:
+            async with self._available:
+                while True:
+                    while not self._idle and self._count >= self.size:
+                        await self._available.wait()
+                    if not self._idle:
+                        break
+                    worker = self._idle.pop()
+                    if worker.process.returncode is None:
+                        return worker
+                    # Died while idle, e.g. killed by a process a submission left running
+                    dead.append(worker)
+                    self._count -= 1
+                self._count += 1
+        finally:
+            for worker in dead:
+                await worker.close()
+        try:
+            return await SandboxWorker.start()
+        except BaseException:
+            async with self._available:
+                self._count -= 1
+                self._available.notify()
+            raise
+    
+    async def release(self, worker: SandboxWorker):
+        worker.last_used = time.monotonic()
+        if worker.healthy and worker.tasks < self.max_tasks and worker.process.returncode is None:
+            async with self._available:
+                # Most recently used on top, so surplus workers sink to the bottom and go idle
+                self._idle.append(worker)
+                self._available.notify()
+            return
+        await worker.close()
+        async with self._available:
+            self._count -= 1
+            self._available.notify()
+    
+    async def _evict_idle(self):
+        while True:
+            await asyncio.sleep(max(self.idle_seconds / 2, 1))
+            cutoff = time.monotonic() - self.idle_seconds
+            async with self._available:
+                expired = [worker for worker in self._idle if worker.last_used < cutoff]
+                self._idle = [worker for worker in self._idle if worker.last_used >= cutoff]
+                self._count -= len(expired)
+                self._available.notify(len(expired))
+            for worker in expired:
+                await worker.close()
+    
+    async def close(self):
+        if self._evictor:
+            self._evictor.cancel()
+        async with self._available:
+            workers, self._idle = self._idle, []
+            self._count -= len(workers)
+        for worker in workers:
+            await worker.close()
+    
+    async def execute_batch(self, job: BatchJob) -> AsyncIterator[Dict[str, Any]]:
+        """Run a batch job in a child forked from a warm worker"""
+        spawn_started = time.perf_counter()
+        try:
+            worker = await self.acquire()
+        except Exception as e:
+            for _ in range(job.case_count):
+                yield _error_result(f"Execution error: {str(e)}", verdict="Execution error")
+            return
+        try:
+            await worker.send_job(job)
+        except Exception as e:
+            # Its pipe is gone, so the worker is discarded and its slot freed for a fresh one
+            worker.healthy = False
+            await self.release(worker)
+            for _ in range(job.case_count):
+                yield _error_result(f"Execution error: {str(e)}", verdict="Execution error")
+            return
+        session = WarmHarnessSession(worker)
+        try:
+            async with aclosing(stream_batch_results(session, job, spawn_started)) as case_results:
+                async for case_result in case_results:
+                    yield case_result
+        finally:
+            try:
+                await session.close()
+            finally:
+                await self.release(worker)
 
-@api_router.get("/problems/{problem_id}", response_model=Problem)
-async def get_problem(problem_id: str):
-    """Get a specific problem by ID"""
-    for prob_data in SAMPLE_PROBLEMS:
-        if prob_data["id"] == problem_id:
-            return Problem(**prob_data)
-    raise HTTPException(status_code=404, detail="Problem not found")
+# Language runners: Python runs inside the harness itself; other languages are built once into the
+# artifact cache and the harness runs the resulting program once per test case, input on stdin
+SANDBOX_OUTPUT_LIMIT = int(os.environ.get('SANDBOX_OUTPUT_LIMIT', 8 * 1024 * 1024))
+COMPILE_TIME_LIMIT = float(os.environ.get('COMPILE_TIME_LIMIT', 30))
+COMPILE_MEMORY_LIMIT = int(os.environ.get('COMPILE_MEMORY_LIMIT', 1024 * 1024 * 1024))  # address space per compiler process
+COMPILE_OUTPUT_LIMIT = int(os.environ.get('COMPILE_OUTPUT_LIMIT', 256 * 1024 * 1024))  # largest file a compiler may write
 
-@api_router.post("/execute", response_model=ExecutionResult)
-async def execute_code(submission: CodeSubmission):
-    """Execute code against test cases"""
-    try:
-        # Find the problem
-        problem_data = None
-        for prob in SAMPLE_PROBLEMS:
-            if prob["id"] == submission.problem_id:
-                problem_data = prob
-                break
+class LanguageRunner:
+    """How submissions in one language are built and run"""
+    name = ""
+    aliases: Tuple[str, ...] = ()
+    harness = False  # True when the harness loads and calls the code itself
+    source_name = ""
+    toolchain: Tuple[str, ...] = ()
+    
+    @functools.cached_property
+    def executables(self) -> Dict[str, Optional[str]]:
+        return {tool: shutil.which(tool) for tool in self.toolchain}
+    
+    def available(self) -> bool:
+        return all(self.executables.values())
+    
+    @functools.cached_property
+    def fingerprint(self) -> str:
+        """Identifies the toolchain build, so artifacts from an upgraded compiler are not reused"""
+        parts = [self.name]
+        for tool, path in self.executables.items():
+            parts.append(f"{tool}={path}:{os.stat(path).st_mtime_ns if path else ''}")
+        parts.extend(self.compile_command("."))
+        return "\0".join(parts)
+    
+    def compile_command(self, directory: str) -> List[str]:
+        """Command run in `directory` (which holds the source) to build it, or [] if there is no build step"""
+        return []
+    
+    def run_command(self, directory: str, limits: Dict[str, Any]) -> List[str]:
+        raise NotImplementedError
+    
+    def sandbox_limits(self, limits: Dict[str, Any]) -> Dict[str, Any]:
+        return dict(limits, output_bytes=SANDBOX_OUTPUT_LIMIT)
+    
+    def compile_limits(self) -> Dict[str, Any]:
+        """Resource limits for each process of the build, in the form sandbox_limits() returns"""
+        return {
+            "memory_bytes": COMPILE_MEMORY_LIMIT,
+            "cpu_seconds": math.ceil(COMPILE_TIME_LIMIT),
+            "output_bytes": COMPILE_OUTPUT_LIMIT
+        }
+
+class PythonRunner(LanguageRunner):
+    name = "python"
+    aliases = ("py", "python3")
+    harness = True
+
+class CRunner(LanguageRunner):
+    name = "c"
+    source_name = "main.c"
+    toolchain = ("gcc",)
+    
+    def compile_command(self, directory: str) -> List[str]:
+        return [self.executables["gcc"] or "gcc", "-O2", "-std=c17", "-pipe", "-o", "main", self.source_name, "-lm"]
+    
+    def run_command(self, directory: str, limits: Dict[str, Any]) -> List[str]:
+        return [os.path.join(directory, "main")]
+
+class CppRunner(LanguageRunner):
+    name = "cpp"
+    aliases = ("c++", "cxx")
+    source_name = "main.cpp"
+    toolchain = ("g++",)
+    
+    def compile_command(self, directory: str) -> List[str]:
+        return [self.executables["g++"] or "g++", "-O2", "-std=c++17", "-pipe", "-o", "main", self.source_name]
+    
+    def run_command(self, directory: str, limits: Dict[str, Any]) -> List[str]:
+        return [os.path.join(directory, "main")]
+
+class JavaRunner(LanguageRunner):
+    name = "java"
+    source_name = "Main.java"
+    toolchain = ("javac", "java")
+    
+    def compile_command(self, directory: str) -> List[str]:
+        heap_mb = COMPILE_MEMORY_LIMIT // (1024 * 1024)
+        return [self.executables["javac"] or "javac", f"-J-Xmx{heap_mb}m", "-encoding", "UTF-8", self.source_name]
+    
+    def run_command(self, directory: str, limits: Dict[str, Any]) -> List[str]:
+        heap_mb = max(limits.get("memory_bytes", 256 * 1024 * 1024) // (1024 * 1024), 16)
+        return [self.executables["java"], f"-Xmx{heap_mb}m", "-Xss64m", "-XX:+UseSerialGC", "-cp", directory, "Main"]
+    
+    def sandbox_limits(self, limits: Dict[str, Any]) -> Dict[str, Any]:
+        # The JVM reserves far more address space than it uses, so memory is capped with -Xmx instead
+        return dict(super().sandbox_limits(limits), memory_bytes=None)
+    
+    def compile_limits(self) -> Dict[str, Any]:
+        # javac runs on the JVM as well, so its heap is capped with -J-Xmx
+        return dict(super().compile_limits(), memory_bytes=None)
+
+class JavaScriptRunner(LanguageRunner):
+    name = "javascript"
+    aliases = ("js", "node")
+    source_name = "main.js"
+    toolchain = ("node",)
+    
+    def run_command(self, directory: str, limits: Dict[str, Any]) -> List[str]:
+        heap_mb = max(limits.get("memory_bytes", 256 * 1024 * 1024) // (1024 * 1024), 16)
+        return [self.executables["node"], f"--max-old-space-size={heap_mb}", os.path.join(directory, self.source_name)]
+    
+    def sandbox_limits(self, limits: Dict[str, Any]) -> Dict[str, Any]:
+        # V8 reserves its heap cage up front, so memory is capped with --max-old-space-size instead
+        return dict(super().sandbox_limits(limits), memory_bytes=None)
+
+LANGUAGE_RUNNERS: Dict[str, LanguageRunner] = {}
+
+def register_runner(runner: LanguageRunner):
+    for name in (runner.name, *runner.aliases):
+        LANGUAGE_RUNNERS[name] = runner
+
+for _runner in (PythonRunner(), CRunner(), CppRunner(), JavaRunner(), JavaScriptRunner()):
+    register_runner(_runner)
+
+def get_runner(language: str) -> Optional[LanguageRunner]:
+    """The runner for a language name or alias, if its toolchain is installed on this host"""
+    runner = LANGUAGE_RUNNERS.get(language.lower())
+    return runner if runner is not None and runner.available() else None
+
+# Compiled artifacts are kept on disk by toolchain and source hash, so a program is built once
+# and reused by every test case, resubmission and server restart
+ARTIFACT_CACHE_DIR = os.environ.get('ARTIFACT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'codeprep-artifacts'))
+ARTIFACT_CACHE_SIZE = int(os.environ.get('ARTIFACT_CACHE_SIZE', 500))
+
+class CompiledArtifact:
+    def __init__(self, key: str, directory: Optional[str] = None, error: Optional[str] = None):
+        self.key = key
+        self.directory = directory
+        self.error = error
+        self.users = 0
+
+def apply_limits(limits: Dict[str, Any]):
+    """setrlimit the calling process as the harness's _apply_limits does; used as a preexec_fn"""
+    if limits.get("memory_bytes"):
+        resource.setrlimit(resource.RLIMIT_AS, (limits["memory_bytes"], limits["memory_bytes"]))
+    if limits.get("cpu_seconds"):
+        resource.setrlimit(resource.RLIMIT_CPU, (limits["cpu_seconds"], limits["cpu_seconds"] + 1))
+    if limits.get("processes") is not None:
+        resource.setrlimit(resource.RLIMIT_NPROC, (limits["processes"], limits["processes"]))
+    if limits.get("output_bytes"):
+        resource.setrlimit(resource.RLIMIT_FSIZE, (limits["output_bytes"], limits["output_bytes"]))
+
+async def run_compiler(command: List[str], cwd: str, limits: Dict[str, Any]) -> Tuple[Optional[str], bool]:
+    """Run a build command, returning (compiler output if it failed, whether that outcome is deterministic)"""
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        cwd=cwd,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        start_new_session=True,
+        preexec_fn=functools.partial(apply_limits, limits)
+    )
+    supervised = deadline_supervisor.watch(process.pid, COMPILE_TIME_LIMIT)
+    try:
+        output, _ = await process.communicate()
+    finally:
+        supervised.cancel()
+        kill_process_group(process.pid)
+    if supervised.expired:
+        return f"Compilation timed out after {COMPILE_TIME_LIMIT:g} seconds", False
+    if process.returncode != 0:
+        return "Compilation error:\n" + output.decode(errors="replace")[-65536:].strip(), True
+    return None, True
+
+class ArtifactCache:
+    """Least recently used set of compiled programs; concurrent requests for the same build share one compile"""
+    
+    def __init__(self, directory: str, max_entries: int):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CompiledArtifact]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def key(runner: LanguageRunner, code: str) -> str:
+        return hashlib.sha256(f"{runner.fingerprint}\0{code}".encode()).hexdigest()
+    
+    def load(self):
+        """Index artifacts left by earlier runs, oldest first, and clear out interrupted builds"""
+        os.makedirs(self.directory, exist_ok=True)
+        entries = sorted(os.scandir(self.directory), key=lambda entry: entry.stat().st_mtime)
+        for entry in entries:
+            if entry.name.startswith("tmp"):
+                shutil.rmtree(entry.path, ignore_errors=True)
+            elif entry.is_dir():
+                self._store(CompiledArtifact(entry.name, entry.path))
+    
+    async def acquire(self, runner: LanguageRunner, code: str) -> CompiledArtifact:
+        """The built program for `code`, pinned against eviction until released"""
+        key = self.key(runner, code)
+        artifact = self._entries.get(key)
+        if artifact is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        else:
+            pending = self._pending.get(key)
+            if pending is None:
+                self.misses += 1
+                pending = self._pending[key] = asyncio.ensure_future(self._build(runner, code, key))
+                pending.add_done_callback(lambda _: self._pending.pop(key, None))
+            else:
+                self.hits += 1
+            # Shielded so one cancelled request does not abort a build others are waiting on
+            artifact = await asyncio.shield(pending)
+        artifact.users += 1
+        return artifact
+    
+    def release(self, artifact: CompiledArtifact):
+        artifact.users -= 1
+    
+    async def _build(self, runner: LanguageRunner, code: str, key: str) -> CompiledArtifact:
+        directory = os.path.join(self.directory, key)
+        if os.path.isdir(directory):
+            # Built by another server process sharing the directory
+            return self._store(CompiledArtifact(key, directory))
+        os.makedirs(self.directory, exist_ok=True)
+        build_dir = tempfile.mkdtemp(prefix="tmp-", dir=self.directory)
+        try:
+            with open(os.path.join(build_dir, runner.source_name), "w") as source_file:
+                source_file.write(code)
+            command = runner.compile_command(build_dir)
+            if command:
+                error, deterministic = await run_compiler(command, build_dir, runner.compile_limits())
+                if error is not None:
+                    artifact = CompiledArtifact(key, error=error)
+                    return self._store(artifact) if deterministic else artifact
+            try:
+                os.rename(build_dir, directory)
+            except OSError:
+                # Another process finished the same build first
+                pass
+            return self._store(CompiledArtifact(key, directory))
+        finally:
+            shutil.rmtree(build_dir, ignore_errors=True)
+    
+    def _store(self, artifact: CompiledArtifact) -> CompiledArtifact:
+        self._entries[artifact.key] = artifact
+        self._entries.move_to_end(artifact.key)
+        if len(self._entries) > self.max_entries:
+            for key in [key for key, entry in self._entries.items() if entry.users == 0][:len(self._entries) - self.max_entries]:
+                evicted = self._entries.pop(key)
+                if evicted.directory:
+                    shutil.rmtree(evicted.directory, ignore_errors=True)
+        return artifact
+
+artifact_cache = ArtifactCache(ARTIFACT_CACHE_DIR, ARTIFACT_CACHE_SIZE)
+
+class ExecutionEngine:
+    """Runs sandboxed child processes on the event loop, bounded by a concurrency limit"""
+    
+    def __init__(self, max_concurrency: int, pool: Optional[SandboxPool] = None):
+        self.max_concurrency = max_concurrency
+        self.pool = pool
+        self.active = 0
+        self.waiting = 0
+        self.batch_seconds = 0.0  # moving average of how long a batch holds its slot
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+    
+    async def run_batch(self, runner: LanguageRunner, code: str, inputs: List[Any], time_limit: float = 5, limits: Optional[Dict[str, Any]] = None,
+                        entry_point: Optional[str] = None, args_blob: Optional[str] = None,
+                        expected_paths: Optional[List[Optional[str]]] = None,
+                        ladder: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Run a batch of test inputs in one sandbox once a slot is free.
         
-        if not problem_data:
-            raise HTTPException(status_code=404, detail="Problem not found")
+        Harness languages call `entry_point` with the argument lists in `args_blob` when one is given;
+        other languages always read each input on stdin and have their output checked against
+        `expected_paths` in the sandbox where those are given. Results for a complexity `ladder`
+        follow those of the inputs.
+        """
+        self.waiting += 1
+        try:
+            with stage_timer("queue_wait"):
+                await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        started = time.perf_counter()
+        try:
+            self.active += 1
+            try:
+                if runner.harness:
+                    case_results = self._execute(BatchJob(code, inputs, time_limit, limits or {}, entry_point=entry_point, args_blob=args_blob, ladder=ladder))
+                else:
+                    case_results = self._run_compiled(runner, code, inputs, time_limit, limits or {}, expected_paths, ladder)
+                async with aclosing(case_results):
+                    async for case_result in case_results:
+                        yield case_result
+            finally:
+                self.active -= 1
+                self.batch_seconds += 0.1 * (time.perf_counter() - started - self.batch_seconds)
+        finally:
+            self._semaphore.release()
+    
+    def _execute(self, job: BatchJob) -> AsyncIterator[Dict[str, Any]]:
+        if self.pool is not None:
+            return self.pool.execute_batch(job)
+        return execute_batch(job)
+    
+    async def _run_compiled(self, runner: LanguageRunner, code: str, inputs: List[Any], time_limit: float, limits: Dict[str, Any],
+                            expected_paths: Optional[List[Optional[str]]] = None,
+                            ladder: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Build the program once (or reuse the cached build), then run it for every input"""
+        try:
+            with stage_timer("compile"):
+                artifact = await artifact_cache.acquire(runner, code)
+        except Exception as e:
+            for _ in inputs:
+                yield _error_result(f"Execution error: {str(e)}", verdict="Execution error")
+            return
+        try:
+            if artifact.error is not None:
+                for _ in inputs:
+                    yield _error_result(artifact.error, verdict="Compilation failed")
+                return
+            command = runner.run_command(artifact.directory, limits)
+            case_results = self._execute(BatchJob("", inputs, time_limit, runner.sandbox_limits(limits), command=command,
+                                                  expected_paths=expected_paths, ladder=ladder))
+            async with aclosing(case_results):
+                async for case_result in case_results:
+                    if case_result.get("error"):
+                        # Tracebacks name the cached build's path, which means nothing to the user
+                        case_result["error"] = case_result["error"].replace(artifact.directory + os.sep, "")
+                    yield case_result
+        finally:
+            artifact_cache.release(artifact)
+
+sandbox_pool = SandboxPool(SANDBOX_POOL_SIZE, SANDBOX_MAX_TASKS_PER_WORKER, SANDBOX_IDLE_SECONDS) if SANDBOX_POOL_SIZE > 0 else None
+execution_engine = ExecutionEngine(EXECUTION_CONCURRENCY, sandbox_pool)
+
+# Result cache: identical code judged against an unchanged test set reuses the earlier result
+EXECUTION_CACHE_SIZE = int(os.environ.get('EXECUTION_CACHE_SIZE', 10000))
+EXECUTION_CACHE_TTL = float(os.environ.get('EXECUTION_CACHE_TTL', 3600))
+EXECUTION_CACHE_MONGO = os.environ.get('EXECUTION_CACHE_MONGO', 'false').lower() in ('1', 'true', 'yes')
+
+def normalize_code(code: str, language: str = "python") -> str:
+    """Canonical form of a submission: comments, blank lines and insignificant spacing removed"""
+    code = code.replace('\r\n', '\n').replace('\r', '\n')
+    if language == "python":
+        try:
+            tokens = [
+                (token.type, token.string)
+                for token in tokenize.generate_tokens(io.StringIO(code).readline)
+                if token.type not in (tokenize.COMMENT, tokenize.NL)
+            ]
+            return tokenize.untokenize(tokens)
+        except (tokenize.TokenError, IndentationError, SyntaxError):
+            pass
+    return '\n'.join(line.rstrip() for line in code.split('\n') if line.strip())
+
+def test_set_version(problem_data: Dict[str, Any]) -> str:
+    """Fingerprint of everything about a problem that can change a verdict"""
+    if "_test_set_version" in problem_data:
+        return problem_data["_test_set_version"]
+    judged = {
+        "test_cases": problem_data["test_cases"],
+        "time_limit": problem_data.get("time_limit", 5),
+        "limits": sandbox_limits(problem_data),
+        "entry_point": problem_data.get("entry_point"),
+        "parameters": problem_data.get("parameters"),
+        "return_type": problem_data.get("return_type"),
+        "comparator": problem_data.get("comparator"),
+        "float_tolerance": problem_data.get("float_tolerance")
+    }
+    if problem_data.get("complexity"):
+        judged["complexity"] = problem_data["complexity"]
+    return hashlib.sha256(json.dumps(judged, sort_keys=True).encode()).hexdigest()
+
+def is_cacheable(result: "ExecutionResult") -> bool:
+    # Timeouts depend on host load and execution errors on the sandbox itself, so re-run those
+    if any(
+        (test.get("error") or "").startswith(("Code execution timed out", "Compilation timed out", "Execution error"))
+        for test in result.test_results
+    ):
+        return False
+    # So do a complexity ladder that ran out of time (no estimate but out of bound) and a curve
+    # fit that failed an enforced bound, which may be a borderline measurement on a busy host
+    complexity = result.complexity
+    return not (complexity is not None and complexity.within_bound is False
+                and (complexity.estimated is None or complexity.enforced))
+
+class ResultCache:
+    """In-process LRU of execution results with TTL expiry, optionally backed by the execution_cache collection"""
+    
+    def __init__(self, max_entries: int, ttl: float, use_mongo: bool = False):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.use_mongo = use_mongo
+        self._entries: "OrderedDict[str, Tuple[float, ExecutionResult]]" = OrderedDict()
+        self.hits = 0
+        self.mongo_hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    @staticmethod
+    def key(problem_id: str, language: str, code: str, version: str) -> str:
+        normalized = normalize_code(code, language)
+        return hashlib.sha256(f"{problem_id}\0{language}\0{version}\0{normalized}".encode()).hexdigest()
+    
+    async def get(self, key: str) -> Optional["ExecutionResult"]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            stored_at, result = entry
+            if time.monotonic() - stored_at <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+            del self._entries[key]
         
-        # Execute against all test cases
-        test_results = []
-        passed_count = 0
+        if self.use_mongo:
+            try:
+                doc = await db.execution_cache.find_one({"_id": key})
+            except Exception as e:
+                logger.warning(f"Execution cache lookup failed: {str(e)}")
+                doc = None
+            if doc and (datetime.utcnow() - doc["created_at"]).total_seconds() <= self.ttl:
+                result = ExecutionResult(**doc["result"])
+                self._store(key, result)
+                self.mongo_hits += 1
+                return result
         
-        for i, test_case in enumerate(problem_data["test_cases"]):
-            execution_result = execute_python_code(
-                submission.code, 
-                test_case["input"], 
-                problem_data.get("time_limit", 5)
+        self.misses += 1
+        return None
+    
+    async def put(self, key: str, result: "ExecutionResult"):
+        if not is_cacheable(result):
+            return
+        self._store(key, result)
+        if self.use_mongo:
+            try:
+                await db.execution_cache.replace_one(
+                    {"_id": key},
+                    {"_id": key, "result": result.dict(), "created_at": datetime.utcnow()},
+                    upsert=True
+                )
+            except Exception as e:
+                logger.warning(f"Execution cache write failed: {str(e)}")
+    
+    def _store(self, key: str, result: "ExecutionResult"):
+        self._entries[key] = (time.monotonic(), result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    async def ensure_indexes(self):
+        if self.use_mongo:
+            await db.execution_cache.create_index("created_at", expireAfterSeconds=int(self.ttl))
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.mongo_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "mongo_tier": self.use_mongo,
+            "hits": self.hits,
+            "mongo_hits": self.mongo_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.mongo_hits) / lookups if lookups else 0.0
+        }
+
+result_cache = ResultCache(EXECUTION_CACHE_SIZE, EXECUTION_CACHE_TTL, EXECUTION_CACHE_MONGO)
+
+# Test data store: large inputs and expected outputs live as files named by their sha256, so they are
+# handed to the sandbox by path and never travel inside problem documents, API responses or job lines
+TEST_DATA_DIR = os.environ.get('TEST_DATA_DIR', str(ROOT_DIR / 'test_data'))
+TEST_PREVIEW_BYTES = 256
+
+class TestDataStore:
+    """Content-addressed directory of test files"""
+    
+    def __init__(self, directory: str):
+        self.directory = directory
+    
+    def path(self, digest: str) -> str:
+        if not re.fullmatch(r"[0-9a-f]{64}", digest):
+            raise ValueError(f"Invalid test file digest '{digest}'")
+        return os.path.join(self.directory, digest[:2], digest)
+    
+    def exists(self, digest: str) -> bool:
+        try:
+            return os.path.isfile(self.path(digest))
+        except ValueError:
+            return False
+    
+    async def put(self, chunks: AsyncIterator[bytes]) -> Tuple[str, int]:
+        """Store a stream of bytes, returning its digest and size"""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix="tmp-", dir=self.directory)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                async for chunk in chunks:
+                    digest.update(chunk)
+                    tmp_file.write(chunk)
+                    size += len(chunk)
+            path = self.path(digest.hexdigest())
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Same name means same content, so replacing an existing copy is harmless
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return digest.hexdigest(), size
+    
+    def preview(self, digest: str) -> str:
+        """The start of a test file, for showing in results"""
+        path = self.path(digest)
+        with open(path, "rb") as test_file:
+            head = test_file.read(TEST_PREVIEW_BYTES)
+        return truncate_preview(head.decode(errors="replace"), os.path.getsize(path))
+
+def truncate_preview(text: str, size: Optional[int] = None) -> str:
+    size = len(text) if size is None else size
+    if size <= TEST_PREVIEW_BYTES:
+        return text
+    return f"{text[:TEST_PREVIEW_BYTES]}... ({size} bytes)"
+
+def text_matches_file(text: str, path: str, chunk_size: int = 1 << 20) -> bool:
+    """Compare output with an expected-output file, both stripped, without reading the file into memory"""
+    actual = text.strip().encode()
+    with open(path, "rb") as expected_file:
+        if os.fstat(expected_file.fileno()).st_size == 0:
+            return not actual
+        with mmap.mmap(expected_file.fileno(), 0, access=mmap.ACCESS_READ) as expected:
+            start = 0
+            while start < len(expected) and expected[start] in b" \t\n\r\x0b\x0c":
+                start += 1
+            end = len(expected)
+            while end > start and expected[end - 1] in b" \t\n\r\x0b\x0c":
+                end -= 1
+            if end - start != len(actual):
+                return False
+            return all(
+                expected[start + offset:start + min(offset + chunk_size, len(actual))] == actual[offset:offset + chunk_size]
+                for offset in range(0, len(actual), chunk_size)
             )
+
+test_data_store = TestDataStore(TEST_DATA_DIR)
+
+# Structured judging: test cases of problems with an entry point are parsed and type-checked once
+# per catalog load, and verdicts compare values instead of printed text
+SCALAR_TYPES = {
+    "any": lambda value: True,
+    "int": lambda value: isinstance(value, int) and not isinstance(value, bool),
+    "float": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "str": lambda value: isinstance(value, str),
+    "bool": lambda value: isinstance(value, bool)
+}
+
+def check_type_name(type_name: str):
+    while type_name.startswith("list[") and type_name.endswith("]"):
+        type_name = type_name[5:-1]
+    if type_name not in SCALAR_TYPES:
+        raise ValueError(f"Unknown type '{type_name}'")
+
+def matches_type(value: Any, type_name: str) -> bool:
+    if type_name.startswith("list["):
+        item_type = type_name[5:-1]
+        return isinstance(value, list) and all(matches_type(item, item_type) for item in value)
+    return SCALAR_TYPES[type_name](value)
+
+class StructuredTests:
+    """A problem's test cases as argument lists and expected values, the arguments serialized once for the harness.
+    
+    Cases stored in the test data store stay there: their arguments are {"path": ...} references the
+    sandbox reads itself, and their expected values are loaded only when a verdict needs them.
+    """
+    
+    def __init__(self, args: List[Any], expected: List[Any], expected_files: List[Optional[str]]):
+        self.args = args
+        self.expected = expected
+        self.expected_files = expected_files
+        self.args_blob = json.dumps(args)
+    
+    def expected_value(self, index: int) -> Any:
+        path = self.expected_files[index]
+        return load_json_file(path) if path else self.expected[index]
+    
+    @functools.cached_property
+    def stdin_inputs(self) -> List[Any]:
+        # Programs in other languages read the same arguments, one JSON value per line
+        return [
+            case_args if isinstance(case_args, dict) else "\n".join(json.dumps(arg) for arg in case_args)
+            for case_args in self.args
+        ]
+
+@functools.lru_cache(maxsize=8)
+def load_json_file(path: str) -> Any:
+    with open(path, "rb") as json_file:
+        return json.load(json_file)
+
+def parse_arguments(text: str) -> List[Any]:
+    return [json.loads(line) for line in text.strip().split("\n")] if text.strip() else []
+
+def check_arguments(case_args: List[Any], parameters: List[Dict[str, Any]], label: str):
+    """Raise ValueError if an argument list does not fit the declared parameters"""
+    if not parameters:
+        return
+    if len(case_args) != len(parameters):
+        raise ValueError(f"{label} has {len(case_args)} arguments, expected {len(parameters)}")
+    for parameter, arg in zip(parameters, case_args):
+        if not matches_type(arg, parameter["type"]):
+            raise ValueError(f"{label}: argument {parameter['name']} is not of type {parameter['type']}")
+
+def check_test_files(problem_data: Dict[str, Any]):
+    """Raise ValueError if a test case references a file missing from the test data store"""
+    for number, test_case in enumerate(problem_data["test_cases"], 1):
+        for digest in (test_case.get("input_file"), test_case.get("expected_file")):
+            if digest and not test_data_store.exists(digest):
+                raise ValueError(f"Test case {number}: test file {digest} is not in the test data store")
+
+def compile_structured_tests(problem_data: Dict[str, Any], read_files: bool = False) -> StructuredTests:
+    """Parse and type-check a problem's test cases, raising ValueError on the first bad one.
+    
+    Test files are only parsed and checked with `read_files`, as when a problem is saved; the
+    catalog skips them so loading stays cheap however large they are.
+    """
+    if not problem_data["entry_point"].isidentifier():
+        raise ValueError(f"Entry point '{problem_data['entry_point']}' is not a valid function name")
+    parameters = problem_data.get("parameters") or []
+    return_type = problem_data.get("return_type", "any")
+    for type_name in [parameter["type"] for parameter in parameters] + [return_type]:
+        check_type_name(type_name)
+    
+    args, expected, expected_files = [], [], []
+    for number, test_case in enumerate(problem_data["test_cases"], 1):
+        input_path = test_data_store.path(test_case["input_file"]) if test_case.get("input_file") else None
+        expected_path = test_data_store.path(test_case["expected_file"]) if test_case.get("expected_file") else None
+        case_args = value = None
+        try:
+            if input_path is None:
+                case_args = parse_arguments(test_case["input"])
+            elif read_files:
+                with open(input_path, "rb") as input_file:
+                    case_args = parse_arguments(input_file.read().decode())
+            if expected_path is None:
+                value = json.loads(test_case["expected_output"])
+            elif read_files:
+                value = load_json_file(expected_path)
+        except ValueError as e:
+            raise ValueError(f"Test case {number} is not valid JSON: {str(e)}")
+        if case_args is not None:
+            check_arguments(case_args, parameters, f"Test case {number}")
+        if (expected_path is None or read_files) and not matches_type(value, return_type):
+            raise ValueError(f"Test case {number}: expected output is not of type {return_type}")
+        args.append({"path": input_path} if input_path else case_args)
+        expected.append(None if expected_path else value)
+        expected_files.append(expected_path)
+    return StructuredTests(args, expected, expected_files)
+
+def structured_tests(problem_data: Dict[str, Any]) -> StructuredTests:
+    """The catalog's pre-parsed tests, or parse them now for a problem that did not come from the catalog"""
+    return problem_data.get("_structured_tests") or compile_structured_tests(problem_data)
+
+def values_equal(actual: Any, expected: Any, tolerance: Optional[float] = None) -> bool:
+    if isinstance(actual, bool) or isinstance(expected, bool):
+        return actual is expected
+    if isinstance(actual, (int, float)) and isinstance(expected, (int, float)):
+        if tolerance is None:
+            return actual == expected
+        return math.isclose(actual, expected, rel_tol=tolerance, abs_tol=tolerance)
+    if isinstance(actual, list) and isinstance(expected, list):
+        return len(actual) == len(expected) and all(values_equal(a, e, tolerance) for a, e in zip(actual, expected))
+    if isinstance(actual, dict) and isinstance(expected, dict):
+        return actual.keys() == expected.keys() and all(values_equal(actual[key], expected[key], tolerance) for key in expected)
+    return actual == expected
+
+def values_match(actual: Any, expected: Any, problem_data: Dict[str, Any]) -> bool:
+    """Compare a returned value with the expected one using the problem's comparator"""
+    comparator = problem_data.get("comparator", "exact")
+    if comparator == "unordered" and isinstance(actual, list) and isinstance(expected, list):
+        canonical = lambda value: json.dumps(value, sort_keys=True)
+        return sorted(map(canonical, actual)) == sorted(map(canonical, expected))
+    return values_equal(actual, expected, problem_data.get("float_tolerance", 1e-6) if comparator == "float" else None)
+
+def parse_output(output: str) -> Any:
+    """Read a program's printed answer as JSON, falling back to the raw text"""
+    try:
+        return json.loads(output)
+    except ValueError:
+        return output
+
+def redact_hidden(test_result: Dict[str, Any], verdict: Optional[str]) -> Dict[str, Any]:
+    """Blank out a hidden test case's input, expected and actual output, and replace its error with the
+    server's verdict; anything the submission wrote, on stderr or in a traceback, could quote them"""
+    error = (verdict or "Runtime error") if test_result["error"] else None
+    test_result.update(input="[hidden]", expected_output="[hidden]", actual_output="", error=error, hidden=True)
+    test_result.pop("stdout", None)
+    return test_result
+
+def present_test_case(test_result: Dict[str, Any], test_case: Dict[str, Any], verdict: Optional[str] = None) -> Dict[str, Any]:
+    """Redact hidden cases and shorten file-backed ones to previews"""
+    if test_case.get("hidden"):
+        return redact_hidden(test_result, verdict)
+    if test_case.get("input_file") or test_case.get("expected_file"):
+        if test_case.get("input_file"):
+            test_result["input"] = test_data_store.preview(test_case["input_file"])
+        if test_case.get("expected_file"):
+            test_result["expected_output"] = test_data_store.preview(test_case["expected_file"])
+        test_result["actual_output"] = truncate_preview(test_result["actual_output"])
+    return test_result
+
+DEFAULT_JUDGE_POLICY = os.environ.get('DEFAULT_JUDGE_POLICY', 'full')
+TIME_LIMIT_ERRORS = ("Code execution timed out", "CPU time limit exceeded")
+
+def judge_policy(submission: CodeSubmission, problem_data: Dict[str, Any]) -> str:
+    return submission.judge_policy or problem_data.get("judge_policy") or DEFAULT_JUDGE_POLICY
+
+def stops_judging(policy: str, test_result: Dict[str, Any]) -> bool:
+    if policy == "first_failure":
+        return not test_result["passed"]
+    if policy == "first_timeout":
+        return (test_result["error"] or "").startswith(TIME_LIMIT_ERRORS)
+    return False
+
+def skipped_result(i: int, test_case: Dict[str, Any], stopped_at: int) -> Dict[str, Any]:
+    test_result = {
+        "test_case": i + 1,
+        "input": test_case["input"],
+        "expected_output": test_case["expected_output"].strip(),
+        "actual_output": "",
+        "passed": False,
+        "error": f"Not run: judging stopped at test case {stopped_at}",
+        "skipped": True,
+        "execution_time": 0,
+        "cpu_time": 0,
+        "memory_kb": 0
+    }
+    return present_test_case(test_result, test_case, verdict=test_result["error"])
+
+async def unsupported_language_results(language: str, case_count: int) -> AsyncIterator[Dict[str, Any]]:
+    for _ in range(case_count):
+        message = f"Unsupported language: {language}"
+        yield _error_result(message, verdict=message)
+
+async def iter_test_results(submission: CodeSubmission, problem_data: Dict[str, Any],
+                            ladder_results: Optional[List[Dict[str, Any]]] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Judge a submission against a problem's test cases, yielding each case's result as soon as it finishes.
+    
+    When the judging policy stops early the sandbox is killed straight away and the remaining
+    cases are reported as skipped. Given `ladder_results`, a submission that passes every case
+    is then timed on the problem's complexity ladder and the raw results are appended there.
+    """
+    test_cases = problem_data["test_cases"]
+    policy = judge_policy(submission, problem_data)
+    runner = get_runner(submission.language)
+    structured = structured_tests(problem_data) if problem_data.get("entry_point") else None
+    if runner is None:
+        execution_results = unsupported_language_results(submission.language, len(test_cases))
+    else:
+        if structured is not None and not runner.harness:
+            inputs = structured.stdin_inputs
+        else:
+            inputs = [
+                {"path": test_data_store.path(test_case["input_file"])} if test_case.get("input_file") else test_case["input"]
+                for test_case in test_cases
+            ]
+        expected_paths = None
+        if structured is None and not runner.harness and any(test_case.get("expected_file") for test_case in test_cases):
+            expected_paths = [
+                test_data_store.path(test_case["expected_file"]) if test_case.get("expected_file") else None
+                for test_case in test_cases
+            ]
+        execution_results = execution_engine.run_batch(
+            runner,
+            submission.code,
+            inputs,
+            problem_data.get("time_limit", 5),
+            sandbox_limits(problem_data),
+            entry_point=problem_data.get("entry_point"),
+            args_blob=structured.args_blob if structured is not None else None,
+            expected_paths=expected_paths
+        )
+    
+    all_passed = True
+    async with aclosing(execution_results):
+        i = 0
+        async for execution_result in execution_results:
+            compare_started = time.perf_counter()
+            test_case = test_cases[i]
+            success = execution_result["success"]
+            actual = (execution_result.get("output") or "").strip()
+            stdout = None
+            if "matched" in execution_result:
+                # Compared against the expected-output file inside the sandbox
+                passed = success and execution_result["matched"]
+            elif structured is not None:
+                if "result" in execution_result:
+                    stdout, actual = actual, json.dumps(execution_result["result"])
+                    value = execution_result["result"]
+                else:
+                    value = parse_output(actual)
+                passed = success and values_match(value, structured.expected_value(i), problem_data)
+            elif test_case.get("expected_file"):
+                passed = success and text_matches_file(actual, test_data_store.path(test_case["expected_file"]))
+            else:
+                passed = success and actual == test_case["expected_output"].strip()
+            observe_stage("compare", time.perf_counter() - compare_started)
             
-            expected = test_case["expected_output"].strip()
-            actual = execution_result.get("output", "").strip()
-            
-            passed = execution_result["success"] and actual == expected
-            if passed:
-                passed_count += 1
+            error = execution_result.get("error")
+            if error and error.startswith("Code execution timed out"):
+                judge_timeouts_total.inc(**judge_labels.get())
+            elif error:
+                judge_runtime_errors_total.inc(**judge_labels.get())
             
-            test_results.append({
+            test_result = {
                 "test_case": i + 1,
                 "input": test_case["input"],
-                "expected_output": expected,
+                "expected_output": test_case["expected_output"].strip(),
                 "actual_output": actual,
                 "passed": passed,
-                "error": execution_result.get("error"),
-                "execution_time": execution_result.get("execution_time", 0)
-            })
+                "error": error,
+                "execution_time": execution_result.get("execution_time", 0),
+                "cpu_time": execution_result.get("cpu_time", 0),
+                "memory_kb": execution_result.get("memory_kb", 0)
+            }
+            if stdout is not None:
+                # What the function printed, kept apart from the value it returned
+                test_result["stdout"] = stdout
+            stop = stops_judging(policy, test_result)
+            all_passed = all_passed and passed
+            yield present_test_case(test_result, test_case, verdict=execution_result.get("verdict"))
+            i += 1
+            if stop:
+                break
+    
+    # Leaving the block above closed the batch, so the sandbox is already free
+    if i < len(test_cases):
+        judge_skipped_total.inc(len(test_cases) - i, **judge_labels.get())
+    for j in range(i, len(test_cases)):
+        yield skipped_result(j, test_cases[j], stopped_at=i)
+    
+    if ladder_results is not None and problem_data.get("complexity") and runner is not None and all_passed and i == len(test_cases):
+        await run_complexity_ladder(runner, submission.code, problem_data, ladder_results)
+
+async def run_complexity_ladder(runner: LanguageRunner, code: str, problem_data: Dict[str, Any], ladder_results: List[Dict[str, Any]]):
+    """Run a submission on its problem's generated inputs of growing size, in a sandbox of its own.
+    
+    The harness generates the inputs before the submitted code is loaded, so only submissions
+    that passed every test case pay for them. Stops at the first size that runs out of time.
+    """
+    time_limit = problem_data.get("time_limit", 5)
+    limits = dict(sandbox_limits(problem_data), cpu_seconds=math.ceil(time_limit * ladder_run_count(problem_data)))
+    execution_results = execution_engine.run_batch(
+        runner,
+        code,
+        [],
+        time_limit,
+        limits,
+        entry_point=problem_data["entry_point"],
+        args_blob="[]",
+        ladder=problem_data["complexity"]
+    )
+    async with aclosing(execution_results):
+        async for execution_result in execution_results:
+            ladder_results.append(execution_result)
+            if (execution_result.get("error") or "").startswith(TIME_LIMIT_ERRORS):
+                # Larger sizes would only run out of time as well
+                break
+
+# Complexity judging: candidate growth functions, simplest first
+COMPLEXITY_MODELS = (
+    ("O(1)", lambda n: 1.0),
+    ("O(log n)", lambda n: math.log2(n)),
+    ("O(n)", lambda n: float(n)),
+    ("O(n log n)", lambda n: n * math.log2(n)),
+    ("O(n^2)", lambda n: float(n) ** 2),
+    ("O(n^3)", lambda n: float(n) ** 3),
+)
+COMPLEXITY_RANKS = {name: rank for rank, (name, _) in enumerate(COMPLEXITY_MODELS)}
+# Sizes whose fastest run is below this are mostly timer noise and are left out of the fit
+COMPLEXITY_MIN_SECONDS = float(os.environ.get('COMPLEXITY_MIN_SECONDS', 0.01))
+# A simpler class is preferred while its mean squared log error is within this much of the best fit's
+COMPLEXITY_FIT_SLACK = float(os.environ.get('COMPLEXITY_FIT_SLACK', 0.05))
+
+def fit_complexity(samples: List[Tuple[int, float]]) -> str:
+    """Fit time = c * f(n) for every class in log space and pick the simplest that fits about as well as the best.
+    
+    Relative rather than absolute error keeps the largest size from drowning out the rest. Caches
+    make real timings grow a little faster than the operation count, and O(n) and O(n log n) are
+    hard to tell apart over a few doublings, so close calls go to the simpler class and
+    enforcement errs on the lenient side.
+    """
+    errors = []
+    for _, growth in COMPLEXITY_MODELS:
+        residuals = [math.log(max(seconds, 1e-6)) - math.log(growth(n)) for n, seconds in samples]
+        mean = sum(residuals) / len(residuals)
+        errors.append(sum((r - mean) ** 2 for r in residuals) / len(residuals))
+    best = min(errors)
+    return next(name for (name, _), error in zip(COMPLEXITY_MODELS, errors) if error <= best + COMPLEXITY_FIT_SLACK)
+
+def assess_complexity(problem_data: Dict[str, Any], test_results: List[Dict[str, Any]],
+                      ladder_results: List[Dict[str, Any]]) -> Optional[ComplexityReport]:
+    """Fit the complexity runs that followed the test cases and compare the class with the expected one.
+    
+    Run times are measured outside the submitted code's process (see stream_batch_results), so
+    nothing the submission patches in the harness changes the fit.
+    """
+    spec = problem_data.get("complexity")
+    if not spec:
+        return None
+    report = ComplexityReport(expected=spec["expected"], enforced=spec["enforce"])
+    if not all(test_result["passed"] for test_result in test_results):
+        report.note = "Not measured: the submission did not pass every test case"
+        return report
+    
+    repeats = spec["repeats"]
+    problem = None
+    for k, n in enumerate(spec["sizes"]):
+        runs = ladder_results[k * repeats:(k + 1) * repeats]
+        times = [run["cpu_time"] for run in runs if run["success"]]
+        report.samples.append(ComplexitySample(n=n, cpu_time=min(times) if len(times) == repeats else None))
+        failed = next((run for run in runs if not run["success"]), None)
+        if problem is None and failed is not None:
+            problem = (n, failed["error"] or "")
+        elif problem is None and len(runs) < repeats:
+            problem = (n, "Not run")
+    
+    if problem is not None:
+        n, error = problem
+        if error.startswith(TIME_LIMIT_ERRORS):
+            report.note = f"Ran out of time at n={n}"
+            report.within_bound = False
+        else:
+            report.note = f"Failed at n={n}: {error.strip().splitlines()[-1] if error.strip() else 'no result'}"
+        return report
+    measured = [(sample.n, sample.cpu_time) for sample in report.samples if sample.cpu_time >= COMPLEXITY_MIN_SECONDS]
+    if len(measured) < 3:
+        report.note = "Runs were too fast to measure; the problem needs larger sizes"
+        return report
+    report.estimated = fit_complexity(measured)
+    report.within_bound = COMPLEXITY_RANKS[report.estimated] <= COMPLEXITY_RANKS[spec["expected"]]
+    return report
+
+def check_complexity(problem_data: Dict[str, Any]):
+    """Raise ValueError if a problem's complexity spec cannot be run"""
+    spec = problem_data.get("complexity")
+    if not spec:
+        return
+    if not problem_data.get("entry_point"):
+        raise ValueError("Complexity judging needs an entry_point: the generator produces its arguments")
+    sizes = spec["sizes"]
+    if len(sizes) < 3 or sizes[0] < 2 or any(b <= a for a, b in zip(sizes, sizes[1:])):
+        raise ValueError("Complexity sizes must be at least three increasing integers from 2 up")
+    if not 1 <= spec["repeats"] <= 10:
+        raise ValueError("Complexity repeats must be between 1 and 10")
+    try:
+        compile(spec["generator"], "<generator>", "exec")
+    except SyntaxError as e:
+        raise ValueError(f"Complexity generator does not compile: {str(e)}")
+
+def summarize_test_results(test_results: List[Dict[str, Any]], total_tests: int,
+                           complexity: Optional[ComplexityReport] = None) -> ExecutionResult:
+    """Build the overall result from the per-case results that were run"""
+    passed_count = sum(1 for tr in test_results if tr["passed"])
+    
+    # Overall result
+    overall_success = passed_count == total_tests
+    output = f"Passed {passed_count}/{total_tests} test cases"
+    if complexity is not None and complexity.enforced and complexity.within_bound is False:
+        overall_success = False
+        output += f"; time complexity {complexity.estimated or 'too slow'}, expected {complexity.expected}"
+    
+    return ExecutionResult(
+        success=overall_success,
+        output=output,
+        complexity=complexity,
+        test_results=test_results,
+        total_passed=passed_count,
+        total_tests=total_tests,
+        host_factor=host_calibration.factor,
+        execution_time=sum(tr.get("execution_time", 0) for tr in test_results),
+        cpu_time=sum(tr.get("cpu_time", 0) for tr in test_results),
+        peak_memory_kb=max((tr.get("memory_kb", 0) for tr in test_results), default=0)
+    )
+
+async def run_test_cases(submission: CodeSubmission, problem_data: Dict[str, Any]) -> ExecutionResult:
+    """Judge a submission against every test case of a problem"""
+    ladder_results: List[Dict[str, Any]] = []
+    test_results = [test_result async for test_result in iter_test_results(submission, problem_data, ladder_results)]
+    complexity = assess_complexity(problem_data, test_results, ladder_results)
+    return summarize_test_results(test_results, len(problem_data["test_cases"]), complexity)
+
+def submission_cache_key(submission: CodeSubmission, problem_data: Dict[str, Any]) -> str:
+    version = test_set_version(problem_data)
+    policy = judge_policy(submission, problem_data)
+    if policy != "full":
+        # An early-exit result is not a full report, so it must not answer a request for one
+        version = f"{version}:{policy}"
+    return ResultCache.key(submission.problem_id, submission.language, submission.code, version)
+
+def resolve_language(submission: CodeSubmission):
+    """Reject languages this host cannot run and rewrite aliases such as "c++" to the runner's name"""
+    runner = get_runner(submission.language)
+    if runner is None:
+        raise HTTPException(status_code=400, detail=f"Unsupported language: {submission.language}")
+    submission.language = runner.name
+
+def set_judge_labels(submission: CodeSubmission):
+    judge_labels.set({"problem": submission.problem_id, "language": submission.language})
+
+async def judge_submission(submission: CodeSubmission, problem_data: Dict[str, Any]) -> ExecutionResult:
+    """Judge a submission, reusing the cached result of an identical earlier run when there is one"""
+    set_judge_labels(submission)
+    cache_key = submission_cache_key(submission, problem_data)
+    result = await result_cache.get(cache_key)
+    if result is None:
+        result = await run_test_cases(submission, problem_data)
+        await result_cache.put(cache_key, result)
+    return result
+
+# Runs try code on the sample or a custom input: one case, a shorter time limit, nothing cached or saved
+RUN_TIME_LIMIT = float(os.environ.get('RUN_TIME_LIMIT', 2))
+RUN_INPUT_LIMIT = int(os.environ.get('RUN_INPUT_LIMIT', 64 * 1024))
+
+def run_problem(problem_data: Dict[str, Any], custom_input: Optional[str]) -> Dict[str, Any]:
+    """A one-case copy of a problem holding the sample, or the custom input with no expected output.
+    
+    Raises ValueError when the sample or custom input for a function problem does not fit its
+    parameters, or the sample output its return type.
+    """
+    test_input = problem_data["sample_input"] if custom_input is None else custom_input
+    expected_output = problem_data["sample_output"] if custom_input is None else ""
+    run_data = {key: value for key, value in problem_data.items() if not key.startswith("_")}
+    run_data.update(
+        test_cases=[{"input": test_input, "expected_output": expected_output}],
+        time_limit=min(problem_data.get("time_limit", 5), RUN_TIME_LIMIT),
+        cpu_limit=None,
+        judge_policy="full",
+        complexity=None
+    )
+    if problem_data.get("entry_point") and custom_input is None:
+        run_data["_structured_tests"] = compile_structured_tests(run_data)
+    elif problem_data.get("entry_point"):
+        try:
+            case_args = parse_arguments(test_input)
+        except ValueError as e:
+            raise ValueError(f"Input is not valid JSON: {str(e)}")
+        check_arguments(case_args, problem_data.get("parameters") or [], "Input")
+        run_data["_structured_tests"] = StructuredTests([case_args], [None], [None])
+    return run_data
+
+# Problem catalog: problems live in the problems collection and are served from memory,
+# validated and serialized once per version
+PROBLEM_CATALOG_REFRESH_SECONDS = float(os.environ.get('PROBLEM_CATALOG_REFRESH_SECONDS', 5))
+
+class ProblemCatalog:
+    """Dict-indexed, pre-serialized view of the problems collection, reloaded when its version counter moves"""
+    
+    def __init__(self, refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self.version = None
+        self._problems: Dict[str, Dict[str, Any]] = {}
+        self._bodies: Dict[str, bytes] = {}
+        self._etags: Dict[str, str] = {}
+        self._list_body = b"[]"
+        self._list_etag = '"empty"'
+        self._lock = asyncio.Lock()
+        self._refresher = None
+    
+    @staticmethod
+    def _etag(body: bytes) -> str:
+        return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    
+    async def _stored_version(self) -> int:
+        meta = await db.catalog_meta.find_one({"_id": "problems"})
+        return meta["version"] if meta else 0
+    
+    async def seed(self):
+        """Insert the sample problems that are not in the collection yet"""
+        await db.problems.create_index("id", unique=True)
+        inserted = 0
+        for prob_data in SAMPLE_PROBLEMS:
+            update = await db.problems.update_one(
+                {"id": prob_data["id"]},
+                {"$setOnInsert": Problem(**prob_data).dict()},
+                upsert=True
+            )
+            inserted += 1 if update.upserted_id is not None else 0
+        if inserted:
+            await self._bump_version()
+    
+    async def load(self):
+        """Rebuild the in-memory index from the problems collection"""
+        async with self._lock:
+            version = await self._stored_version()
+            problems, bodies, etags, listing = {}, {}, {}, []
+            async for doc in db.problems.find({}, {"_id": 0}).sort("created_at", 1):
+                try:
+                    problem = Problem(**doc)
+                except ValueError as e:
+                    logger.error(f"Skipping invalid problem {doc.get('id')}: {str(e)}")
+                    continue
+                data = problem.dict()
+                try:
+                    check_test_files(data)
+                    check_complexity(data)
+                    if problem.entry_point:
+                        data["_structured_tests"] = compile_structured_tests(data)
+                except ValueError as e:
+                    logger.error(f"Skipping problem {problem.id} with invalid test cases: {str(e)}")
+                    continue
+                data["_test_set_version"] = test_set_version(data)
+                encoded = jsonable_encoder(problem)
+                # Hidden test cases never leave the server
+                encoded["test_cases"] = [test_case for test_case in encoded["test_cases"] if not test_case["hidden"]]
+                problems[problem.id] = data
+                bodies[problem.id] = json.dumps(encoded).encode()
+                etags[problem.id] = self._etag(bodies[problem.id])
+                listing.append(encoded)
+            self._problems, self._bodies, self._etags = problems, bodies, etags
+            self._list_body = json.dumps(listing).encode()
+            self._list_etag = self._etag(self._list_body)
+            self.version = version
+    
+    async def refresh_if_stale(self):
+        if await self._stored_version() != self.version:
+            await self.load()
+    
+    async def _refresh_forever(self):
+        # Picks up writes made through other server instances
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await self.refresh_if_stale()
+            except Exception as e:
+                logger.warning(f"Problem catalog refresh failed: {str(e)}")
+    
+    async def start(self):
+        await self.seed()
+        await self.load()
+        self._refresher = asyncio.ensure_future(self._refresh_forever())
+    
+    def stop(self):
+        if self._refresher:
+            self._refresher.cancel()
+    
+    async def _bump_version(self):
+        await db.catalog_meta.update_one({"_id": "problems"}, {"$inc": {"version": 1}}, upsert=True)
+    
+    async def save(self, problem: Problem):
+        """Write a problem through to Mongo and invalidate every catalog holding the old version"""
+        await db.problems.replace_one({"id": problem.id}, problem.dict(), upsert=True)
+        await self._bump_version()
+        await self.load()
+    
+    def get(self, problem_id: str) -> Optional[Dict[str, Any]]:
+        return self._problems.get(problem_id)
+    
+    def body(self, problem_id: str) -> Tuple[Optional[bytes], Optional[str]]:
+        return self._bodies.get(problem_id), self._etags.get(problem_id)
+    
+    def list_body(self) -> Tuple[bytes, str]:
+        return self._list_body, self._list_etag
+
+problem_catalog = ProblemCatalog(PROBLEM_CATALOG_REFRESH_SECONDS)
+
+def etag_response(request: Request, body: bytes, etag: str) -> Response:
+    """Serve a pre-serialized JSON body, or 304 when the client already holds this version"""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# Admin endpoints are only enabled when ADMIN_TOKEN is configured
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin API is disabled")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+# Admission control in front of the sandboxes: a token bucket per client, then a bound on
+# the queue for sandbox slots beyond which new executions are turned away
+# Per-client limits are keyed on the client address. Behind the ingress that serves /api every
+# request arrives from the proxy's address, so all clients would share one bucket: the limiter is
+# off (0) by default and should only be enabled together with RATE_LIMIT_TRUST_FORWARDED, which
+# keys on the address the proxy appends to X-Forwarded-For, or when clients connect directly.
+RATE_LIMIT_PER_MINUTE = float(os.environ.get('RATE_LIMIT_PER_MINUTE', 0))
+RATE_LIMIT_BURST = int(os.environ.get('RATE_LIMIT_BURST', 10))
+RATE_LIMIT_MAX_CLIENTS = int(os.environ.get('RATE_LIMIT_MAX_CLIENTS', 100000))
+RATE_LIMIT_TRUST_FORWARDED = os.environ.get('RATE_LIMIT_TRUST_FORWARDED', 'false').lower() in ('1', 'true', 'yes')
+ADMISSION_MAX_WAIT_SECONDS = float(os.environ.get('ADMISSION_MAX_WAIT_SECONDS', 10))
+ADMISSION_QUEUE_LIMIT = int(os.environ.get('ADMISSION_QUEUE_LIMIT', EXECUTION_CONCURRENCY * 16))
+
+judge_rejected_total = metrics.register(Counter("judge_rejected_total", "Execution requests turned away with 429, by reason"))
+
+class RateLimiter:
+    """Token buckets keyed by client, refilled continuously at rate_per_second up to burst.
+    
+    Buckets live in an LRU dict; evicting the least recently seen client only forgets a bucket
+    that has had the longest to refill, so the memory bound barely loosens the limit.
+    """
+    
+    def __init__(self, rate_per_second: float, burst: int, max_clients: int):
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: OrderedDict[str, Tuple[float, float]] = OrderedDict()
+    
+    def take(self, client: str) -> float:
+        """Spend one token; returns 0 when allowed, otherwise seconds until a token is available"""
+        if self.rate_per_second <= 0:
+            return 0.0
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(client, (float(self.burst), now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate_per_second)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate_per_second
+        self._buckets[client] = (tokens, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+rate_limiter = RateLimiter(RATE_LIMIT_PER_MINUTE / 60, RATE_LIMIT_BURST, RATE_LIMIT_MAX_CLIENTS)
+
+def client_key(request: Request) -> str:
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            # The last entry is the one the proxy added; earlier ones are whatever the client sent
+            return forwarded.split(",")[-1].strip()
+    return request.client.host if request.client else "unknown"
+
+def too_many_requests(reason: str, detail: str, retry_after: float) -> HTTPException:
+    judge_rejected_total.inc(reason=reason)
+    return HTTPException(status_code=429, detail=detail, headers={"Retry-After": str(max(math.ceil(retry_after), 1))})
+
+async def rate_limit(request: Request):
+    wait = rate_limiter.take(client_key(request))
+    if wait:
+        raise too_many_requests("rate_limit", "Too many submissions, slow down", wait)
+
+async def admission_control(request: Request):
+    """Shed new executions once every sandbox slot is busy and the queue for one is too long.
+    
+    Too long means an expected wait over ADMISSION_MAX_WAIT_SECONDS, estimated from the queue
+    depth and the average time a batch holds its slot, or more than ADMISSION_QUEUE_LIMIT
+    waiting at all. The bound is checked on arrival, so it is soft by however many requests
+    arrive at once. Queued job submissions are not subject to it since the job queue already
+    absorbs bursts.
+    """
+    if execution_engine.active < execution_engine.max_concurrency:
+        return
+    expected_wait = (execution_engine.waiting + 1) / execution_engine.max_concurrency * execution_engine.batch_seconds
+    if expected_wait > ADMISSION_MAX_WAIT_SECONDS or execution_engine.waiting >= ADMISSION_QUEUE_LIMIT:
+        raise too_many_requests("overload", "The judge is at capacity, try again shortly", expected_wait)
+
+async def record_submission(submission: CodeSubmission, result: ExecutionResult) -> SubmissionRecord:
+    """Save a judged submission to the database"""
+    submission_record = SubmissionRecord(
+        problem_id=submission.problem_id,
+        code=submission.code,
+        language=submission.language,
+        user_id=submission.user_id,
+        result=result
+    )
+    await submission_writer.add(submission_record.dict())
+    judge_submissions_total.inc(verdict="accepted" if result.success else "rejected", **judge_labels.get())
+    return submission_record
+
+# Submission records are written behind the request path and flushed to Mongo in batches
+SUBMISSION_BATCH_SIZE = int(os.environ.get('SUBMISSION_BATCH_SIZE', 100))
+SUBMISSION_FLUSH_SECONDS = float(os.environ.get('SUBMISSION_FLUSH_SECONDS', 0.5))
+SUBMISSION_BUFFER_LIMIT = int(os.environ.get('SUBMISSION_BUFFER_LIMIT', 10000))
+SUBMISSION_RETRY_SECONDS = float(os.environ.get('SUBMISSION_RETRY_SECONDS', 1))
+SUBMISSION_SHUTDOWN_SECONDS = float(os.environ.get('SUBMISSION_SHUTDOWN_SECONDS', 10))
+SUBMISSION_READ_WAIT_SECONDS = float(os.environ.get('SUBMISSION_READ_WAIT_SECONDS', 5))
+
+class SubmissionWriter:
+    """Write-behind buffer for submission records.
+    
+    Records are flushed with insert_many once batch_size are waiting or every flush_seconds.
+    A failed flush is retried with backoff while callers keep buffering; once buffer_limit
+    records are outstanding, add() waits for space instead of growing without bound.
+    Retries are safe because documents keep the _id assigned on the first attempt, so rows
+    that already landed come back as duplicate key errors.
+    """
+    
+    def __init__(self, batch_size: int, flush_seconds: float, buffer_limit: int, retry_seconds: float):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.buffer_limit = buffer_limit
+        self.retry_seconds = retry_seconds
+        self.dropped = 0
+        # Each record with the judge labels of the request that added it, for the persist metrics
+        self._pending: List[Tuple[Dict[str, Any], Dict[str, str]]] = []
+        # Records accepted and records written (or dropped), in order; flush() waits on the gap
+        self._added = 0
+        self._done = 0
+        self._wake: Optional[asyncio.Event] = None
+        self._progress: Optional[asyncio.Condition] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    @property
+    def outstanding(self) -> int:
+        return self._added - self._done
+    
+    async def add(self, document: Dict[str, Any]):
+        if self._task is None:
+            # Not started (scripts, tests): write through
+            with stage_timer("persist"):
+                await db.submissions.insert_one(document)
+            await problem_stats.record([document])
+            await fingerprint_index.record([document])
+            return
+        if self.outstanding >= self.buffer_limit:
+            async with self._progress:
+                await self._progress.wait_for(lambda: self.outstanding < self.buffer_limit)
+        self._pending.append((document, judge_labels.get()))
+        self._added += 1
+        if len(self._pending) >= self.batch_size:
+            self._wake.set()
+    
+    async def flush(self, timeout: float):
+        """Wait up to timeout for every record added before this call to be written"""
+        target = self._added
+        if self._task is None or self._done >= target:
+            return
+        self._wake.set()
+        async with self._progress:
+            try:
+                await asyncio.wait_for(self._progress.wait_for(lambda: self._done >= target), timeout)
+            except asyncio.TimeoutError:
+                pass
+    
+    async def _write(self, batch: List[Tuple[Dict[str, Any], Dict[str, str]]]) -> List[Dict[str, Any]]:
+        """Insert a batch, retrying until the database answers; returns the records it kept"""
+        documents = [document for document, _ in batch]
+        delay = self.retry_seconds
+        while True:
+            started = time.perf_counter()
+            try:
+                await db.submissions.insert_many(documents, ordered=False)
+                return documents
+            except BulkWriteError as e:
+                # Per-document errors will not go away on retry; duplicates were stored by an earlier attempt
+                failed = [error for error in e.details.get("writeErrors", []) if error.get("code") != 11000]
+                if failed:
+                    self.dropped += len(failed)
+                    logger.error(f"Dropped {len(failed)} submission records: {failed[0].get('errmsg')}")
+                failed_indexes = {error["index"] for error in failed}
+                return [document for i, document in enumerate(documents) if i not in failed_indexes]
+            except PyMongoError as e:
+                logger.warning(f"Writing {len(batch)} submission records failed, retrying in {delay:.1f}s: {str(e)}")
+            finally:
+                # The flush task has no judge labels of its own; each record is observed under its request's
+                seconds = time.perf_counter() - started
+                for _, labels in batch:
+                    judge_stage_seconds.observe(seconds, stage="persist", **labels)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+    
+    async def _drain(self):
+        while self._pending:
+            batch = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+            try:
+                stored = await self._write(batch)
+            except asyncio.CancelledError:
+                self._pending[:0] = batch
+                raise
+            await problem_stats.record(stored)
+            await fingerprint_index.record(stored)
+            self._done += len(batch)
+            async with self._progress:
+                self._progress.notify_all()
+    
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self._drain()
+    
+    def start(self):
+        # Created here so they belong to the loop that runs the writer
+        self._wake = asyncio.Event()
+        self._progress = asyncio.Condition()
+        self._task = asyncio.ensure_future(self._run())
+    
+    async def close(self, timeout: float):
+        """Stop the flush loop and write out whatever is still buffered"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        try:
+            await asyncio.wait_for(self._drain(), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Lost {len(self._pending)} unwritten submission records at shutdown")
+
+submission_writer = SubmissionWriter(SUBMISSION_BATCH_SIZE, SUBMISSION_FLUSH_SECONDS, SUBMISSION_BUFFER_LIMIT, SUBMISSION_RETRY_SECONDS)
+
+# Per-problem aggregates, maintained as submissions are written so dashboards never scan submissions
+STATS_CACHE_SECONDS = float(os.environ.get('STATS_CACHE_SECONDS', 5))
+STATS_PERCENTILES = (50, 75, 90, 99)
+# Runtimes are counted in log-spaced buckets, four per doubling from 1ms (each about 19% wide)
+RUNTIME_BUCKET_BASE = 0.001
+RUNTIME_BUCKETS_PER_DOUBLING = 4
+
+def ranked_time(result: Dict[str, Any]) -> float:
+    """The time a judged submission is ranked by: CPU seconds measured outside the sandbox.
+    
+    Results stored before CPU time was recorded fall back to their execution time.
+    """
+    return result.get("cpu_time", result["execution_time"])
+
+def runtime_bucket(seconds: float) -> int:
+    if seconds <= RUNTIME_BUCKET_BASE:
+        return 0
+    return int(math.log2(seconds / RUNTIME_BUCKET_BASE) * RUNTIME_BUCKETS_PER_DOUBLING)
+
+def runtime_bucket_bound(bucket: int) -> float:
+    return RUNTIME_BUCKET_BASE * 2 ** ((bucket + 1) / RUNTIME_BUCKETS_PER_DOUBLING)
+
+def increment_path(document: Dict[str, Any], path: str, amount: int):
+    """Apply a $inc on a dotted path to an in-memory document"""
+    *parents, leaf = path.split(".")
+    for key in parents:
+        document = document.setdefault(key, {})
+    document[leaf] = document.get(leaf, 0) + amount
+
+class ProblemStatsStore:
+    """Incrementally maintained submission aggregates.
+    
+    problem_stats holds one document per problem with submission and acceptance counts, per
+    language counts and a runtime histogram of accepted submissions. user_problem_stats holds
+    one document per (problem, user) with attempts and the user's fastest accepted run, and is
+    indexed so a leaderboard is a short index scan. Each flushed batch of submissions becomes
+    one $inc per problem plus two upserts per user. Reads are served from memory, refreshed
+    from Mongo after STATS_CACHE_SECONDS to pick up other instances' writes.
+    """
+    
+    def __init__(self, cache_seconds: float):
+        self.cache_seconds = cache_seconds
+        self._stats: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._leaders: Dict[str, Tuple[float, int, List[Dict[str, Any]]]] = {}
+    
+    async def ensure_indexes(self):
+        await db.problem_stats.create_index("problem_id", unique=True)
+        await db.user_problem_stats.create_index([("problem_id", 1), ("user_id", 1)], unique=True)
+        await db.user_problem_stats.create_index([("problem_id", 1), ("best_time", 1), ("best_at", 1)])
+        await db.user_problem_stats.create_index("user_id")
+    
+    @staticmethod
+    def _updates(batch: List[Dict[str, Any]]) -> Tuple[Dict[str, Dict[str, int]], List[UpdateOne]]:
+        """Fold a batch of submission documents into per-problem increments and per-user upserts"""
+        increments: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        users: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for document in batch:
+            problem_id, language, result = document["problem_id"], document["language"], document["result"]
+            accepted = result["success"]
+            counts = increments[problem_id]
+            counts["submissions"] += 1
+            counts[f"languages.{language}.submissions"] += 1
+            if accepted:
+                counts["accepted"] += 1
+                counts[f"languages.{language}.accepted"] += 1
+                counts[f"runtime_buckets.{runtime_bucket(ranked_time(result))}"] += 1
+            
+            user_id = document.get("user_id")
+            if not user_id:
+                continue
+            user = users.setdefault((problem_id, user_id), {"attempts": 0, "accepted": 0, "last": document["submitted_at"], "best": None})
+            user["attempts"] += 1
+            user["last"] = max(user["last"], document["submitted_at"])
+            if accepted:
+                user["accepted"] += 1
+                user["first_accepted"] = min(user.get("first_accepted", document["submitted_at"]), document["submitted_at"])
+                if user["best"] is None or ranked_time(result) < ranked_time(user["best"]["result"]):
+                    user["best"] = document
         
-        # Overall result
-        overall_success = passed_count == len(problem_data["test_cases"])
+        operations = []
+        for (problem_id, user_id), user in users.items():
+            key = {"problem_id": problem_id, "user_id": user_id}
+            update: Dict[str, Any] = {
+                "$inc": {"attempts": user["attempts"], "accepted": user["accepted"]},
+                "$max": {"last_submitted_at": user["last"]},
+                "$setOnInsert": {"best_time": None}
+            }
+            if "first_accepted" in user:
+                update["$min"] = {"first_accepted_at": user["first_accepted"]}
+            operations.append(UpdateOne(key, update, upsert=True))
+            best = user["best"]
+            if best is not None:
+                best_time = ranked_time(best["result"])
+                operations.append(UpdateOne(
+                    {**key, "$or": [{"best_time": None}, {"best_time": {"$gt": best_time}}]},
+                    {"$set": {
+                        "best_time": best_time,
+                        "best_language": best["language"],
+                        "best_submission_id": best["id"],
+                        "best_at": best["submitted_at"]
+                    }}
+                ))
+        return increments, operations
+    
+    async def record(self, batch: List[Dict[str, Any]]):
+        """Add a written batch to the per-problem and per-user counters; a Mongo error drops this batch's increments until the problem is rebuilt"""
+        if not batch:
+            return
+        increments, operations = self._updates(batch)
+        try:
+            for problem_id, counts in increments.items():
+                await db.problem_stats.update_one({"problem_id": problem_id}, {"$inc": dict(counts)}, upsert=True)
+            if operations:
+                await db.user_problem_stats.bulk_write(operations, ordered=True)
+        except PyMongoError as e:
+            logger.warning(f"Updating problem stats for {len(batch)} submissions failed: {str(e)}")
         
-        result = ExecutionResult(
-            success=overall_success,
-            output=f"Passed {passed_count}/{len(problem_data['test_cases'])} test cases",
-            test_results=test_results,
-            total_passed=passed_count,
-            total_tests=len(problem_data["test_cases"]),
-            execution_time=sum(tr.get("execution_time", 0) for tr in test_results)
+        for problem_id, counts in increments.items():
+            cached = self._stats.get(problem_id)
+            if cached is not None:
+                for path, amount in counts.items():
+                    increment_path(cached[1], path, amount)
+            if counts.get("accepted"):
+                self._leaders.pop(problem_id, None)
+    
+    async def _document(self, problem_id: str) -> Dict[str, Any]:
+        cached = self._stats.get(problem_id)
+        if cached is None or time.monotonic() - cached[0] > self.cache_seconds:
+            document = await db.problem_stats.find_one({"problem_id": problem_id}, {"_id": 0}) or {"problem_id": problem_id}
+            cached = (time.monotonic(), document)
+            self._stats[problem_id] = cached
+        return cached[1]
+    
+    async def stats(self, problem_id: str) -> ProblemStats:
+        document = await self._document(problem_id)
+        submissions, accepted = document.get("submissions", 0), document.get("accepted", 0)
+        buckets = sorted((int(bucket), count) for bucket, count in document.get("runtime_buckets", {}).items())
+        percentiles = {}
+        total = sum(count for _, count in buckets)
+        for percentile in STATS_PERCENTILES if total else ():
+            # Nearest rank, reported as the upper bound of the bucket it falls in
+            rank = max(math.ceil(percentile / 100 * total), 1)
+            for bucket, count in buckets:
+                rank -= count
+                if rank <= 0:
+                    percentiles[f"p{percentile}"] = runtime_bucket_bound(bucket)
+                    break
+        return ProblemStats(
+            problem_id=problem_id,
+            submissions=submissions,
+            accepted=accepted,
+            acceptance_rate=accepted / submissions if submissions else 0.0,
+            languages=document.get("languages", {}),
+            runtime_percentiles=percentiles
         )
+    
+    async def leaderboard(self, problem_id: str, limit: int) -> List[LeaderboardEntry]:
+        cached = self._leaders.get(problem_id)
+        if cached is None or time.monotonic() - cached[0] > self.cache_seconds or cached[1] < limit:
+            rows = await db.user_problem_stats.find(
+                {"problem_id": problem_id, "best_time": {"$ne": None}}, {"_id": 0}
+            ).sort([("best_time", 1), ("best_at", 1)]).limit(limit).to_list(limit)
+            cached = (time.monotonic(), limit, rows)
+            self._leaders[problem_id] = cached
+        return [
+            LeaderboardEntry(
+                rank=rank,
+                user_id=row["user_id"],
+                best_time=row["best_time"],
+                language=row["best_language"],
+                submission_id=row["best_submission_id"],
+                attempts=row["attempts"],
+                accepted=row["accepted"],
+                best_at=row["best_at"]
+            )
+            for rank, row in enumerate(cached[2][:limit], start=1)
+        ]
+    
+    async def user_stats(self, user_id: str) -> List[UserProblemStats]:
+        rows = await db.user_problem_stats.find({"user_id": user_id}, {"_id": 0}).sort("problem_id", 1).to_list(None)
+        return [UserProblemStats(**row) for row in rows]
+    
+    async def rebuild(self, problem_id: str) -> ProblemStats:
+        """Reset one problem's counters and recount them from the submissions collection; a batch written mid-rebuild can be counted twice or not at all"""
+        await db.problem_stats.delete_one({"problem_id": problem_id})
+        await db.user_problem_stats.delete_many({"problem_id": problem_id})
+        self._stats.pop(problem_id, None)
+        self._leaders.pop(problem_id, None)
+        projection = {"_id": 0, "id": 1, "problem_id": 1, "language": 1, "user_id": 1, "submitted_at": 1, "result.success": 1, "result.execution_time": 1, "result.cpu_time": 1}
+        batch = []
+        async for document in db.submissions.find({"problem_id": problem_id}, projection):
+            batch.append(document)
+            if len(batch) >= SUBMISSION_BATCH_SIZE:
+                await self.record(batch)
+                batch = []
+        await self.record(batch)
+        self._stats.pop(problem_id, None)
+        return await self.stats(problem_id)
+
+problem_stats = ProblemStatsStore(STATS_CACHE_SECONDS)
+
+# Similarity detection: submissions are fingerprinted as they are written (winnowing over normalized tokens)
+SIMILARITY_KGRAM = int(os.environ.get('SIMILARITY_KGRAM', 10))  # tokens per hashed k-gram; shorter matches are ignored
+SIMILARITY_WINDOW = int(os.environ.get('SIMILARITY_WINDOW', 5))  # any match of KGRAM + WINDOW - 1 tokens is always caught
+# Fingerprints found in more submissions of a problem than this are boilerplate and left out of lookups
+SIMILARITY_COMMON_LIMIT = int(os.environ.get('SIMILARITY_COMMON_LIMIT', 20))
+
+# Tokens of the C-family languages: literals, identifiers, numbers and single punctuation characters
+CODE_TOKEN_PATTERN = re.compile(r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|`(?:\\.|[^`\\])*`|[A-Za-z_$][\w$]*|\d[\w.]*|\S')
+C_COMMENT_PATTERN = re.compile(r'//[^\n]*|/\*.*?\*/', re.S)
+C_FAMILY_KEPT_NAMES = frozenset("""
+    auto bool break case catch char class const continue default delete do double else enum extern false final
+    float for function if import include int let long new null nullptr private protected public return short
+    signed sizeof static string struct switch this throw true try typedef unsigned using var void while
+    boolean byte extends implements instanceof interface package super undefined vector map set size push_back
+    std cin cout printf scanf main System out println length
+""".split())
+PYTHON_KEPT_NAMES = frozenset(keyword.kwlist) | frozenset(dir(builtins))
+
+def code_tokens(code: str, language: str) -> List[str]:
+    """Tokens of a submission with comments, layout, identifiers and literal values normalized away.
+    
+    Keywords and builtins stay as they are; other names become V, numbers N and strings S, so
+    renaming variables or editing constants and comments does not change the sequence.
+    """
+    if language == "python":
+        try:
+            tokens = []
+            for token in tokenize.generate_tokens(io.StringIO(code).readline):
+                if token.type == tokenize.NAME:
+                    tokens.append(token.string if token.string in PYTHON_KEPT_NAMES else "V")
+                elif token.type == tokenize.NUMBER:
+                    tokens.append("N")
+                elif token.type == tokenize.STRING:
+                    tokens.append("S")
+                elif token.type in (tokenize.OP, tokenize.INDENT, tokenize.DEDENT, tokenize.NEWLINE):
+                    tokens.append(token.string if token.type == tokenize.OP else tokenize.tok_name[token.type])
+            return tokens
+        except (tokenize.TokenError, IndentationError, SyntaxError):
+            pass
+    tokens = []
+    for token in CODE_TOKEN_PATTERN.findall(C_COMMENT_PATTERN.sub(" ", code)):
+        if token[0] in "\"'`":
+            tokens.append("S")
+        elif token[0].isdigit():
+            tokens.append("N")
+        elif token[0].isalpha() or token[0] in "_$":
+            tokens.append(token if token in C_FAMILY_KEPT_NAMES else "V")
+        else:
+            tokens.append(token)
+    return tokens
+
+def winnow(tokens: List[str], k: int, window: int) -> List[int]:
+    """Winnowing (Schleimer, Wilkerson and Aiken): the minimum hash of every window of k-gram hashes.
+    
+    Hashes are the first 8 bytes of a BLAKE2b digest as a signed integer, stable across processes
+    and small enough to index in Mongo.
+    """
+    grams = [" ".join(tokens[i:i + k]) for i in range(max(len(tokens) - k + 1, 1 if tokens else 0))]
+    hashes = [int.from_bytes(hashlib.blake2b(gram.encode(), digest_size=8).digest(), "big", signed=True) for gram in grams]
+    selected = set()
+    last = -1
+    for start in range(max(len(hashes) - window + 1, 1 if hashes else 0)):
+        chunk = hashes[start:start + window]
+        smallest = min(chunk)
+        # Rightmost minimum, so a window sliding past an unchanged minimum selects nothing new
+        position = start + max(i for i, h in enumerate(chunk) if h == smallest)
+        if position != last:
+            selected.add(hashes[position])
+            last = position
+    return sorted(selected)
+
+def fingerprint_document(submission: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "submission_id": submission["id"],
+        "problem_id": submission["problem_id"],
+        "language": submission["language"],
+        "user_id": submission.get("user_id"),
+        "submitted_at": submission["submitted_at"],
+        "hashes": winnow(code_tokens(submission["code"], submission["language"]), SIMILARITY_KGRAM, SIMILARITY_WINDOW)
+    }
+
+class FingerprintIndex:
+    """Winnowed fingerprints of stored submissions, for finding near-duplicates without comparing code pairwise.
+    
+    code_fingerprints holds one document per submission with a multikey index on
+    (problem_id, language, hashes), so the candidates for a submission come from index lookups
+    on its own fingerprints. fingerprint_counts counts how many submissions of a problem contain
+    each fingerprint; those above common_limit (starter code, the required signature, idioms
+    everyone writes) are left out, which bounds how many candidates a lookup can touch.
+    Similarity is the share of the smaller submission's remaining fingerprints the two share.
+    """
+    
+    def __init__(self, common_limit: int):
+        self.common_limit = common_limit
+    
+    async def ensure_indexes(self):
+        await db.code_fingerprints.create_index("submission_id", unique=True)
+        await db.code_fingerprints.create_index([("problem_id", 1), ("language", 1), ("hashes", 1)])
+        await db.fingerprint_counts.create_index([("problem_id", 1), ("language", 1), ("hash", 1)], unique=True)
+        await db.fingerprint_counts.create_index([("problem_id", 1), ("language", 1), ("submissions", -1)])
+    
+    async def record(self, batch: List[Dict[str, Any]]):
+        """Store winnowed hashes for a written batch and bump the shared hash counts; submissions lost to a Mongo error are invisible to similarity lookups until re-fingerprinted"""
+        if not batch:
+            return
+        documents = [fingerprint_document(submission) for submission in batch]
+        counts: Dict[Tuple[str, str, int], int] = defaultdict(int)
+        for document in documents:
+            for fingerprint in document["hashes"]:
+                counts[(document["problem_id"], document["language"], fingerprint)] += 1
+        try:
+            await db.code_fingerprints.insert_many(documents, ordered=False)
+            if counts:
+                await db.fingerprint_counts.bulk_write([
+                    UpdateOne({"problem_id": problem_id, "language": language, "hash": fingerprint}, {"$inc": {"submissions": count}}, upsert=True)
+                    for (problem_id, language, fingerprint), count in counts.items()
+                ], ordered=False)
+        except PyMongoError as e:
+            logger.warning(f"Fingerprinting {len(batch)} submissions failed: {str(e)}")
+    
+    async def _common(self, problem_id: str, language: str) -> set:
+        rows = await db.fingerprint_counts.find(
+            {"problem_id": problem_id, "language": language, "submissions": {"$gt": self.common_limit}}, {"_id": 0, "hash": 1}
+        ).to_list(None)
+        return {row["hash"] for row in rows}
+    
+    @staticmethod
+    def _entry(document: Dict[str, Any], similarity: float, shared: int) -> SimilarSubmission:
+        return SimilarSubmission(
+            submission_id=document["submission_id"],
+            user_id=document.get("user_id"),
+            language=document["language"],
+            similarity=similarity,
+            shared_fingerprints=shared,
+            submitted_at=document["submitted_at"]
+        )
+    
+    async def similar(self, submission_id: str, min_similarity: float, limit: int,
+                      include_same_user: bool) -> Optional[List[SimilarSubmission]]:
+        """Submissions of the same problem and language most similar to one; None if it was never fingerprinted"""
+        document = await db.code_fingerprints.find_one({"submission_id": submission_id}, {"_id": 0})
+        if document is None:
+            return None
+        common = await self._common(document["problem_id"], document["language"])
+        own = set(document["hashes"]) - common
+        if not own:
+            return []
+        candidates = db.code_fingerprints.find({
+            "problem_id": document["problem_id"],
+            "language": document["language"],
+            "hashes": {"$in": list(own)},
+            "submission_id": {"$ne": submission_id}
+        }, {"_id": 0})
+        matches = []
+        async for candidate in candidates:
+            if not include_same_user and document.get("user_id") and candidate.get("user_id") == document["user_id"]:
+                continue
+            theirs = set(candidate["hashes"]) - common
+            shared = len(own & theirs)
+            similarity = shared / min(len(own), len(theirs))
+            if similarity >= min_similarity:
+                matches.append(self._entry(candidate, similarity, shared))
+        matches.sort(key=lambda match: (-match.similarity, match.submitted_at))
+        return matches[:limit]
+    
+    async def similar_pairs(self, problem_id: str, min_similarity: float, limit: int,
+                            include_same_user: bool) -> List[SimilarPair]:
+        """The most similar pairs among a problem's submissions.
         
-        # Save submission to database
-        submission_record = SubmissionRecord(
-            problem_id=submission.problem_id,
-            code=submission.code,
-            language=submission.language,
-            result=result
+        One pass over the problem's fingerprints builds an inverted index of the uncommon ones;
+        pairs are only counted through those, so the work grows with the number of submissions
+        times common_limit rather than with every pair.
+        """
+        pairs = []
+        languages = await db.code_fingerprints.distinct("language", {"problem_id": problem_id})
+        for language in languages:
+            common = await self._common(problem_id, language)
+            documents: List[Dict[str, Any]] = []
+            owners: Dict[int, List[int]] = defaultdict(list)
+            async for document in db.code_fingerprints.find({"problem_id": problem_id, "language": language}, {"_id": 0}):
+                document["hashes"] = set(document["hashes"]) - common
+                for fingerprint in document["hashes"]:
+                    owners[fingerprint].append(len(documents))
+                documents.append(document)
+            shared: Dict[Tuple[int, int], int] = defaultdict(int)
+            for indexes in owners.values():
+                if len(indexes) > self.common_limit:
+                    continue
+                for pair in itertools.combinations(indexes, 2):
+                    shared[pair] += 1
+            for (a, b), count in shared.items():
+                first, second = sorted((documents[a], documents[b]), key=lambda document: document["submitted_at"])
+                if not include_same_user and first.get("user_id") and first.get("user_id") == second.get("user_id"):
+                    continue
+                similarity = count / min(len(first["hashes"]), len(second["hashes"]))
+                if similarity >= min_similarity:
+                    pairs.append(SimilarPair(
+                        first=self._entry(first, similarity, count),
+                        second=self._entry(second, similarity, count),
+                        similarity=similarity,
+                        shared_fingerprints=count
+                    ))
+        pairs.sort(key=lambda pair: (-pair.similarity, pair.second.submitted_at))
+        return pairs[:limit]
+    
+    async def rebuild(self, problem_id: str) -> int:
+        """Drop one problem's fingerprints and hash counts and rebuild them from its code, e.g. after the tokenizer changes; returns how many submissions were fingerprinted"""
+        await db.code_fingerprints.delete_many({"problem_id": problem_id})
+        await db.fingerprint_counts.delete_many({"problem_id": problem_id})
+        projection = {"_id": 0, "id": 1, "problem_id": 1, "language": 1, "user_id": 1, "submitted_at": 1, "code": 1}
+        count = 0
+        batch = []
+        async for document in db.submissions.find({"problem_id": problem_id}, projection):
+            batch.append(document)
+            count += 1
+            if len(batch) >= SUBMISSION_BATCH_SIZE:
+                await self.record(batch)
+                batch = []
+        await self.record(batch)
+        return count
+
+fingerprint_index = FingerprintIndex(SIMILARITY_COMMON_LIMIT)
+
+# Judge queue: submissions accepted in job mode wait in the jobs collection until a judge worker claims them
+JUDGE_WORKERS = int(os.environ.get('JUDGE_WORKERS', EXECUTION_CONCURRENCY))
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', 120))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', 1))
+
+class JobQueue:
+    """Persistent queue over the jobs collection, consumed by in-process judge workers.
+    
+    Workers claim jobs with an atomic find_one_and_update and hold a lease while judging, renewed
+    every third of lease_seconds, so a job whose server died mid-run is picked up again once its
+    lease expires. A claim is identified by the job's attempt count: a worker whose lease lapsed
+    and was reclaimed records nothing, leaving the job to its new holder. Local events wake
+    idle workers and status streams immediately; polling covers jobs enqueued by other instances.
+    """
+    
+    def __init__(self, workers: int, lease_seconds: float, max_attempts: int, poll_seconds: float):
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_seconds = poll_seconds
+        self._enqueued: Optional[asyncio.Event] = None
+        self._watchers: Dict[str, asyncio.Event] = {}
+        self._tasks: List[asyncio.Task] = []
+    
+    async def ensure_indexes(self):
+        await db.jobs.create_index("id", unique=True)
+        await db.jobs.create_index([("status", 1), ("created_at", 1)])
+    
+    async def enqueue(self, submission: CodeSubmission) -> Dict[str, Any]:
+        job = {
+            "id": str(uuid.uuid4()),
+            "status": "queued",
+            "problem_id": submission.problem_id,
+            "submission": submission.dict(),
+            "result": None,
+            "error": None,
+            "attempts": 0,
+            "created_at": datetime.utcnow(),
+            "started_at": None,
+            "finished_at": None,
+            "lease_until": None
+        }
+        await db.jobs.insert_one(job)
+        if self._enqueued is not None:
+            self._enqueued.set()
+        return job
+    
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await db.jobs.find_one({"id": job_id}, {"_id": 0, "submission": 0, "lease_until": 0})
+    
+    async def claim(self) -> Optional[Dict[str, Any]]:
+        now = datetime.utcnow()
+        job = await db.jobs.find_one_and_update(
+            {"$or": [
+                {"status": "queued"},
+                {"status": "running", "lease_until": {"$lt": now}}
+            ]},
+            {
+                "$set": {"status": "running", "started_at": now, "lease_until": now + timedelta(seconds=self.lease_seconds)},
+                "$inc": {"attempts": 1}
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
         )
+        if job is not None:
+            job.pop("_id", None)
+        return job
+    
+    @staticmethod
+    def _claim_filter(job: Dict[str, Any]) -> Dict[str, Any]:
+        return {"id": job["id"], "status": "running", "attempts": job["attempts"]}
+    
+    async def _holds(self, job: Dict[str, Any]) -> bool:
+        return await db.jobs.count_documents(self._claim_filter(job), limit=1) > 0
+    
+    async def _keep_lease(self, job: Dict[str, Any]):
+        """Extend the lease until cancelled, or until another worker has taken the job over"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                renewed = await db.jobs.update_one(
+                    self._claim_filter(job),
+                    {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=self.lease_seconds)}}
+                )
+            except Exception as e:
+                logger.warning(f"Renewing the lease on judge job {job['id']} failed: {str(e)}")
+                continue
+            if renewed.matched_count == 0:
+                logger.warning(f"Judge job {job['id']} lost its lease while being judged")
+                return
+    
+    async def _finish(self, job: Dict[str, Any], fields: Dict[str, Any]):
+        fields.update({"finished_at": datetime.utcnow(), "lease_until": None})
+        await db.jobs.update_one(self._claim_filter(job), {"$set": fields})
+        self._notify(job["id"])
+    
+    def _notify(self, job_id: str):
+        watcher = self._watchers.get(job_id)
+        if watcher is not None:
+            watcher.set()
+    
+    async def wait_for_change(self, job_id: str, timeout: float):
+        watcher = self._watchers.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(watcher.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        watcher.clear()
+    
+    def release_watcher(self, job_id: str):
+        self._watchers.pop(job_id, None)
+    
+    async def _run_job(self, job: Dict[str, Any]):
+        self._notify(job["id"])
+        if job["attempts"] > self.max_attempts:
+            await self._finish(job, {"status": "failed", "error": "Job abandoned after repeated worker failures"})
+            return
         
-        await db.submissions.insert_one(submission_record.dict())
+        submission = CodeSubmission(**job["submission"])
+        set_judge_labels(submission)
+        observe_stage("job_wait", (job["started_at"] - job["created_at"]).total_seconds())
+        problem_data = problem_catalog.get(submission.problem_id)
+        if not problem_data:
+            await self._finish(job, {"status": "failed", "error": "Problem not found"})
+            return
+        
+        lease = asyncio.ensure_future(self._keep_lease(job))
+        try:
+            result = await judge_submission(submission, problem_data)
+            if not await self._holds(job):
+                # Taken over after the lease lapsed; the new holder records the submission
+                return
+            submission_record = await record_submission(submission, result)
+        except Exception as e:
+            logger.error(f"Judge job {job['id']} failed: {str(e)}")
+            await self._finish(job, {"status": "failed", "error": f"Execution failed: {str(e)}"})
+            return
+        finally:
+            lease.cancel()
+        await self._finish(job, {"status": "completed", "result": result.dict(), "submission_id": submission_record.id})
+    
+    async def _work(self):
+        while True:
+            try:
+                job = await self.claim()
+            except Exception as e:
+                logger.warning(f"Claiming judge job failed: {str(e)}")
+                job = None
+            if job is None:
+                self._enqueued.clear()
+                try:
+                    await asyncio.wait_for(self._enqueued.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run_job(job)
+            except Exception:
+                # Mongo errors recording the outcome; the job's lease lapses and it is retried
+                logger.exception(f"Judge job {job['id']} was left unfinished")
+    
+    def start(self):
+        # Created here so it belongs to the loop that runs the workers
+        self._enqueued = asyncio.Event()
+        self._tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+    
+    def stop(self):
+        # Jobs cut off here keep their lease and are retried once it expires
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+job_queue = JobQueue(JUDGE_WORKERS, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, JOB_POLL_SECONDS)
+
+# Re-judging: after a problem's tests change, its stored submissions are judged again in the background
+REJUDGE_CONCURRENCY = int(os.environ.get('REJUDGE_CONCURRENCY', max(EXECUTION_CONCURRENCY // 2, 1)))  # leaves sandboxes for live traffic
+REJUDGE_BATCH_SIZE = int(os.environ.get('REJUDGE_BATCH_SIZE', 200))
+REJUDGE_PROGRESS_SECONDS = float(os.environ.get('REJUDGE_PROGRESS_SECONDS', 2))
+REJUDGE_STALE_SECONDS = float(os.environ.get('REJUDGE_STALE_SECONDS', 300))
+
+class Rejudger:
+    """Background re-judging of every stored submission to a problem.
+    
+    One reader streams the problem's submissions off a cursor into a bounded queue; `concurrency`
+    workers judge them through the execution engine. Submissions whose normalized code is the
+    same share one run. Results are written back with one bulk_write per batch_size submissions
+    (or every progress_seconds), and progress is saved on the rejudges document at the same time.
+    A re-judge whose instance died stops updating; after stale_seconds another may be started
+    for the problem.
+    """
+    
+    def __init__(self, concurrency: int, batch_size: int, progress_seconds: float, stale_seconds: float):
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.progress_seconds = progress_seconds
+        self.stale_seconds = stale_seconds
+        self._tasks: Dict[str, asyncio.Task] = {}
+    
+    async def ensure_indexes(self):
+        await db.rejudges.create_index("id", unique=True)
+        await db.rejudges.create_index([("problem_id", 1), ("created_at", -1)])
+    
+    async def get(self, rejudge_id: str) -> Optional[Dict[str, Any]]:
+        return await db.rejudges.find_one({"id": rejudge_id}, {"_id": 0})
+    
+    async def start(self, problem_id: str, problem_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Start re-judging a problem; None while another re-judge of it is still running"""
+        now = datetime.utcnow()
+        running = await db.rejudges.find_one({
+            "problem_id": problem_id,
+            "status": "running",
+            "updated_at": {"$gt": now - timedelta(seconds=self.stale_seconds)}
+        })
+        if running is not None:
+            return None
+        # Buffered submissions are written first so the cursor sees them
+        await submission_writer.flush(SUBMISSION_READ_WAIT_SECONDS)
+        rejudge = RejudgeStatus(
+            id=str(uuid.uuid4()),
+            problem_id=problem_id,
+            status="running",
+            total=await db.submissions.count_documents({"problem_id": problem_id}),
+            created_at=now,
+            updated_at=now
+        ).dict()
+        await db.rejudges.insert_one(dict(rejudge))
+        self._tasks[rejudge["id"]] = asyncio.ensure_future(self._run(rejudge, problem_data))
+        return rejudge
+    
+    async def cancel(self, rejudge_id: str) -> bool:
+        task = self._tasks.get(rejudge_id)
+        if task is None:
+            return False
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return True
+    
+    async def _run(self, rejudge: Dict[str, Any], problem_data: Dict[str, Any]):
+        progress = {"processed": 0, "judged": 0, "changed": 0, "errors": 0}
+        # Normalized code -> the one run all submissions with that code wait on
+        runs: Dict[str, asyncio.Task] = {}
+        updates: List[UpdateOne] = []
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 4)
+        saved_at = time.monotonic()
+        
+        async def save(fields: Dict[str, Any]):
+            nonlocal saved_at
+            saved_at = time.monotonic()
+            fields.update(progress, updated_at=datetime.utcnow())
+            await db.rejudges.update_one({"id": rejudge["id"]}, {"$set": fields})
+        
+        async def flush():
+            if updates:
+                batch = updates[:]
+                updates.clear()
+                await db.submissions.bulk_write(batch, ordered=False)
+            await save({})
+        
+        async def judge(submission: CodeSubmission) -> ExecutionResult:
+            progress["judged"] += 1
+            return await judge_submission(submission, problem_data)
+        
+        async def read():
+            projection = {"_id": 0, "id": 1, "code": 1, "language": 1, "user_id": 1, "result.success": 1}
+            async for document in db.submissions.find({"problem_id": rejudge["problem_id"]}, projection).batch_size(self.batch_size):
+                await queue.put(document)
+            for _ in range(self.concurrency):
+                await queue.put(None)
+        
+        async def work():
+            while True:
+                document = await queue.get()
+                if document is None:
+                    return
+                submission = CodeSubmission(problem_id=rejudge["problem_id"], code=document["code"], language=document["language"])
+                key = submission_cache_key(submission, problem_data)
+                if key not in runs:
+                    runs[key] = asyncio.ensure_future(judge(submission))
+                try:
+                    result = await asyncio.shield(runs[key])
+                except Exception as e:
+                    logger.error(f"Re-judging submission {document['id']} failed: {str(e)}")
+                    progress["errors"] += 1
+                else:
+                    changed = result.success != document["result"]["success"]
+                    progress["changed"] += changed
+                    judge_rejudged_total.inc(verdict="changed" if changed else "unchanged", language=submission.language, problem=submission.problem_id)
+                    updates.append(UpdateOne({"id": document["id"]}, {"$set": {"result": result.dict(), "rejudged_at": datetime.utcnow()}}))
+                progress["processed"] += 1
+                if len(updates) >= self.batch_size or time.monotonic() - saved_at > self.progress_seconds:
+                    await flush()
+        
+        tasks = [asyncio.ensure_future(read())] + [asyncio.ensure_future(work()) for _ in range(self.concurrency)]
+        try:
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                # gather leaves the rest running when one fails: stop them all before the outcome is saved
+                for task in [*tasks, *runs.values()]:
+                    task.cancel()
+                await asyncio.gather(*tasks, *runs.values(), return_exceptions=True)
+            await flush()
+            # Verdicts changed under the aggregates
+            await problem_stats.rebuild(rejudge["problem_id"])
+            await save({"status": "completed", "finished_at": datetime.utcnow()})
+        except asyncio.CancelledError:
+            await flush()
+            await save({"status": "cancelled", "finished_at": datetime.utcnow()})
+        except Exception as e:
+            logger.error(f"Re-judge {rejudge['id']} of {rejudge['problem_id']} failed: {str(e)}")
+            await save({"status": "failed", "error": str(e), "finished_at": datetime.utcnow()})
+        finally:
+            self._tasks.pop(rejudge["id"], None)
+    
+    async def stop(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+rejudger = Rejudger(REJUDGE_CONCURRENCY, REJUDGE_BATCH_SIZE, REJUDGE_PROGRESS_SECONDS, REJUDGE_STALE_SECONDS)
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@api_router.get("/")
+async def root():
+    return {"message": "Placement Coding Platform API"}
+
+@api_router.get("/languages")
+async def get_languages():
+    """Languages whose toolchains are installed on this host"""
+    runners = {runner.name: runner for runner in LANGUAGE_RUNNERS.values() if runner.available()}
+    return [
+        {"name": runner.name, "aliases": list(runner.aliases), "compiled": bool(runner.compile_command("."))}
+        for runner in runners.values()
+    ]
+
+@api_router.get("/problems", response_model=List[Problem])
+async def get_problems(request: Request):
+    """Get all available problems"""
+    body, etag = problem_catalog.list_body()
+    return etag_response(request, body, etag)
+
+@api_router.get("/problems/{problem_id}", response_model=Problem)
+async def get_problem(problem_id: str, request: Request):
+    """Get a specific problem by ID"""
+    body, etag = problem_catalog.body(problem_id)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Problem not found")
+    return etag_response(request, body, etag)
+
+@api_router.get("/problems/{problem_id}/stats", response_model=ProblemStats)
+async def get_problem_stats(problem_id: str):
+    """Submission and acceptance counts and runtime percentiles of accepted submissions"""
+    if not problem_catalog.get(problem_id):
+        raise HTTPException(status_code=404, detail="Problem not found")
+    return await problem_stats.stats(problem_id)
+
+@api_router.get("/problems/{problem_id}/leaderboard", response_model=List[LeaderboardEntry])
+async def get_leaderboard(problem_id: str, limit: int = Query(10, ge=1, le=100)):
+    """Users ranked by their fastest accepted submission"""
+    if not problem_catalog.get(problem_id):
+        raise HTTPException(status_code=404, detail="Problem not found")
+    return await problem_stats.leaderboard(problem_id, limit)
+
+@api_router.post("/problems/{problem_id}/stats/rebuild", response_model=ProblemStats, dependencies=[Depends(require_admin)])
+async def rebuild_problem_stats(problem_id: str):
+    """Recompute a problem's stats and leaderboard from its stored submissions"""
+    if not problem_catalog.get(problem_id):
+        raise HTTPException(status_code=404, detail="Problem not found")
+    await submission_writer.flush(SUBMISSION_READ_WAIT_SECONDS)
+    return await problem_stats.rebuild(problem_id)
+
+@api_router.get("/problems/{problem_id}/similar", response_model=List[SimilarPair], dependencies=[Depends(require_admin)])
+async def get_similar_pairs(
+    problem_id: str,
+    min_similarity: float = Query(0.8, ge=0, le=1),
+    limit: int = Query(50, ge=1, le=500),
+    include_same_user: bool = False
+):
+    """Pairs of near-duplicate submissions to a problem, most similar first"""
+    await submission_writer.flush(SUBMISSION_READ_WAIT_SECONDS)
+    return await fingerprint_index.similar_pairs(problem_id, min_similarity, limit, include_same_user)
+
+@api_router.post("/problems/{problem_id}/similar/rebuild", dependencies=[Depends(require_admin)])
+async def rebuild_fingerprints(problem_id: str):
+    """Re-fingerprint a problem's stored submissions, e.g. those written before fingerprinting existed"""
+    await submission_writer.flush(SUBMISSION_READ_WAIT_SECONDS)
+    return {"problem_id": problem_id, "fingerprinted": await fingerprint_index.rebuild(problem_id)}
+
+@api_router.post("/problems/{problem_id}/rejudge", response_model=RejudgeStatus, status_code=202, dependencies=[Depends(require_admin)])
+async def rejudge_problem(problem_id: str):
+    """Judge every stored submission to a problem again against its current tests, in the background"""
+    problem_data = problem_catalog.get(problem_id)
+    if not problem_data:
+        raise HTTPException(status_code=404, detail="Problem not found")
+    rejudge = await rejudger.start(problem_id, problem_data)
+    if rejudge is None:
+        raise HTTPException(status_code=409, detail="A re-judge of this problem is already running")
+    return RejudgeStatus(**rejudge)
+
+@api_router.get("/rejudges/{rejudge_id}", response_model=RejudgeStatus, dependencies=[Depends(require_admin)])
+async def get_rejudge(rejudge_id: str):
+    """Progress of a re-judge"""
+    rejudge = await rejudger.get(rejudge_id)
+    if not rejudge:
+        raise HTTPException(status_code=404, detail="Re-judge not found")
+    return RejudgeStatus(**rejudge)
+
+@api_router.post("/rejudges/{rejudge_id}/cancel", response_model=RejudgeStatus, dependencies=[Depends(require_admin)])
+async def cancel_rejudge(rejudge_id: str):
+    """Stop a re-judge running on this instance; results written so far are kept"""
+    if not await rejudger.cancel(rejudge_id):
+        raise HTTPException(status_code=404, detail="No re-judge with this id is running here")
+    return RejudgeStatus(**await rejudger.get(rejudge_id))
+
+@api_router.get("/users/{user_id}/stats", response_model=List[UserProblemStats])
+async def get_user_stats(user_id: str):
+    """Attempts and best accepted runtime per problem for one user"""
+    return await problem_stats.user_stats(user_id)
+
+@api_router.put("/problems/{problem_id}", response_model=Problem, dependencies=[Depends(require_admin)])
+async def save_problem(problem_id: str, problem: Problem):
+    """Create or replace a problem"""
+    problem.id = problem_id
+    try:
+        check_test_files(problem.dict())
+        check_complexity(problem.dict())
+        if problem.entry_point:
+            compile_structured_tests(problem.dict(), read_files=True)
+            try:
+                run_problem(problem.dict(), None)
+            except ValueError as e:
+                raise ValueError(f"Sample does not fit the problem: {str(e)}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await problem_catalog.save(problem)
+    return problem
+
+@api_router.post("/test-files", status_code=201, dependencies=[Depends(require_admin)])
+async def upload_test_file(request: Request):
+    """Store the request body in the test data store; reference the returned digest from a test case's input_file or expected_file"""
+    digest, size = await test_data_store.put(request.stream())
+    return {"digest": digest, "size": size}
+
+@api_router.post("/execute", response_model=ExecutionResult, dependencies=[Depends(rate_limit), Depends(admission_control)])
+async def execute_code(submission: CodeSubmission):
+    """Execute code against test cases"""
+    try:
+        # Find the problem
+        problem_data = problem_catalog.get(submission.problem_id)
+        
+        if not problem_data:
+            raise HTTPException(status_code=404, detail="Problem not found")
+        resolve_language(submission)
+        
+        result = await judge_submission(submission, problem_data)
+        
+        # Save submission to database
+        await record_submission(submission, result)
         
         return result
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Code execution error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Execution failed: {str(e)}")
 
+@api_router.post("/run", response_model=RunResult, dependencies=[Depends(rate_limit), Depends(admission_control)])
+async def run_code(run: RunRequest):
+    """Try code on the problem's sample or a custom input without judging the test set or saving a submission"""
+    problem_data = problem_catalog.get(run.problem_id)
+    if not problem_data:
+        raise HTTPException(status_code=404, detail="Problem not found")
+    if run.input is not None and len(run.input) > RUN_INPUT_LIMIT:
+        raise HTTPException(status_code=400, detail=f"Custom input is larger than {RUN_INPUT_LIMIT} characters")
+    submission = CodeSubmission(problem_id=run.problem_id, code=run.code, language=run.language)
+    resolve_language(submission)
+    try:
+        run_data = run_problem(problem_data, run.input)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    set_judge_labels(submission)
+    judge_runs_total.inc(**judge_labels.get())
+    test_results = [test_result async for test_result in iter_test_results(submission, run_data)]
+    test_result = test_results[0]
+    custom = run.input is not None
+    return RunResult(
+        output=test_result["actual_output"],
+        stdout=test_result.get("stdout"),
+        error=test_result["error"],
+        expected_output=None if custom else test_result["expected_output"],
+        passed=None if custom else test_result["passed"],
+        execution_time=test_result["execution_time"],
+        cpu_time=test_result["cpu_time"],
+        memory_kb=test_result["memory_kb"],
+        host_factor=host_calibration.factor
+    )
+
+@api_router.post("/execute/stream", dependencies=[Depends(rate_limit), Depends(admission_control)])
+async def execute_code_stream(submission: CodeSubmission, stop_on_failure: bool = False):
+    """Execute code against test cases, streaming each test result as a server-sent event as it finishes.
+    
+    `stop_on_failure` is shorthand for the first_failure judging policy. The last event carries
+    the overall result, which is saved like a regular submission.
+    """
+    problem_data = problem_catalog.get(submission.problem_id)
+    if not problem_data:
+        raise HTTPException(status_code=404, detail="Problem not found")
+    resolve_language(submission)
+    if stop_on_failure and not submission.judge_policy:
+        submission.judge_policy = "first_failure"
+    total_tests = len(problem_data["test_cases"])
+    cache_key = submission_cache_key(submission, problem_data)
+    
+    async def replay(test_results: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        for test_result in test_results:
+            yield test_result
+    
+    async def events():
+        set_judge_labels(submission)
+        try:
+            cached = await result_cache.get(cache_key)
+            ladder_results: List[Dict[str, Any]] = []
+            results = replay(cached.test_results) if cached is not None else iter_test_results(submission, problem_data, ladder_results)
+            
+            test_results = []
+            async with aclosing(results):
+                async for test_result in results:
+                    test_results.append(test_result)
+                    yield sse_event("test_result", test_result)
+            
+            if cached is not None:
+                complexity = cached.complexity
+            else:
+                complexity = assess_complexity(problem_data, test_results, ladder_results)
+            result = summarize_test_results(test_results, total_tests, complexity)
+            if cached is None and len(test_results) == total_tests:
+                await result_cache.put(cache_key, result)
+            await record_submission(submission, result)
+            yield sse_event("result", jsonable_encoder(result))
+        except Exception as e:
+            logger.error(f"Code execution error: {str(e)}")
+            yield sse_event("error", {"detail": f"Execution failed: {str(e)}"})
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@api_router.get("/cache/stats")
+async def get_cache_stats():
+    """Get execution result cache counters"""
+    return result_cache.stats()
+
+@api_router.post("/jobs", response_model=JobStatus, status_code=202, dependencies=[Depends(rate_limit)])
+async def submit_job(submission: CodeSubmission):
+    """Queue code for judging and return the job id immediately"""
+    if not problem_catalog.get(submission.problem_id):
+        raise HTTPException(status_code=404, detail="Problem not found")
+    resolve_language(submission)
+    job = await job_queue.enqueue(submission)
+    return JobStatus(**job)
+
+@api_router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    """Get the status of a judge job, with its result once completed"""
+    job = await job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobStatus(**job)
+
+@api_router.get("/jobs/{job_id}/stream")
+async def stream_job(job_id: str):
+    """Stream a judge job's status changes as server-sent events until it finishes"""
+    job = await job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def events():
+        current = job
+        last_status = None
+        try:
+            while True:
+                if current["status"] != last_status:
+                    last_status = current["status"]
+                    yield sse_event("status", jsonable_encoder(JobStatus(**current)))
+                if current["status"] in ("completed", "failed"):
+                    return
+                await job_queue.wait_for_change(job_id, job_queue.poll_seconds)
+                current = await job_queue.get(job_id) or current
+        finally:
+            job_queue.release_watcher(job_id)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+# Fields fetched for the list view; code and per-case results are only loaded for detail views
+SUBMISSION_LIST_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "problem_id": 1,
+    "language": 1,
+    "user_id": 1,
+    "submitted_at": 1,
+    "result.success": 1,
+    "result.output": 1,
+    "result.execution_time": 1,
+    "result.cpu_time": 1,
+    "result.peak_memory_kb": 1,
+    "result.total_passed": 1,
+    "result.total_tests": 1
+}
+
+def encode_cursor(submission: Dict[str, Any]) -> str:
+    position = json.dumps([submission["submitted_at"].isoformat(), submission["id"]])
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        submitted_at, submission_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(submitted_at), submission_id
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def ensure_submission_indexes():
+    await db.submissions.create_index("id", unique=True)
+    await db.submissions.create_index([("submitted_at", -1), ("id", -1)])
+    await db.submissions.create_index([("problem_id", 1), ("submitted_at", -1), ("id", -1)])
+    await db.submissions.create_index([("language", 1), ("submitted_at", -1), ("id", -1)])
+
 @api_router.get("/submissions")
-async def get_submissions():
-    """Get recent submissions"""
-    submissions = await db.submissions.find().sort("submitted_at", -1).limit(10).to_list(10)
+async def get_submissions(
+    response: Response,
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
+    problem_id: Optional[str] = None,
+    language: Optional[str] = None,
+    view: str = Query("detail", pattern="^(list|detail)$")
+):
+    """Get recent submissions, newest first.
+    
+    Pages are keyed on (submitted_at, id): pass the X-Next-Cursor header of one page as
+    `cursor` to fetch the next. The list view leaves out code and per-case results.
+    """
+    query: Dict[str, Any] = {}
+    if problem_id:
+        query["problem_id"] = problem_id
+    if language:
+        query["language"] = language
+    if cursor:
+        submitted_at, submission_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"submitted_at": {"$lt": submitted_at}},
+            {"submitted_at": submitted_at, "id": {"$lt": submission_id}}
+        ]
+    
+    # Reads see this instance's own buffered submissions
+    await submission_writer.flush(SUBMISSION_READ_WAIT_SECONDS)
+    projection = SUBMISSION_LIST_PROJECTION if view == "list" else {"_id": 0}
+    submissions = await db.submissions.find(query, projection).sort([("submitted_at", -1), ("id", -1)]).limit(limit).to_list(limit)
+    
+    if len(submissions) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(submissions[-1])
+    if view == "list":
+        return [SubmissionSummary(**sub) for sub in submissions]
     return [SubmissionRecord(**sub) for sub in submissions]
 
+@api_router.get("/submissions/{submission_id}", response_model=SubmissionRecord)
+async def get_submission(submission_id: str):
+    """Get one submission with its code and per-case results"""
+    # Reads see this instance's own buffered submissions
+    await submission_writer.flush(SUBMISSION_READ_WAIT_SECONDS)
+    submission = await db.submissions.find_one({"id": submission_id}, {"_id": 0})
+    if not submission:
+        raise HTTPException(status_code=404, detail="Submission not found")
+    return SubmissionRecord(**submission)
+
+@api_router.get("/submissions/{submission_id}/similar", response_model=List[SimilarSubmission], dependencies=[Depends(require_admin)])
+async def get_similar_submissions(
+    submission_id: str,
+    min_similarity: float = Query(0.5, ge=0, le=1),
+    limit: int = Query(20, ge=1, le=200),
+    include_same_user: bool = False
+):
+    """Submissions to the same problem in the same language that share most of this one's fingerprints"""
+    await submission_writer.flush(SUBMISSION_READ_WAIT_SECONDS)
+    matches = await fingerprint_index.similar(submission_id, min_similarity, limit, include_same_user)
+    if matches is None:
+        raise HTTPException(status_code=404, detail="Submission not found or not fingerprinted; rebuild its problem's fingerprints")
+    return matches
+
+# Sandboxes and cache state are sampled when /metrics is scraped
+metrics.register(Gauge("judge_active_sandboxes", "Sandboxes currently running a submission", lambda: execution_engine.active))
+metrics.register(Gauge("judge_supervised_sandboxes", "Sandbox and compiler process groups the deadline supervisor is watching", lambda: deadline_supervisor.watched))
+metrics.register(Gauge("judge_waiting_executions", "Executions waiting for a sandbox slot", lambda: execution_engine.waiting))
+metrics.register(Gauge("judge_host_speed_factor", "Factor this host scales time limits by, from its startup calibration", lambda: host_calibration.factor))
+metrics.register(Gauge("judge_warm_workers", "Warm sandbox workers alive", lambda: sandbox_pool._count if sandbox_pool else 0))
+metrics.register(CounterReader("judge_cache_hits_total", "Result cache hits since start", lambda: result_cache.hits + result_cache.mongo_hits))
+metrics.register(CounterReader("judge_cache_misses_total", "Result cache misses since start", lambda: result_cache.misses))
+metrics.register(CounterReader("judge_artifact_cache_hits_total", "Builds reused from the compiled artifact cache since start", lambda: artifact_cache.hits))
+metrics.register(CounterReader("judge_artifact_cache_misses_total", "Builds compiled since start", lambda: artifact_cache.misses))
+metrics.register(Gauge("judge_submission_buffer", "Submission records waiting to be written", lambda: submission_writer.outstanding))
+metrics.register(CounterReader("judge_submissions_dropped_total", "Submission records the database rejected since start", lambda: submission_writer.dropped))
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -369,6 +4223,7 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "Retry-After"],
 )
 
 # Configure logging
@@ -378,6 +4233,57 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    await ensure_submission_indexes()
+    await job_queue.ensure_indexes()
+    await result_cache.ensure_indexes()
+    await problem_stats.ensure_indexes()
+    await fingerprint_index.ensure_indexes()
+    await rejudger.ensure_indexes()
+
+@app.on_event("startup")
+async def calibrate_host():
+    factor = host_calibration.calibrate()
+    drift = f", {host_calibration.drift:+.1%} drift from the stored factor" if host_calibration.drift is not None else ""
+    logger.info(f"Host speed factor {factor}{drift}: time limits are scaled by it")
+
+@app.on_event("startup")
+async def start_problem_catalog():
+    await problem_catalog.start()
+
+@app.on_event("startup")
+async def load_artifact_cache():
+    artifact_cache.load()
+
+@app.on_event("startup")
+async def start_sandbox_pool():
+    if sandbox_pool is not None:
+        await sandbox_pool.start()
+
+@app.on_event("startup")
+async def start_submission_writer():
+    submission_writer.start()
+
+@app.on_event("startup")
+async def start_judge_workers():
+    job_queue.start()
+
+@app.on_event("shutdown")
+async def stop_judge_workers():
+    job_queue.stop()
+    await rejudger.stop()
+
+@app.on_event("shutdown")
+async def stop_problem_catalog():
+    problem_catalog.stop()
+
+@app.on_event("shutdown")
+async def shutdown_sandbox_pool():
+    if sandbox_pool is not None:
+        await sandbox_pool.close()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await submission_writer.close(SUBMISSION_SHUTDOWN_SECONDS)
     client.close()
\ No newline at end of file
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""Latency and throughput benchmark for the judge endpoints.
+
+By default the FastAPI app is driven in-process with an in-memory stand-in for Motor
+(mongomock-motor), so no MongoDB or running server is needed; sandboxes are real child
+processes. Pass --url to benchmark a deployed backend instead.
+
+    python backend_benchmark.py --concurrency 16 --requests 400
+    python backend_benchmark.py --mix fast=50,infinite_loop=5,problems=30 --json
+    python backend_benchmark.py --url http://localhost:8001
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import httpx
+
+FIBONACCI_FAST = """
+def fibonacci(n):
+    a, b = 0, 1
+    for _ in range(n):
+        a, b = b, a + b
+    return a
+"""
+
+FIBONACCI_SLOW = """
+def fibonacci(n):
+    if n <= 1:
+        return n
+    total = 0
+    for _ in range(200000):
+        total += 1
+    return fibonacci(n - 1) + fibonacci(n - 2)
+"""
+
+TWO_SUM_WRONG = """
+def two_sum(nums, target):
+    return [0, 1]
+"""
+
+TWO_SUM_SYNTAX_ERROR = """
+def two_sum(nums, target:
+    return [0, 1]
+"""
+
+PALINDROME_SLEEPS = """
+import time
+def is_palindrome(s):
+    time.sleep(60)
+"""
+
+FIBONACCI_INFINITE_LOOP = """
+def fibonacci(n):
+    while True:
+        pass
+"""
+
+# Scenario name -> (method, path, problem id, code)
+SCENARIOS = {
+    "fast": ("POST", "/api/execute", "fibonacci", FIBONACCI_FAST),
+    "slow": ("POST", "/api/execute", "fibonacci", FIBONACCI_SLOW),
+    "wrong": ("POST", "/api/execute", "two-sum", TWO_SUM_WRONG),
+    "syntax_error": ("POST", "/api/execute", "two-sum", TWO_SUM_SYNTAX_ERROR),
+    "timeout": ("POST", "/api/execute", "palindrome-check", PALINDROME_SLEEPS),
+    "infinite_loop": ("POST", "/api/execute", "fibonacci", FIBONACCI_INFINITE_LOOP),
+    "problems": ("GET", "/api/problems", None, None),
+    "submissions": ("GET", "/api/submissions", None, None),
+}
+
+DEFAULT_MIX = "fast=50,slow=10,wrong=10,syntax_error=5,timeout=2,infinite_loop=3,problems=15,submissions=5"
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario '{name}', expected one of: {', '.join(SCENARIOS)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def load_in_process_app():
+    """Import the backend with Motor swapped for mongomock-motor"""
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", "benchmark")
+    # Every simulated client shares one address; admission control stays on
+    os.environ.setdefault("RATE_LIMIT_PER_MINUTE", "0")
+
+    import motor.motor_asyncio
+    from mongomock_motor import AsyncMongoMockClient
+
+    motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+    sys.path.insert(0, str(Path(__file__).parent / "backend"))
+    import server
+
+    return server.app
+
+
+async def run_request(client, scenario, salt_code):
+    method, path, problem_id, code = SCENARIOS[scenario]
+    if method == "GET":
+        return await client.get(path)
+    if salt_code:
+        # A unique no-op statement defeats the result cache (comments are normalized away)
+        code = f"{code}\n_benchmark_salt = 0x{random.getrandbits(64):x}\n"
+    return await client.post(path, json={"problem_id": problem_id, "code": code, "language": "python"})
+
+
+async def worker(client, plan, samples, salt_code):
+    while plan:
+        scenario = plan.pop()
+        start = time.perf_counter()
+        try:
+            response = await run_request(client, scenario, salt_code)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        samples[scenario].append((time.perf_counter() - start, ok))
+
+
+async def run_benchmark(args):
+    weights = parse_mix(args.mix)
+    rng = random.Random(args.seed)
+    plan = rng.choices(list(weights), weights=list(weights.values()), k=args.requests)
+
+    if args.url:
+        app = None
+        client = httpx.AsyncClient(base_url=args.url.rstrip("/"), timeout=args.timeout)
+    else:
+        app = load_in_process_app()
+        await app.router.startup()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=args.timeout)
+
+    samples = defaultdict(list)
+    try:
+        # Warm up the problem catalog and sandbox pool before measuring
+        for _ in range(args.warmup):
+            await run_request(client, "fast", True)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client, plan, samples, not args.allow_cache) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+    finally:
+        await client.aclose()
+        if app is not None:
+            await app.router.shutdown()
+
+    return summarize(samples, elapsed, args)
+
+
+def summarize(samples, elapsed, args):
+    report = {
+        "target": args.url or "in-process",
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "elapsed_seconds": elapsed,
+        "throughput_rps": args.requests / elapsed if elapsed else 0.0,
+        "scenarios": {},
+    }
+    everything = []
+    for scenario in sorted(samples):
+        latencies = sorted(latency for latency, _ in samples[scenario])
+        everything.extend(latencies)
+        report["scenarios"][scenario] = summarize_latencies(latencies, samples[scenario])
+    everything.sort()
+    report["overall"] = summarize_latencies(everything, [s for values in samples.values() for s in values])
+    return report
+
+
+def summarize_latencies(latencies, scenario_samples):
+    return {
+        "count": len(latencies),
+        "errors": sum(1 for _, ok in scenario_samples if not ok),
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+    }
+
+
+def print_report(report):
+    print(f"\nTarget: {report['target']}  concurrency={report['concurrency']}  requests={report['requests']}")
+    print(f"Elapsed {report['elapsed_seconds']:.2f}s, throughput {report['throughput_rps']:.1f} req/s\n")
+    print(f"{'scenario':<15}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    rows = list(report["scenarios"].items()) + [("overall", report["overall"])]
+    for name, stats in rows:
+        print(
+            f"{name:<15}{stats['count']:>7}{stats['errors']:>8}"
+            f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['max_ms']:>10.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the judge endpoints")
+    parser.add_argument("--url", help="Backend base URL; omit to run the app in-process against an in-memory database")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=200, help="Total requests to send")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Comma-separated scenario=weight pairs")
+    parser.add_argument("--warmup", type=int, default=3, help="Unmeasured requests sent first")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request client timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the scenario order")
+    parser.add_argument("--allow-cache", action="store_true", help="Send identical code so repeated submissions can hit the result cache")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_benchmark(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
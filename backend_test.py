@@ -238,6 +238,63 @@ def two_sum(nums, target):
         print(f"Found {len(submissions)} submissions in the database")
         print("✅ Database integration test passed")
 
+    def test_submissions_pagination(self):
+        """Test cursor pagination and list view of GET /api/submissions"""
+        print("\n--- Testing Submissions History: Pagination ---")
+        
+        response = requests.get(f"{API_BASE_URL}/submissions", params={"limit": 1, "view": "list"})
+        self.assertEqual(response.status_code, 200)
+        first_page = response.json()
+        self.assertLessEqual(len(first_page), 1)
+        
+        # List view leaves out code and per-case results
+        for submission in first_page:
+            self.assertNotIn("code", submission)
+            self.assertNotIn("test_results", submission["result"])
+        
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor:
+            response = requests.get(f"{API_BASE_URL}/submissions", params={"limit": 1, "view": "list", "cursor": cursor})
+            self.assertEqual(response.status_code, 200)
+            second_page = response.json()
+            if second_page:
+                self.assertNotEqual(first_page[0]["id"], second_page[0]["id"])
+            print("✅ Next page follows the cursor")
+        
+        response = requests.get(f"{API_BASE_URL}/submissions", params={"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+        print("✅ Submissions pagination test passed")
+
+    def test_job_queue(self):
+        """Test queued judging via POST /api/jobs and GET /api/jobs/{id}"""
+        print("\n--- Testing Judge Queue ---")
+        
+        solution = """
+def fibonacci(n):
+    a, b = 0, 1
+    for _ in range(n):
+        a, b = b, a + b
+    return a
+"""
+        response = requests.post(f"{API_BASE_URL}/jobs", json={"problem_id": "fibonacci", "code": solution, "language": "python"})
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()["id"]
+        print(f"Queued job {job_id}")
+        
+        # Poll until a judge worker finishes the job
+        for _ in range(30):
+            job = requests.get(f"{API_BASE_URL}/jobs/{job_id}").json()
+            if job["status"] in ("completed", "failed"):
+                break
+            time.sleep(1)
+        
+        self.assertEqual(job["status"], "completed")
+        self.assertTrue(job["result"]["success"])
+        
+        response = requests.get(f"{API_BASE_URL}/jobs/non-existent-job")
+        self.assertEqual(response.status_code, 404)
+        print("✅ Judge queue test passed")
+
     def execute_code(self, problem_id, code):
         """Helper method to execute code for a problem"""
         payload = {
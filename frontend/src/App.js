@@ -101,6 +101,35 @@ const ProblemSolver = ({ problem, onBack }) => {
   const [code, setCode] = useState('');
   const [result, setResult] = useState(null);
   const [loading, setLoading] = useState(false);
+  const [runResult, setRunResult] = useState(null);
+  const [running, setRunning] = useState(false);
+
+  // Try the code on the sample input only; nothing is judged or saved
+  const handleRun = async () => {
+    if (!code.trim()) {
+      alert('Please write some code before running!');
+      return;
+    }
+
+    setRunning(true);
+    try {
+      const response = await axios.post(`${API}/run`, {
+        problem_id: problem.id,
+        code: code,
+        language: 'python'
+      });
+      setRunResult(response.data);
+    } catch (error) {
+      console.error('Run failed:', error);
+      setRunResult({
+        output: '',
+        error: error.response?.data?.detail || 'Run failed. Please try again.',
+        passed: false
+      });
+    } finally {
+      setRunning(false);
+    }
+  };
 
   const handleSubmit = async () => {
     if (!code.trim()) {
@@ -180,10 +209,24 @@ const ProblemSolver = ({ problem, onBack }) => {
           />
           
           <div className="submit-section">
+            <button
+              className="submit-button run-button"
+              onClick={handleRun}
+              disabled={running || loading}
+            >
+              {running ? (
+                <>
+                  <div className="button-spinner"></div>
+                  Running...
+                </>
+              ) : (
+                '▶️ Run Sample'
+              )}
+            </button>
             <button
               className="submit-button"
               onClick={handleSubmit}
-              disabled={loading}
+              disabled={loading || running}
             >
               {loading ? (
                 <>
@@ -191,11 +234,49 @@ const ProblemSolver = ({ problem, onBack }) => {
                   Running Tests...
                 </>
               ) : (
-                '🚀 Run Code'
+                '🚀 Submit'
               )}
             </button>
           </div>
 
+          {runResult && (
+            <div className="results-section">
+              <div className={`result-header ${runResult.passed ? 'success' : 'failure'}`}>
+                <h3>
+                  {runResult.passed ? '✅ Sample Passed' : '❌ Sample Failed'}
+                </h3>
+              </div>
+
+              <div className="test-results">
+                <div
+                  className="test-result"
+                  style={{ borderLeft: `4px solid ${getResultColor(runResult.passed)}` }}
+                >
+                  <div className="test-details">
+                    <div className="test-outputs">
+                      <div className="expected-output">
+                        <strong>Expected:</strong>
+                        <pre>{runResult.expected_output ?? problem.sample_output}</pre>
+                      </div>
+                      <div className="actual-output">
+                        <strong>Your Output:</strong>
+                        <pre style={{ color: runResult.passed ? '#10b981' : '#ef4444' }}>
+                          {runResult.output || runResult.error || 'No output'}
+                        </pre>
+                      </div>
+                    </div>
+                    {runResult.stdout && (
+                      <div className="test-input">
+                        <strong>Printed:</strong>
+                        <pre>{runResult.stdout}</pre>
+                      </div>
+                    )}
+                  </div>
+                </div>
+              </div>
+            </div>
+          )}
+
           {result && (
             <div className="results-section">
               <div className={`result-header ${result.success ? 'success' : 'failure'}`}>
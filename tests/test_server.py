@@ -0,0 +1,921 @@
+#!/usr/bin/env python3
+"""Behaviour tests for the judge's building blocks, run in-process without MongoDB or a server.
+
+The backend is imported with Motor swapped for mongomock-motor, as backend_benchmark.py does.
+"""
+import json
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "unit_tests")
+os.environ.setdefault("HOST_CALIBRATION_FILE", os.path.join(tempfile.mkdtemp(), "host_calibration.json"))
+os.environ.setdefault("TEST_DATA_DIR", tempfile.mkdtemp())
+os.environ.setdefault("ADMIN_TOKEN", "unit-test-admin")
+
+import motor.motor_asyncio
+from mongomock_motor import AsyncMongoMockClient
+from pymongo.errors import AutoReconnect
+
+motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+import server
+from fastapi.testclient import TestClient
+
+ADMIN_HEADERS = {"X-Admin-Token": os.environ["ADMIN_TOKEN"]}
+
+
+class FixedSpeedCalibration(server.HostCalibration):
+    """Calibration whose measurements are scripted"""
+    
+    def __init__(self, path, max_drift, measurements):
+        super().__init__(path, max_drift)
+        self.measurements = list(measurements)
+    
+    def measure(self):
+        return self.measurements.pop(0)
+
+
+class HostCalibrationTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "host_calibration.json")
+    
+    def test_factor_spread(self):
+        """Repeated calibrations on one host measure alike and agree on the factor"""
+        calibration = server.HostCalibration(self.path, server.CALIBRATION_MAX_DRIFT)
+        factors, measured = [], []
+        for _ in range(3):
+            factors.append(calibration.calibrate())
+            measured.append(calibration.measured)
+        self.assertLess(max(measured) / min(measured), 1.3)
+        # The stored factor holds the limits still unless a measurement is far off, and then moves them boundedly
+        self.assertLessEqual(max(factors) / min(factors), (1 + server.CALIBRATION_MAX_DRIFT) ** 2 + 1e-9)
+    
+    def test_drift_is_bounded_by_the_stored_factor(self):
+        """Small drift keeps the stored factor, large drift moves it by at most the bound"""
+        calibration = FixedSpeedCalibration(self.path, 0.15, [1.0, 1.1, 2.0, 0.5])
+        self.assertEqual(calibration.calibrate(), 1.0)
+        self.assertEqual(calibration.calibrate(), 1.0)
+        self.assertAlmostEqual(calibration.drift, 0.1)
+        self.assertEqual(calibration.calibrate(), 1.15)
+        self.assertEqual(calibration.calibrate(), round(1.15 * 0.85, 3))
+        # A new process on the same host starts from what the last one stored
+        self.assertEqual(FixedSpeedCalibration(self.path, 0.15, [0.98]).calibrate(), round(1.15 * 0.85, 3))
+    
+    def test_scale(self):
+        calibration = FixedSpeedCalibration(self.path, 0.15, [2.0])
+        calibration.calibrate()
+        self.assertEqual(calibration.scale(1.5), 3.0)
+
+
+class HiddenCaseRedactionTest(unittest.TestCase):
+    """Hidden test cases must not reveal their data through anything the submission controls"""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.client = TestClient(server.app)
+        cls.client.__enter__()
+        echo = {
+            "title": "Echo", "description": "Print the input", "difficulty": "Easy",
+            "sample_input": "1", "sample_output": "1",
+            "test_cases": [{"input": "1", "expected_output": "1"}, {"input": "12", "expected_output": "12", "hidden": True}]
+        }
+        increment = dict(echo, entry_point="inc", parameters=[{"name": "x", "type": "int"}], return_type="int",
+                         test_cases=[{"input": "1", "expected_output": "2"}, {"input": "12", "expected_output": "13", "hidden": True}])
+        for problem_id, problem in (("echo", echo), ("increment", increment)):
+            response = cls.client.put(f"/api/problems/{problem_id}", json=problem, headers=ADMIN_HEADERS)
+            assert response.status_code == 200, response.text
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.__exit__(None, None, None)
+    
+    def execute(self, problem_id, code, language="python"):
+        response = self.client.post("/api/execute", json={"problem_id": problem_id, "code": code, "language": language})
+        self.assertEqual(response.status_code, 200, response.text)
+        return response.json()["test_results"]
+    
+    def assertHiddenCaseClean(self, test_results):
+        hidden = test_results[-1]
+        self.assertTrue(hidden["hidden"])
+        self.assertEqual((hidden["input"], hidden["expected_output"], hidden["actual_output"]), ("[hidden]", "[hidden]", ""))
+        self.assertNotIn("12", hidden["error"] or "")
+        self.assertNotIn("13", hidden["error"] or "")
+    
+    def test_error_text_written_by_the_submission(self):
+        """Errors that merely start like a server message are replaced"""
+        code = (
+            "import os, sys\n"
+            "def inc(x):\n"
+            "    sys.stderr.write('Execution error: hidden input was %r' % x)\n"
+            "    raise RuntimeError('Execution error: hidden input was %r' % x)\n"
+        )
+        test_results = self.execute("increment", code)
+        self.assertIn("1", test_results[0]["error"])
+        self.assertHiddenCaseClean(test_results)
+        self.assertEqual(test_results[-1]["error"], "Runtime error")
+    
+    @unittest.skipUnless(server.get_runner("c"), "gcc is not installed")
+    def test_program_stderr(self):
+        code = (
+            "#include <stdio.h>\n#include <stdlib.h>\n"
+            "int main(){char b[64];scanf(\"%63s\",b);fprintf(stderr,\"Compilation of hidden input: %s\",b);exit(3);}\n"
+        )
+        test_results = self.execute("echo", code, "c")
+        self.assertEqual(test_results[0]["error"], "Compilation of hidden input: 1")
+        self.assertHiddenCaseClean(test_results)
+    
+    def test_load_error_reading_the_inputs(self):
+        """Every input is loaded before the code, so a load error can quote the hidden ones"""
+        code = "import sys\nraise ValueError(repr(sys._getframe(1).f_locals.get('inputs')))\ndef inc(x):\n    return x + 1\n"
+        test_results = self.execute("increment", code)
+        self.assertHiddenCaseClean(test_results)
+        self.assertEqual(test_results[-1]["error"], "Runtime error")
+    
+    def test_server_verdicts_are_kept(self):
+        test_results = self.execute("increment", "def inc(x):\n    while True:\n        pass\n")
+        self.assertTrue(test_results[-1]["error"].startswith("Code execution timed out"))
+        test_results = self.execute("increment", "def inc(x):\n    return x + 1\n")
+        self.assertTrue(all(test_result["passed"] for test_result in test_results))
+        self.assertIsNone(test_results[-1]["error"])
+    
+    def test_redact_hidden(self):
+        test_result = {"input": "12", "expected_output": "13", "actual_output": "12", "stdout": "12", "error": "12 is wrong"}
+        redacted = server.redact_hidden(dict(test_result), None)
+        self.assertEqual(redacted["error"], "Runtime error")
+        self.assertNotIn("stdout", redacted)
+        self.assertEqual(server.redact_hidden(dict(test_result), "Memory limit exceeded")["error"], "Memory limit exceeded")
+        self.assertIsNone(server.redact_hidden(dict(test_result, error=None), None)["error"])
+        # Only exact limit messages become verdicts on their own
+        self.assertEqual(server._error_result("Memory limit exceeded")["verdict"], "Memory limit exceeded")
+        self.assertIsNone(server._error_result("Memory limit exceeded: 12")["verdict"])
+
+
+class FileBackedTestCaseTest(unittest.TestCase):
+    """Test cases stored in the test data store run from their files and show only previews"""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.client = TestClient(server.app)
+        cls.client.__enter__()
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.__exit__(None, None, None)
+    
+    def upload(self, data):
+        response = self.client.post("/api/test-files", content=data, headers=ADMIN_HEADERS)
+        self.assertEqual(response.status_code, 201, response.text)
+        return response.json()["digest"]
+    
+    def test_structured_problem_with_file_cases(self):
+        numbers = list(range(5000))
+        input_digest = self.upload((json.dumps(numbers) + "\n").encode())
+        expected_digest = self.upload(json.dumps(sum(numbers)).encode())
+        problem = {
+            "title": "Sum", "description": "Add them up", "difficulty": "Easy",
+            "sample_input": "[1, 2]", "sample_output": "3",
+            "entry_point": "total", "parameters": [{"name": "nums", "type": "list[int]"}], "return_type": "int",
+            "test_cases": [
+                {"input": "[1, 2]", "expected_output": "3"},
+                {"input_file": input_digest, "expected_file": expected_digest},
+                {"input_file": input_digest, "expected_file": expected_digest, "hidden": True}
+            ]
+        }
+        response = self.client.put("/api/problems/sum-file", json=problem, headers=ADMIN_HEADERS)
+        self.assertEqual(response.status_code, 200, response.text)
+        public = self.client.get("/api/problems/sum-file").json()
+        self.assertEqual(len(public["test_cases"]), 2)
+        
+        result = self.client.post("/api/execute", json={"problem_id": "sum-file", "code": "def total(nums):\n    return sum(nums)\n"}).json()
+        self.assertTrue(result["success"], result)
+        file_case = result["test_results"][1]
+        self.assertTrue(file_case["input"].endswith(" bytes)"))
+        self.assertLessEqual(len(file_case["input"]), server.TEST_PREVIEW_BYTES + 32)
+        self.assertEqual(result["test_results"][2]["input"], "[hidden]")
+        
+        result = self.client.post("/api/execute", json={"problem_id": "sum-file", "code": "def total(nums):\n    return sum(nums) + 1\n"}).json()
+        self.assertEqual([test_result["passed"] for test_result in result["test_results"]], [False, False, False])
+    
+    def test_missing_file_is_rejected(self):
+        problem = {
+            "title": "Missing", "description": "d", "difficulty": "Easy", "sample_input": "1", "sample_output": "1",
+            "test_cases": [{"input_file": "0" * 64, "expected_output": "1"}]
+        }
+        response = self.client.put("/api/problems/missing-file", json=problem, headers=ADMIN_HEADERS)
+        self.assertEqual(response.status_code, 400)
+    
+    def test_text_matches_file(self):
+        path = os.path.join(tempfile.mkdtemp(), "expected")
+        with open(path, "w") as expected_file:
+            expected_file.write("\n  1 2 3\n4\n\n")
+        self.assertTrue(server.text_matches_file("1 2 3\n4", path))
+        self.assertTrue(server.text_matches_file("1 2 3\n4\n", path, chunk_size=2))
+        self.assertFalse(server.text_matches_file("1 2 3\n5", path, chunk_size=2))
+        self.assertFalse(server.text_matches_file("1 2 3", path))
+
+
+class ProblemCatalogETagTest(unittest.TestCase):
+    """Problem reads carry an ETag and answer 304 when the client already holds that version"""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.client = TestClient(server.app)
+        cls.client.__enter__()
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.__exit__(None, None, None)
+    
+    def test_if_none_match(self):
+        for path in ("/api/problems", "/api/problems/fibonacci"):
+            with self.subTest(path):
+                first = self.client.get(path)
+                self.assertEqual(first.status_code, 200)
+                etag = first.headers["ETag"]
+                cached = self.client.get(path, headers={"If-None-Match": etag})
+                self.assertEqual(cached.status_code, 304)
+                self.assertEqual(cached.content, b"")
+                self.assertEqual(cached.headers["ETag"], etag)
+                self.assertEqual(self.client.get(path, headers={"If-None-Match": f'"other", {etag}'}).status_code, 304)
+                self.assertEqual(self.client.get(path, headers={"If-None-Match": '"other"'}).status_code, 200)
+    
+    def test_saving_a_problem_changes_its_etag(self):
+        problem = {
+            "title": "Versioned", "description": "first", "difficulty": "Easy", "sample_input": "1", "sample_output": "1",
+            "test_cases": [{"input": "1", "expected_output": "1"}]
+        }
+        self.assertEqual(self.client.put("/api/problems/versioned", json=problem, headers=ADMIN_HEADERS).status_code, 200)
+        etag = self.client.get("/api/problems/versioned").headers["ETag"]
+        list_etag = self.client.get("/api/problems").headers["ETag"]
+        problem["description"] = "second"
+        self.assertEqual(self.client.put("/api/problems/versioned", json=problem, headers=ADMIN_HEADERS).status_code, 200)
+        fresh = self.client.get("/api/problems/versioned", headers={"If-None-Match": etag})
+        self.assertEqual(fresh.status_code, 200)
+        self.assertEqual(fresh.json()["description"], "second")
+        self.assertEqual(self.client.get("/api/problems", headers={"If-None-Match": list_etag}).status_code, 200)
+
+
+class RunSampleTest(unittest.TestCase):
+    """/api/run tries code on a problem's sample, which saving a problem checks against its signature"""
+    
+    SOLUTIONS = {
+        "two-sum": (
+            "def two_sum(nums, target):\n"
+            "    seen = {}\n"
+            "    for i, num in enumerate(nums):\n"
+            "        if target - num in seen:\n"
+            "            return [seen[target - num], i]\n"
+            "        seen[num] = i\n"
+        ),
+        "palindrome-check": (
+            "def is_palindrome(s):\n"
+            "    kept = [c.lower() for c in s if c.isalnum()]\n"
+            "    return kept == kept[::-1]\n"
+        ),
+        "fibonacci": (
+            "def fibonacci(n):\n"
+            "    a, b = 0, 1\n"
+            "    for _ in range(n):\n"
+            "        a, b = b, a + b\n"
+            "    return a\n"
+        )
+    }
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.client = TestClient(server.app)
+        cls.client.__enter__()
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.__exit__(None, None, None)
+    
+    def test_seeded_samples_run(self):
+        self.assertEqual(set(self.SOLUTIONS), {problem["id"] for problem in server.SAMPLE_PROBLEMS})
+        for problem_id, code in self.SOLUTIONS.items():
+            with self.subTest(problem_id):
+                response = self.client.post("/api/run", json={"problem_id": problem_id, "code": code})
+                self.assertEqual(response.status_code, 200, response.text)
+                self.assertTrue(response.json()["passed"], response.json())
+    
+    def test_sample_must_fit_the_signature(self):
+        problem = {
+            "title": "Double", "description": "d", "difficulty": "Easy",
+            "entry_point": "double", "parameters": [{"name": "x", "type": "int"}], "return_type": "int",
+            "test_cases": [{"input": "1", "expected_output": "2"}]
+        }
+        for sample_input, sample_output in (("one", "2"), ("1", "2.5"), ("1\n2", "2")):
+            with self.subTest(sample_input=sample_input, sample_output=sample_output):
+                response = self.client.put("/api/problems/double", json=dict(problem, sample_input=sample_input, sample_output=sample_output),
+                                           headers=ADMIN_HEADERS)
+                self.assertEqual(response.status_code, 400, response.text)
+                self.assertIn("Sample", response.json()["detail"])
+
+
+class StructuredJudgingTest(unittest.TestCase):
+    def problem(self, **overrides):
+        problem = {
+            "entry_point": "two_sum",
+            "parameters": [{"name": "nums", "type": "list[int]"}, {"name": "target", "type": "int"}],
+            "return_type": "list[int]",
+            "test_cases": [
+                {"input": "[2, 7, 11, 15]\n9", "expected_output": "[0, 1]"},
+                {"input": "[3, 3]\n6", "expected_output": "[0, 1]"}
+            ]
+        }
+        problem.update(overrides)
+        return problem
+    
+    def test_compile_structured_tests(self):
+        tests = server.compile_structured_tests(self.problem())
+        self.assertEqual(tests.args, [[[2, 7, 11, 15], 9], [[3, 3], 6]])
+        self.assertEqual(tests.expected_value(1), [0, 1])
+        self.assertEqual(json.loads(tests.args_blob), tests.args)
+        self.assertEqual(tests.stdin_inputs[0], "[2, 7, 11, 15]\n9")
+    
+    def test_compile_structured_tests_rejects_bad_cases(self):
+        bad_problems = {
+            "not a function name": self.problem(entry_point="two-sum"),
+            "unknown type": self.problem(return_type="list[number]"),
+            "wrong arity": self.problem(test_cases=[{"input": "[1, 2]", "expected_output": "[0, 1]"}]),
+            "wrong argument type": self.problem(test_cases=[{"input": "[1, 2]\n\"3\"", "expected_output": "[0, 1]"}]),
+            "wrong return type": self.problem(test_cases=[{"input": "[1, 2]\n3", "expected_output": "[true]"}]),
+            "invalid JSON": self.problem(test_cases=[{"input": "[1, 2\n3", "expected_output": "[0, 1]"}])
+        }
+        for reason, problem in bad_problems.items():
+            with self.subTest(reason):
+                with self.assertRaises(ValueError):
+                    server.compile_structured_tests(problem)
+    
+    def test_values_match(self):
+        exact = {"comparator": "exact"}
+        self.assertTrue(server.values_match([0, 1], [0, 1], exact))
+        self.assertFalse(server.values_match([1, 0], [0, 1], exact))
+        # Booleans are not numbers, in either direction
+        self.assertFalse(server.values_match(1, True, exact))
+        self.assertFalse(server.values_match(True, 1, exact))
+        self.assertTrue(server.values_match({"a": [1, 2]}, {"a": [1, 2]}, exact))
+        
+        unordered = {"comparator": "unordered"}
+        self.assertTrue(server.values_match([1, 0], [0, 1], unordered))
+        self.assertTrue(server.values_match([[2, 1], {"b": 1, "a": 2}], [{"a": 2, "b": 1}, [2, 1]], unordered))
+        self.assertFalse(server.values_match([0, 0, 1], [0, 1, 1], unordered))
+        
+        close = {"comparator": "float", "float_tolerance": 1e-3}
+        self.assertTrue(server.values_match([1.0004, 2], [1.0, 2.0], close))
+        self.assertFalse(server.values_match(1.01, 1.0, close))
+        self.assertFalse(server.values_match(1.0000001, 1.0, exact))
+
+
+class ComplexityTest(unittest.TestCase):
+    SIZES = [50000, 100000, 200000, 400000, 800000]
+    
+    def samples(self, growth, noise=(1.0, 1.04, 0.97, 1.02, 1.0)):
+        return [(n, 1e-8 * growth(n) * jitter) for n, jitter in zip(self.SIZES, noise)]
+    
+    def test_fit_complexity(self):
+        self.assertEqual(server.fit_complexity(self.samples(lambda n: n)), "O(n)")
+        self.assertEqual(server.fit_complexity(self.samples(lambda n: n * n / 1000)), "O(n^2)")
+        self.assertEqual(server.fit_complexity(self.samples(lambda n: 1e6)), "O(1)")
+        self.assertEqual(server.fit_complexity(self.samples(lambda n: n ** 3 / 1e8)), "O(n^3)")
+    
+    def test_close_fits_go_to_the_simpler_class(self):
+        # Cache effects make linear work grow a little faster than n
+        self.assertEqual(server.fit_complexity(self.samples(lambda n: n ** 1.08)), "O(n)")
+    
+    def assess(self, ladder, enforce=False):
+        problem = {"complexity": {"sizes": [1000, 2000, 4000], "repeats": 1, "expected": "O(n)", "enforce": enforce}}
+        return server.assess_complexity(problem, [{"passed": True}], ladder)
+    
+    def test_ladder_timeout_is_out_of_bound_and_not_cached(self):
+        ladder = [{"success": True, "cpu_time": 0.05, "error": None}, server._timeout_result(2)]
+        report = self.assess(ladder, enforce=True)
+        self.assertIs(report.within_bound, False)
+        self.assertEqual(report.note, "Ran out of time at n=2000")
+        result = server.summarize_test_results([{"passed": True}], 1, report)
+        self.assertFalse(result.success)
+        self.assertFalse(server.is_cacheable(result))
+    
+    def test_measured_report_is_cached(self):
+        ladder = [{"success": True, "cpu_time": seconds, "error": None} for seconds in (0.02, 0.04, 0.08)]
+        report = self.assess(ladder)
+        self.assertEqual(report.estimated, "O(n)")
+        self.assertIs(report.within_bound, True)
+        self.assertTrue(server.is_cacheable(server.summarize_test_results([{"passed": True}], 1, report)))
+    
+    def test_check_complexity(self):
+        valid = {"entry_point": "f", "complexity": {
+            "generator": "def generate(n, rng):\n    return [n]\n", "sizes": [10, 20, 40], "expected": "O(n)", "repeats": 1, "enforce": False
+        }}
+        server.check_complexity(valid)
+        for reason, spec in {
+            "too few sizes": {"sizes": [10, 20]},
+            "not increasing": {"sizes": [10, 40, 20]},
+            "too many repeats": {"repeats": 11},
+            "generator does not compile": {"generator": "def generate(n rng):"}
+        }.items():
+            with self.subTest(reason):
+                with self.assertRaises(ValueError):
+                    server.check_complexity(dict(valid, complexity=dict(valid["complexity"], **spec)))
+
+
+class ResultCacheTest(unittest.TestCase):
+    def result(self, success=True, error=None):
+        test_results = [{"test_case": 1, "passed": success, "error": error}]
+        return server.ExecutionResult(success=success, execution_time=0.01, test_results=test_results, total_passed=int(success), total_tests=1)
+    
+    def test_hit_miss_and_lru_eviction(self):
+        cache = server.ResultCache(max_entries=2, ttl=60)
+        
+        async def scenario():
+            await cache.put("a", self.result())
+            await cache.put("b", self.result())
+            hit = await cache.get("a")
+            # "b" is now the least recently used
+            await cache.put("c", self.result())
+            return hit, await cache.get("a"), await cache.get("b"), await cache.get("c")
+        
+        hit, a, b, c = server.asyncio.run(scenario())
+        self.assertTrue(hit.success)
+        self.assertIsNotNone(a)
+        self.assertIsNone(b)
+        self.assertIsNotNone(c)
+        self.assertEqual((cache.hits, cache.misses, cache.evictions), (3, 1, 1))
+    
+    def test_entries_expire(self):
+        cache = server.ResultCache(max_entries=10, ttl=60)
+        
+        async def scenario():
+            with mock.patch.object(server.time, "monotonic", return_value=0):
+                await cache.put("a", self.result())
+            with mock.patch.object(server.time, "monotonic", return_value=30):
+                fresh = await cache.get("a")
+            with mock.patch.object(server.time, "monotonic", return_value=61):
+                stale = await cache.get("a")
+            return fresh, stale
+        
+        fresh, stale = server.asyncio.run(scenario())
+        self.assertIsNotNone(fresh)
+        self.assertIsNone(stale)
+        self.assertEqual(cache.stats()["entries"], 0)
+    
+    def test_uncacheable_results_are_not_stored(self):
+        cache = server.ResultCache(max_entries=10, ttl=60)
+        
+        async def scenario():
+            await cache.put("timeout", self.result(False, "Code execution timed out after 5 seconds"))
+            await cache.put("sandbox", self.result(False, "Execution error: Sandbox worker exited unexpectedly"))
+            await cache.put("wrong", self.result(False))
+            return [await cache.get(key) is not None for key in ("timeout", "sandbox", "wrong")]
+        
+        self.assertEqual(server.asyncio.run(scenario()), [False, False, True])
+    
+    def test_mongo_tier_outlives_the_process_entry(self):
+        cache = server.ResultCache(max_entries=1, ttl=60, use_mongo=True)
+        key = server.ResultCache.key("cache-test", "python", "print(1)", "v1")
+        
+        async def scenario():
+            await cache.put(key, self.result())
+            await cache.put("other", self.result())
+            return await cache.get(key)
+        
+        self.assertIsNotNone(server.asyncio.run(scenario()))
+        self.assertEqual((cache.hits, cache.mongo_hits), (0, 1))
+    
+    def test_key_ignores_comments_and_spacing(self):
+        key = server.ResultCache.key
+        self.assertEqual(key("p", "python", "x = 1  # one\n\nprint(x)\n", "v1"), key("p", "python", "x=1\nprint( x )\n", "v1"))
+        self.assertNotEqual(key("p", "python", "print(1)", "v1"), key("p", "python", "print(1)", "v2"))
+
+
+class SubmissionWriterTest(unittest.TestCase):
+    def documents(self, problem_id, count):
+        result = server.ExecutionResult(success=True, execution_time=0.01, cpu_time=0.01, test_results=[], total_passed=0, total_tests=0)
+        return [server.SubmissionRecord(problem_id=problem_id, code=f"print({i})", language="python", result=result).dict() for i in range(count)]
+    
+    def stored(self, problem_id):
+        return server.db.submissions.count_documents({"problem_id": problem_id})
+    
+    def test_full_batches_and_flush(self):
+        writer = server.SubmissionWriter(batch_size=3, flush_seconds=60, buffer_limit=100, retry_seconds=0.01)
+        
+        async def scenario():
+            writer.start()
+            try:
+                documents = self.documents("writer-batches", 4)
+                for document in documents[:3]:
+                    await writer.add(document)
+                # A full batch is written without waiting for the flush interval
+                for _ in range(100):
+                    if await self.stored("writer-batches") == 3:
+                        break
+                    await server.asyncio.sleep(0.01)
+                counts = [await self.stored("writer-batches")]
+                await writer.add(documents[3])
+                counts.append(await self.stored("writer-batches"))
+                await writer.flush(5)
+                counts.append(await self.stored("writer-batches"))
+                return counts, writer.outstanding
+            finally:
+                await writer.close(5)
+        
+        counts, outstanding = server.asyncio.run(scenario())
+        self.assertEqual(counts, [3, 3, 4])
+        self.assertEqual(outstanding, 0)
+    
+    def test_close_drains_the_buffer(self):
+        writer = server.SubmissionWriter(batch_size=100, flush_seconds=60, buffer_limit=100, retry_seconds=0.01)
+        
+        async def scenario():
+            writer.start()
+            for document in self.documents("writer-drain", 5):
+                await writer.add(document)
+            before = await self.stored("writer-drain")
+            await writer.close(5)
+            return before, await self.stored("writer-drain")
+        
+        self.assertEqual(server.asyncio.run(scenario()), (0, 5))
+    
+    def test_persist_metrics_carry_request_labels(self):
+        writer = server.SubmissionWriter(batch_size=100, flush_seconds=60, buffer_limit=100, retry_seconds=0.01)
+        labels = (("language", "python"), ("problem", "writer-labels"), ("stage", "persist"))
+        
+        async def scenario():
+            writer.start()
+            for document in self.documents("writer-labels", 2):
+                server.judge_labels.set({"problem": "writer-labels", "language": "python"})
+                await writer.add(document)
+            await writer.close(5)
+        
+        server.asyncio.run(scenario())
+        # Two records were written, each observed under the labels of the request that added it
+        self.assertEqual(server.judge_stage_seconds._series[labels][-2], 2)
+    
+    def test_stats_follow_written_records(self):
+        writer = server.SubmissionWriter(batch_size=100, flush_seconds=60, buffer_limit=100, retry_seconds=0.01)
+        
+        async def scenario():
+            writer.start()
+            for document in self.documents("writer-stats", 2):
+                await writer.add(document)
+            await writer.close(5)
+            return await server.db.problem_stats.find_one({"problem_id": "writer-stats"})
+        
+        stats = server.asyncio.run(scenario())
+        self.assertEqual((stats["submissions"], stats["accepted"]), (2, 2))
+
+
+class JobQueueTest(unittest.TestCase):
+    RESULT = server.ExecutionResult(success=True, execution_time=0.01, test_results=[], total_passed=0, total_tests=0)
+    
+    def submission(self, problem_id):
+        return server.CodeSubmission(problem_id=problem_id, code="print(1)")
+    
+    def test_claim_holds_a_lease_until_it_expires(self):
+        queue = server.JobQueue(workers=1, lease_seconds=30, max_attempts=3, poll_seconds=0.05)
+        
+        async def scenario():
+            await server.db.jobs.delete_many({})
+            job = await queue.enqueue(self.submission("queue-lease"))
+            first = await queue.claim()
+            leased = await queue.claim()
+            # The holder's server died: its lease lapses and another worker takes the job over
+            await server.db.jobs.update_one({"id": job["id"]}, {"$set": {"lease_until": server.datetime.utcnow() - server.timedelta(seconds=1)}})
+            second = await queue.claim()
+            return job, first, leased, second, await queue._holds(first), await queue._holds(second)
+        
+        job, first, leased, second, first_holds, second_holds = server.asyncio.run(scenario())
+        self.assertEqual((first["id"], first["status"], first["attempts"]), (job["id"], "running", 1))
+        self.assertIsNone(leased)
+        self.assertEqual((second["id"], second["attempts"]), (job["id"], 2))
+        self.assertFalse(first_holds)
+        self.assertTrue(second_holds)
+    
+    def test_job_is_retried_after_an_error(self):
+        """A database error finishing a job leaves the worker running and the job to be claimed again"""
+        queue = server.JobQueue(workers=1, lease_seconds=0.3, max_attempts=3, poll_seconds=0.05)
+        finish = queue._finish
+        failures = []
+        
+        async def judge_submission(submission, problem_data):
+            return self.RESULT
+        
+        async def record_submission(submission, result):
+            return server.SubmissionRecord(problem_id=submission.problem_id, code=submission.code, language=submission.language, result=result)
+        
+        async def flaky_finish(job, fields):
+            if not failures:
+                failures.append(job["attempts"])
+                raise AutoReconnect("primary stepped down")
+            await finish(job, fields)
+        
+        async def scenario():
+            await server.db.jobs.delete_many({})
+            queue.start()
+            try:
+                job = await queue.enqueue(self.submission("queue-retry"))
+                for _ in range(200):
+                    stored = await queue.get(job["id"])
+                    if stored["status"] == "completed":
+                        break
+                    await server.asyncio.sleep(0.02)
+                return stored, all(not task.done() for task in queue._tasks)
+            finally:
+                queue.stop()
+        
+        with mock.patch.object(server.problem_catalog, "get", return_value={"id": "queue-retry", "test_cases": []}), \
+                mock.patch.object(server, "judge_submission", judge_submission), \
+                mock.patch.object(server, "record_submission", record_submission), \
+                mock.patch.object(queue, "_finish", flaky_finish):
+            stored, workers_alive = server.asyncio.run(scenario())
+        self.assertEqual(failures, [1])
+        self.assertEqual((stored["status"], stored["attempts"]), ("completed", 2))
+        self.assertTrue(workers_alive)
+
+
+class RejudgerTest(unittest.TestCase):
+    def result(self, success):
+        return server.ExecutionResult(success=success, execution_time=0.01, test_results=[], total_passed=int(success), total_tests=1)
+    
+    def store(self, problem_id, codes):
+        documents = [
+            server.SubmissionRecord(problem_id=problem_id, code=code, language="python", user_id=f"user-{i}", result=self.result(False)).dict()
+            for i, code in enumerate(codes)
+        ]
+        return server.db.submissions.insert_many(documents)
+    
+    def test_completes_sharing_runs_of_the_same_code(self):
+        rejudger = server.Rejudger(concurrency=2, batch_size=2, progress_seconds=60, stale_seconds=300)
+        judged = []
+        
+        async def judge_submission(submission, problem_data):
+            judged.append(submission.code)
+            return self.result("right" in submission.code)
+        
+        async def scenario():
+            await self.store("rejudge-complete", ["print('right')\n", "print('right')  # same run\n", "print('wrong')\n", "print('right', 2)\n"])
+            rejudge = await rejudger.start("rejudge-complete", {"test_cases": []})
+            await rejudger._tasks[rejudge["id"]]
+            submissions = await server.db.submissions.find({"problem_id": "rejudge-complete"}).to_list(None)
+            return await rejudger.get(rejudge["id"]), submissions
+        
+        with mock.patch.object(server, "judge_submission", judge_submission):
+            status, submissions = server.asyncio.run(scenario())
+        self.assertEqual(status["status"], "completed")
+        self.assertEqual((status["total"], status["processed"], status["judged"], status["changed"], status["errors"]), (4, 4, 3, 3, 0))
+        self.assertEqual(len(judged), 3)
+        self.assertEqual(sorted(document["result"]["success"] for document in submissions), [False, True, True, True])
+        self.assertTrue(all(document["rejudged_at"] for document in submissions))
+    
+    def test_failure_stops_the_other_tasks(self):
+        """A failed write fails the re-judge only once nothing else of it is still running"""
+        rejudger = server.Rejudger(concurrency=2, batch_size=1, progress_seconds=60, stale_seconds=300)
+        slow_run = {"cancelled": False}
+        
+        async def judge_submission(submission, problem_data):
+            if "slow" in submission.code:
+                try:
+                    await server.asyncio.sleep(30)
+                except server.asyncio.CancelledError:
+                    slow_run["cancelled"] = True
+                    raise
+            return self.result(True)
+        
+        async def scenario():
+            await self.store("rejudge-fail", ["print('fast')\n", "print('slow')\n"])
+            rejudge = await rejudger.start("rejudge-fail", {"test_cases": []})
+            await server.asyncio.wait_for(rejudger._tasks[rejudge["id"]], 10)
+            return await rejudger.get(rejudge["id"]), slow_run["cancelled"]
+        
+        collection = type(server.db.submissions)
+        with mock.patch.object(server, "judge_submission", judge_submission), \
+                mock.patch.object(collection, "bulk_write", side_effect=AutoReconnect("primary stepped down")):
+            status, cancelled = server.asyncio.run(scenario())
+        self.assertEqual((status["status"], status["error"]), ("failed", "primary stepped down"))
+        self.assertTrue(cancelled)
+        self.assertEqual(rejudger._tasks, {})
+
+
+class SimilarityTest(unittest.TestCase):
+    ORIGINAL = """
+def two_sum(nums, target):
+    seen = {}
+    for index, value in enumerate(nums):
+        wanted = target - value
+        if wanted in seen:
+            return [seen[wanted], index]
+        seen[value] = index
+    return []
+"""
+    # Renamed, recommented and respaced, with a changed constant
+    DISGUISED = """
+def two_sum(arr, goal):
+    # remember what we have seen
+    lookup = {}
+    for i, x in enumerate(arr):
+        need = goal - x
+        if need in lookup:
+            return [lookup[need], i]
+        lookup[x] = i
+    return [-1]
+"""
+    UNRELATED = """
+def two_sum(nums, target):
+    for i in range(len(nums)):
+        for j in range(i + 1, len(nums)):
+            if nums[i] + nums[j] == target:
+                return [i, j]
+"""
+    
+    def test_code_tokens_normalize_names_literals_and_comments(self):
+        self.assertEqual(server.code_tokens(self.ORIGINAL, "python")[:12], server.code_tokens(self.DISGUISED, "python")[:12])
+        c_tokens = server.code_tokens("int main() { /* x */ int total = 42; // y\n printf(\"%d\", total); }", "c")
+        self.assertEqual(c_tokens, ["int", "main", "(", ")", "{", "int", "V", "=", "N", ";", "printf", "(", "S", ",", "V", ")", ";", "}"])
+    
+    def test_winnow(self):
+        tokens = server.code_tokens(self.ORIGINAL, "python")
+        fingerprints = server.winnow(tokens, 10, 5)
+        self.assertTrue(fingerprints)
+        self.assertEqual(fingerprints, sorted(set(fingerprints)))
+        self.assertEqual(fingerprints, server.winnow(tokens, 10, 5))
+        # Every window of k-gram hashes contributes its minimum, so at least one per window of grams
+        self.assertGreaterEqual(len(fingerprints), (len(tokens) - 10 + 1) // 5)
+        self.assertEqual(server.winnow([], 10, 5), [])
+        self.assertEqual(len(server.winnow(["a", "b"], 10, 5)), 1)
+    
+    def test_similar(self):
+        index = server.FingerprintIndex(common_limit=20)
+        now = server.datetime.utcnow()
+        submissions = [
+            {"id": f"sim-{name}", "problem_id": "similarity-test", "language": "python", "user_id": name,
+             "submitted_at": now + server.timedelta(seconds=offset), "code": code}
+            for offset, (name, code) in enumerate([("original", self.ORIGINAL), ("disguised", self.DISGUISED), ("unrelated", self.UNRELATED)])
+        ]
+        
+        async def scenario():
+            await index.record(submissions)
+            return (
+                await index.similar("sim-original", 0.5, 10, include_same_user=False),
+                await index.similar("sim-missing", 0.5, 10, include_same_user=False),
+                await index.similar_pairs("similarity-test", 0.5, 10, include_same_user=False)
+            )
+        
+        similar, missing, pairs = server.asyncio.run(scenario())
+        self.assertEqual([match.submission_id for match in similar], ["sim-disguised"])
+        self.assertGreater(similar[0].similarity, 0.8)
+        self.assertIsNone(missing)
+        self.assertEqual([(pair.first.submission_id, pair.second.submission_id) for pair in pairs], [("sim-original", "sim-disguised")])
+    
+    def test_common_fingerprints_are_ignored(self):
+        """Code every submission shares, such as starter code, does not make submissions similar"""
+        index = server.FingerprintIndex(common_limit=2)
+        now = server.datetime.utcnow()
+        submissions = [
+            {"id": f"common-{i}", "problem_id": "common-test", "language": "python", "user_id": str(i),
+             "submitted_at": now, "code": self.ORIGINAL}
+            for i in range(3)
+        ]
+        
+        async def scenario():
+            await index.record(submissions)
+            return await index.similar("common-0", 0.1, 10, include_same_user=False)
+        
+        self.assertEqual(server.asyncio.run(scenario()), [])
+
+
+class SandboxPoolTest(unittest.TestCase):
+    def run_batch(self, pool, code):
+        job = server.BatchJob(code, ["1"], 2, {})
+        
+        async def collect():
+            return [case_result async for case_result in pool.execute_batch(job)]
+        
+        return collect()
+    
+    def test_oversized_output(self):
+        """Output past the record limit fails its case and leaves the slot free for the next batch"""
+        async def scenario():
+            pool = server.SandboxPool(1, 100, 300)
+            await pool.start()
+            try:
+                printed = await server.asyncio.wait_for(self.run_batch(pool, "print('x' * (20 * 1024 * 1024))"), 30)
+                # Written straight to the record channel, past the harness's own cap
+                garbled = await server.asyncio.wait_for(self.run_batch(
+                    pool, "import __main__\n__main__._channel.write('x' * (20 * 1024 * 1024) + '\\n')"), 30)
+                after = await server.asyncio.wait_for(self.run_batch(pool, "print('ok')"), 30)
+                return printed, garbled, after, pool._count
+            finally:
+                await pool.close()
+        
+        printed, garbled, after, count = server.asyncio.run(scenario())
+        self.assertEqual((printed[0]["error"], printed[0]["verdict"]), ("Output limit exceeded", "Output limit exceeded"))
+        self.assertFalse(garbled[0]["success"])
+        self.assertTrue(after[0]["success"], after)
+        self.assertLessEqual(count, 1)
+    
+    def test_slot_is_released_when_the_worker_dies(self):
+        async def scenario():
+            pool = server.SandboxPool(1, 100, 300)
+            await pool.start()
+            try:
+                # The forked child takes its warm worker down with it
+                failed = await server.asyncio.wait_for(self.run_batch(pool, "import os, signal\nos.kill(os.getppid(), signal.SIGKILL)\nos.kill(os.getpid(), signal.SIGKILL)"), 30)
+                after = await server.asyncio.wait_for(self.run_batch(pool, "print('ok')"), 30)
+                return failed, after, pool._count
+            finally:
+                await pool.close()
+        
+        failed, after, count = server.asyncio.run(scenario())
+        self.assertFalse(failed[0]["success"])
+        self.assertTrue(after[0]["success"], after)
+        self.assertLessEqual(count, 1)
+    
+    def test_slot_is_released_when_closing_the_session_fails(self):
+        async def scenario():
+            pool = server.SandboxPool(1, 100, 300)
+            await pool.start()
+            try:
+                with mock.patch.object(server.WarmHarnessSession, "close", side_effect=RuntimeError("close failed")):
+                    with self.assertRaises(RuntimeError):
+                        await server.asyncio.wait_for(self.run_batch(pool, "print('ok')"), 30)
+                after = await server.asyncio.wait_for(self.run_batch(pool, "print('ok')"), 30)
+                return after, pool._count
+            finally:
+                await pool.close()
+        
+        after, count = server.asyncio.run(scenario())
+        self.assertTrue(after[0]["success"], after)
+        self.assertLessEqual(count, 1)
+
+
+class CompilerLimitsTest(unittest.TestCase):
+    def test_build_runs_under_the_compile_limits(self):
+        limits = server.LANGUAGE_RUNNERS["c"].compile_limits()
+        with tempfile.TemporaryDirectory() as directory:
+            output, deterministic = server.asyncio.run(server.run_compiler(["sh", "-c", "ulimit -v; ulimit -t; exit 1"], directory, limits))
+        self.assertTrue(deterministic)
+        self.assertEqual(output.split("\n")[1:], [str(limits["memory_bytes"] // 1024), str(limits["cpu_seconds"])])
+    
+    @unittest.skipUnless(server.get_runner("c"), "gcc is not installed")
+    def test_compiler_out_of_memory_fails_the_build(self):
+        runner = server.LANGUAGE_RUNNERS["c"]
+        limits = dict(runner.compile_limits(), memory_bytes=16 * 1024 * 1024)
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, runner.source_name), "w") as source_file:
+                source_file.write("int main(void) { return 0; }\n")
+            output, _ = server.asyncio.run(server.run_compiler(runner.compile_command(directory), directory, limits))
+            self.assertTrue(output.startswith("Compilation error"), output)
+            self.assertFalse(os.path.exists(os.path.join(directory, "main")))
+
+
+class RateLimiterTest(unittest.TestCase):
+    def take(self, limiter, client, at):
+        with mock.patch.object(server.time, "monotonic", return_value=at):
+            return limiter.take(client)
+    
+    def test_burst_then_refill(self):
+        limiter = server.RateLimiter(rate_per_second=1, burst=3, max_clients=10)
+        self.assertEqual([self.take(limiter, "a", 0) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(self.take(limiter, "a", 0), 1.0)
+        # Refused requests cost nothing, and tokens come back at the refill rate
+        self.assertAlmostEqual(self.take(limiter, "a", 0.5), 0.5)
+        self.assertEqual(self.take(limiter, "a", 1.0), 0)
+        self.assertGreater(self.take(limiter, "a", 1.0), 0)
+        # Never more than the burst, however long a client was away
+        self.assertEqual([self.take(limiter, "a", 100) for _ in range(3)], [0, 0, 0])
+        self.assertGreater(self.take(limiter, "a", 100), 0)
+    
+    def test_clients_have_separate_buckets(self):
+        limiter = server.RateLimiter(rate_per_second=1, burst=1, max_clients=10)
+        self.assertEqual(self.take(limiter, "a", 0), 0)
+        self.assertGreater(self.take(limiter, "a", 0), 0)
+        self.assertEqual(self.take(limiter, "b", 0), 0)
+    
+    def test_least_recent_client_is_evicted(self):
+        limiter = server.RateLimiter(rate_per_second=1, burst=1, max_clients=2)
+        for client in ("a", "b", "c"):
+            self.take(limiter, client, 0)
+        self.assertEqual(list(limiter._buckets), ["b", "c"])
+    
+    def test_disabled(self):
+        limiter = server.RateLimiter(rate_per_second=0, burst=1, max_clients=10)
+        self.assertEqual([self.take(limiter, "a", 0) for _ in range(5)], [0] * 5)
+    
+    def test_client_key(self):
+        request = server.Request({
+            "type": "http", "method": "POST", "path": "/api/execute", "client": ("10.0.0.1", 4000),
+            "headers": [(b"x-forwarded-for", b"1.2.3.4, 203.0.113.9")]
+        })
+        self.assertEqual(server.client_key(request), "10.0.0.1")
+        with mock.patch.object(server, "RATE_LIMIT_TRUST_FORWARDED", True):
+            # The first entry is whatever the client sent; the proxy appended the last one
+            self.assertEqual(server.client_key(request), "203.0.113.9")
+
+
+if __name__ == "__main__":
+    unittest.main()